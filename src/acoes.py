@@ -0,0 +1,178 @@
+import getpass
+import hashlib
+import json
+import pandas as pd
+from sqlalchemy import text
+
+# Tabelas de fatos cujas faixas de ids são registradas em cada ação (e apagadas ao desfazer).
+# As faixas vêm dos ids devolvidos pelo RETURNING de cada inserção, então linhas gravadas por outra
+# transação ao mesmo tempo nunca entram nelas.
+TABELAS_RASTREADAS = ["precos", "fretes", "barter_ratios", "custos_portos"]
+
+# Marcadores que compõem a versão global dos dados: tabela -> expressão SQL que muda quando ela muda
+MARCADORES_VERSAO = {
+    **{tabela: "COUNT(*) || ':' || COALESCE(MAX(id), 0)" for tabela in TABELAS_RASTREADAS},
+    # Revisões de outlier e o backfill de câmbio só atualizam linhas; marcados e cotações aplicadas entram na versão
+    "precos": "COUNT(*) || ':' || COALESCE(MAX(id), 0) || ':' || COUNT(*) FILTER (WHERE outlier)"
+              " || ':' || COALESCE(SUM(usd_brl_aplicado), 0)",
+    "fretes": "COUNT(*) || ':' || COALESCE(MAX(id), 0) || ':' || COALESCE(SUM(usd_brl_aplicado), 0)",
+    "custos_portos": "COUNT(*) || ':' || COALESCE(MAX(id), 0) || ':' || COALESCE(SUM(usd_brl_aplicado), 0)",
+    "cambio": "COUNT(*) || ':' || COALESCE(MAX(data), '')",
+    "acoes_log": "COALESCE(MAX(id), 0)",
+    "matriz_fretes": "COALESCE(MAX(atualizado_em)::TEXT, '')",
+    "custos_entregues": "COALESCE(MAX(atualizado_em)::TEXT, '')",
+    "barter_series": "COUNT(*) || ':' || COALESCE(MAX(calculado_em)::TEXT, '')",
+    "previsoes_lote": "COALESCE(MAX(gerado_em)::TEXT, '')",
+    "alertas_precos": "COALESCE(MAX(id), 0)",
+}
+
+
+def garantir_tabela_acoes(connection):
+    """Cria o log de ações (somente inserção), se ainda não existir"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS acoes_log (
+            id SERIAL PRIMARY KEY,
+            criado_em TIMESTAMP DEFAULT NOW(),
+            usuario TEXT,
+            tipo TEXT,
+            descricao TEXT,
+            faixas TEXT,
+            acao_desfeita_id INTEGER
+        )
+    """))
+    # Uma ação só pode ser desfeita uma vez
+    connection.execute(text("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_acoes_log_desfeita
+        ON acoes_log (acao_desfeita_id) WHERE acao_desfeita_id IS NOT NULL
+    """))
+
+
+def usuario_atual():
+    try:
+        return getpass.getuser()
+    except Exception:
+        return "desconhecido"
+
+
+def versao_dados(connection):
+    """Versão global dos dados: muda com inserções, remoções, ações registradas e recálculos de derivados.
+
+    Tabelas derivadas que ainda não existem são ignoradas.
+    """
+    existentes = {
+        tabela for tabela in MARCADORES_VERSAO
+        if connection.execute(text("SELECT to_regclass(:tabela)"), {"tabela": tabela}).scalar()
+    }
+    consulta = " UNION ALL ".join(
+        f"SELECT '{tabela}', ({expressao})::TEXT FROM {tabela}"
+        for tabela, expressao in MARCADORES_VERSAO.items() if tabela in existentes
+    )
+    marcadores = sorted(connection.execute(text(consulta)).fetchall())
+    return hashlib.sha1(json.dumps(marcadores).encode("utf-8")).hexdigest()[:16]
+
+
+def faixas_de_ids(ids_por_tabela):
+    """Faixas [[primeiro_id, ultimo_id], ...] de ids consecutivos de cada tabela, a partir dos ids inseridos"""
+    faixas = {}
+    for tabela, ids in ids_por_tabela.items():
+        blocos = []
+        for id_ in sorted(set(ids)):
+            if blocos and id_ == blocos[-1][1] + 1:
+                blocos[-1][1] = id_
+            else:
+                blocos.append([id_, id_])
+        if blocos:
+            faixas[tabela] = blocos
+    return faixas
+
+
+def listar_faixas(faixas):
+    """Faixas de cada tabela como lista de [primeiro_id, ultimo_id]; entradas antigas do log guardavam uma só"""
+    return {
+        tabela: [faixa] if faixa and not isinstance(faixa[0], list) else faixa
+        for tabela, faixa in (faixas or {}).items()
+    }
+
+
+def filtro_faixas(faixas_tabela, coluna="id"):
+    """Trecho WHERE e parâmetros que selecionam as linhas das faixas de uma tabela"""
+    trechos, params = [], {}
+    for i, (primeiro, ultimo) in enumerate(faixas_tabela):
+        trechos.append(f"{coluna} BETWEEN :primeiro_{i} AND :ultimo_{i}")
+        params.update({f"primeiro_{i}": int(primeiro), f"ultimo_{i}": int(ultimo)})
+    return "(" + (" OR ".join(trechos) or "FALSE") + ")", params
+
+
+def contar_linhas_faixas(faixas):
+    """Total de linhas cobertas pelas faixas de todas as tabelas"""
+    return sum(ultimo - primeiro + 1 for faixa in listar_faixas(faixas).values() for primeiro, ultimo in faixa)
+
+
+def registrar_acao(connection, tipo, descricao, faixas=None, acao_desfeita_id=None, usuario=None):
+    """Acrescenta uma entrada ao log de ações e devolve seu id"""
+    garantir_tabela_acoes(connection)
+    result = connection.execute(text("""
+        INSERT INTO acoes_log (usuario, tipo, descricao, faixas, acao_desfeita_id)
+        VALUES (:usuario, :tipo, :descricao, :faixas, :acao_desfeita_id)
+        RETURNING id
+    """), {
+        "usuario": usuario or usuario_atual(),
+        "tipo": tipo,
+        "descricao": descricao,
+        "faixas": json.dumps(faixas) if faixas else None,
+        "acao_desfeita_id": acao_desfeita_id
+    })
+    return result.fetchone()[0]
+
+
+def ler_ultimas_acoes(engine, n=5):
+    """Lê só as N entradas mais recentes (pela chave primária), com a indicação de já desfeitas"""
+    with engine.begin() as connection:
+        garantir_tabela_acoes(connection)
+        df = pd.read_sql_query(text("""
+            SELECT a.id, a.criado_em, a.usuario, a.tipo, a.descricao, a.faixas,
+                   d.id IS NOT NULL AS desfeita
+            FROM (SELECT * FROM acoes_log ORDER BY id DESC LIMIT :n) a
+            LEFT JOIN acoes_log d ON d.acao_desfeita_id = a.id
+            ORDER BY a.id DESC
+        """), connection, params={"n": n})
+
+    df['faixas'] = df['faixas'].apply(lambda f: listar_faixas(json.loads(f)) if f else {})
+    return df
+
+
+def desfazer_acao(engine, acao_id):
+    """Desfaz uma ação específica do log, apagando as linhas das faixas que ela inseriu.
+
+    Produtos e locais criados pela ação são mantidos, pois podem ter sido reaproveitados depois.
+    """
+    try:
+        with engine.begin() as connection:
+            garantir_tabela_acoes(connection)
+            acao = connection.execute(text("""
+                SELECT descricao, faixas FROM acoes_log WHERE id = :id
+            """), {"id": acao_id}).fetchone()
+            if not acao:
+                return False, f"Ação {acao_id} não encontrada"
+
+            ja_desfeita = connection.execute(text("""
+                SELECT 1 FROM acoes_log WHERE acao_desfeita_id = :id
+            """), {"id": acao_id}).fetchone()
+            if ja_desfeita:
+                return False, "Esta ação já foi desfeita"
+
+            faixas = listar_faixas(json.loads(acao[1]) if acao[1] else {})
+            if not faixas:
+                return False, "Esta ação não tem linhas registradas para desfazer"
+
+            for tabela in TABELAS_RASTREADAS:
+                if tabela in faixas:
+                    filtro, params = filtro_faixas(faixas[tabela])
+                    connection.execute(text(f"DELETE FROM {tabela} WHERE {filtro}"), params)
+
+            registrar_acao(connection, "desfazer", f"↩️ Desfeito: {acao[0]}", faixas, acao_desfeita_id=acao_id)
+
+        return True, "Ação desfeita com sucesso!"
+
+    except Exception as e:
+        return False, f"Erro ao desfazer ação: {e}"
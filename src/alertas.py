@@ -0,0 +1,105 @@
+import pandas as pd
+from sqlalchemy import text
+
+# Limite padrão (em %) usado quando o produto não tem limite próprio em limites_alerta
+LIMITE_PADRAO_PCT = 10.0
+
+
+def garantir_tabelas_alertas(connection):
+    """Cria as tabelas de alertas e de limites por produto, se ainda não existirem.
+
+    Roda só nas migrações (migracoes.py): o índice em precos pega lock, mesmo quando já existe.
+    """
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS limites_alerta (
+            produto_id INTEGER PRIMARY KEY,
+            limite_pct REAL NOT NULL
+        )
+    """))
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS alertas_precos (
+            id SERIAL PRIMARY KEY,
+            preco_id INTEGER UNIQUE REFERENCES precos(id) ON DELETE CASCADE,
+            produto_id INTEGER,
+            local_id INTEGER,
+            data TEXT,
+            preco_anterior REAL,
+            preco_atual REAL,
+            variacao_pct REAL,
+            limite_pct REAL,
+            criado_em TIMESTAMP DEFAULT NOW()
+        )
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_alertas_precos_criado_em ON alertas_precos (criado_em DESC, id DESC)"))
+    # Índice usado para achar o último preço conhecido de cada série
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_precos_serie_data ON precos (produto_id, local_id, data, id)"))
+
+
+def gerar_alertas(connection, precos_ids=None):
+    """Compara cada preço novo com o último preço conhecido da mesma série (produto x local) na mesma
+    moeda e grava um alerta quando a variação passa do limite do produto.
+
+    A comparação é feita na moeda original porque roda logo após a inserção, antes da normalização;
+    um preço em BRL depois de um em USD não é uma variação.
+
+    Se precos_ids for None, reprocessa todos os preços (útil para popular a tabela pela primeira vez).
+    """
+    if precos_ids is not None and len(precos_ids) == 0:
+        return 0
+
+    params = {"limite_padrao": LIMITE_PADRAO_PCT}
+    filtro_ids = ""
+    if precos_ids is not None:
+        filtro_ids = "AND novo.id = ANY(:ids)"
+        params["ids"] = [int(i) for i in precos_ids]
+
+    resultado = connection.execute(text(f"""
+        INSERT INTO alertas_precos (preco_id, produto_id, local_id, data, preco_anterior, preco_atual, variacao_pct, limite_pct)
+        SELECT novo.id, novo.produto_id, novo.local_id, novo.data, ant.preco_min, novo.preco_min,
+               (novo.preco_min - ant.preco_min) / ant.preco_min * 100,
+               COALESCE(la.limite_pct, :limite_padrao)
+        FROM precos novo
+        JOIN LATERAL (
+            SELECT anterior.preco_min
+            FROM precos anterior
+            WHERE anterior.produto_id = novo.produto_id
+              AND anterior.local_id = novo.local_id
+              AND (anterior.data, anterior.id) < (novo.data, novo.id)
+              AND UPPER(TRIM(COALESCE(anterior.moeda, ''))) = UPPER(TRIM(COALESCE(novo.moeda, '')))
+              AND anterior.preco_min IS NOT NULL
+            ORDER BY anterior.data DESC, anterior.id DESC
+            LIMIT 1
+        ) ant ON ant.preco_min <> 0
+        LEFT JOIN limites_alerta la ON la.produto_id = novo.produto_id
+        WHERE novo.preco_min IS NOT NULL
+          {filtro_ids}
+          AND ABS((novo.preco_min - ant.preco_min) / ant.preco_min * 100) > COALESCE(la.limite_pct, :limite_padrao)
+        ON CONFLICT (preco_id) DO NOTHING
+    """), params)
+    return resultado.rowcount
+
+
+def definir_limite_alerta(connection, produto_id, limite_pct):
+    """Define (ou atualiza) o limite de variação em % que dispara alerta para um produto"""
+    connection.execute(text("""
+        INSERT INTO limites_alerta (produto_id, limite_pct)
+        VALUES (:produto_id, :limite_pct)
+        ON CONFLICT (produto_id) DO UPDATE SET limite_pct = EXCLUDED.limite_pct
+    """), {"produto_id": produto_id, "limite_pct": limite_pct})
+
+
+def ler_alertas_recentes(engine, limite=50):
+    """Lê apenas os alertas mais novos, já com nomes de produto e local"""
+    with engine.connect() as connection:
+        df = pd.read_sql_query(text("""
+            SELECT p.nome_produto AS produto, l.nome AS localizacao, a.data AS data_preco,
+                   a.preco_anterior, a.preco_atual, a.variacao_pct AS pct_change, a.limite_pct, a.criado_em
+            FROM alertas_precos a
+            JOIN produtos p ON p.id = a.produto_id
+            JOIN locais l ON l.id = a.local_id
+            ORDER BY a.criado_em DESC, a.id DESC
+            LIMIT :limite
+        """), connection, params={"limite": limite})
+
+    df['data_preco'] = pd.to_datetime(df['data_preco'], errors='coerce')
+    return df
@@ -4,6 +4,12 @@ import json
 import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
+from alertas import gerar_alertas
+from acoes import faixas_de_ids
+from moedas import normalizar_moedas
+from entidades import ResolvedorEntidades
+from metricas import tokens_resposta
+from migracoes import garantir_esquema
 
     
 # ======================= CONFIGURAÇÃO =======================
@@ -35,7 +41,7 @@ def dividir_texto(texto, n_partes):
     return partes
 
 # ======================= ETAPA 2.1: EXTRAIR DADOS COM IA =======================
-def gerar_json_estruturado(texto):
+def gerar_json_estruturado(texto, span=None):
     prompt = f"""
 Você é um extrator de dados que transforma um relatório semanal de fertilizantes no Brasil em um JSON compatível com um banco relacional. Extraia **todas** as informações quantitativas possíveis.
 
@@ -124,6 +130,9 @@ Agora leia o relatório abaixo e retorne **apenas o JSON bruto** com essa estrut
 """
     resposta = model.generate_content(prompt)
     conteudo = resposta.text.strip()
+    # Span de métricas da importação (metricas.py), quando houver: tamanho da resposta e tokens usados
+    if span is not None:
+        span.update(tokens_resposta(resposta), bytes_saida=len(conteudo.encode("utf-8")))
 
     # Remover blocos de código markdown se existirem
     if conteudo.startswith("```"):
@@ -148,22 +157,31 @@ Agora leia o relatório abaixo e retorne **apenas o JSON bruto** com essa estrut
             raise e
 
     # ========== MELHORIAS AUTOMÁTICAS ==========
+    # Itens malformados passam adiante sem ajuste: a validação (validacao.py) rejeita e contabiliza
+    for secao in ["produtos", "locais", "precos"]:
+        if not isinstance(dados.get(secao), list):
+            dados[secao] = []
+
     # 1. Preencher origens nulas com "Brasil"
     for p in dados["produtos"]:
-        if p.get("origem") is None:
+        if isinstance(p, dict) and p.get("origem") is None:
             p["origem"] = "Brasil"
 
     # 2. Consolidar produtos únicos
     produtos_unicos = {}
     for p in dados["produtos"]:
-        chave = (p["nome_produto"], p["formulacao"], p["origem"], p["tipo"], p["unidade"])
+        if not isinstance(p, dict):
+            continue
+        chave = (p.get("nome_produto"), p.get("formulacao"), p.get("origem"), p.get("tipo"), p.get("unidade"))
         produtos_unicos[chave] = p
     dados["produtos"] = list(produtos_unicos.values())
 
     # 3. Consolidar locais únicos
     locais_unicos = {}
     for l in dados["locais"]:
-        chave = (l["nome"], l["estado"])
+        if not isinstance(l, dict):
+            continue
+        chave = (l.get("nome"), l.get("estado"))
         locais_unicos[chave] = l
     dados["locais"] = list(locais_unicos.values())
 
@@ -175,7 +193,7 @@ Agora leia o relatório abaixo e retorne **apenas o JSON bruto** com essa estrut
         "pais": "FOB"
     }
     for p in dados["precos"]:
-        if p.get("tipo_preco") is None:
+        if isinstance(p, dict) and p.get("tipo_preco") is None:
             local = p.get("local")
             if isinstance(local, dict):
                 tipo_local = local.get("tipo")
@@ -190,7 +208,7 @@ Agora leia o relatório abaixo e retorne **apenas o JSON bruto** com essa estrut
         "=": 0.0
     }
     for p in dados["precos"]:
-        if p.get("variacao") is None and p.get("simbolo_var") in simbolo_para_variacao:
+        if isinstance(p, dict) and p.get("variacao") is None and p.get("simbolo_var") in simbolo_para_variacao:
             p["variacao"] = simbolo_para_variacao[p["simbolo_var"]]
 
     # ========== FIM DAS MELHORIAS ==========
@@ -230,150 +248,142 @@ def combinar_json(*partes):
 
 # ======================= ETAPA 3: INSERIR NO BANCO =======================
 
-def inserir_dados_no_banco(dados):
-    with engine.begin() as connection:  # <-- só isso muda!
+def inserir_dados_no_banco(dados, connection=None):
+    """Insere os dados extraídos e devolve as faixas de ids inseridas em cada tabela (para o log de ações).
 
-        def get_or_create_local(nome, estado, pais, tipo):
-            result = connection.execute(text("SELECT id FROM locais WHERE nome = :nome"), {"nome": nome}).fetchone()
-            if result:
-                return result[0]
-            else:
-                result = connection.execute(text("""
-                    INSERT INTO locais (nome, estado, pais, tipo)
-                    VALUES (:nome, :estado, :pais, :tipo)
-                    RETURNING id
-                """), {
-                    "nome": nome,
-                    "estado": estado,
-                    "pais": pais,
-                    "tipo": tipo
-                }).fetchone()
-                return result[0]
-
-        def get_or_create_produto(p):
-            if not isinstance(p, dict):
-                print("⚠️ Erro: produto inválido ->", p)
-                return None
-
-            result = connection.execute(text("""
-                SELECT id FROM produtos
-                WHERE nome_produto = :nome_produto AND formulacao = :formulacao AND origem = :origem
-            """), {
-                "nome_produto": p.get("nome_produto"),
-                "formulacao": p.get("formulacao"),
-                "origem": p.get("origem")
-            }).fetchone()
-
-            if result:
-                return result[0]
-            else:
-                result = connection.execute(text("""
-                    INSERT INTO produtos (nome_produto, formulacao, origem)
-                    VALUES (:nome_produto, :formulacao, :origem)
-                    RETURNING id
-                """), {
-                    "nome_produto": p.get("nome_produto"),
-                    "formulacao": p.get("formulacao"),
-                    "origem": p.get("origem")
-                }).fetchone()
-                return result[0]
-
-        # Inserção de produtos
-        for p in dados["produtos"]:
-            get_or_create_produto(p)
-
-        # Inserção de locais
-        for l in dados["locais"]:
-            get_or_create_local(l.get("nome"), l.get("estado"), l.get("pais"), l.get("tipo"))
-
-        # Inserção de preços
-        for preco in dados.get("precos", []):
-            produto_id = get_or_create_produto(preco["produto"])
-            local_info = preco.get("local") or {}
-            local_id = get_or_create_local(local_info.get("nome"), local_info.get("estado"), local_info.get("pais"), local_info.get("tipo"))
-
-            connection.execute(text("""
-                INSERT INTO precos (produto_id, local_id, data, tipo_preco, modalidade, fonte, moeda, preco_min, preco_max, variacao, simbolo_var)
-                VALUES (:produto_id, :local_id, :data, :tipo_preco, :modalidade, :fonte, :moeda, :preco_min, :preco_max, :variacao, :simbolo_var)
-            """), {
-                "produto_id": produto_id,
-                "local_id": local_id,
-                "data": preco.get("data"),
-                "tipo_preco": preco.get("tipo_preco"),
-                "modalidade": preco.get("modalidade"),
-                "fonte": preco.get("fonte"),
-                "moeda": preco.get("moeda"),
-                "preco_min": preco.get("preco_min"),
-                "preco_max": preco.get("preco_max"),
-                "variacao": preco.get("variacao"),
-                "simbolo_var": preco.get("simbolo_var")
-            })
-
-        # Inserção de fretes
-        for f in dados.get("fretes", []):
-            origem = f.get("origem") or {}
-            destino = f.get("destino") or {}
-            origem_id = get_or_create_local(origem.get("nome"), origem.get("estado"), origem.get("pais"), origem.get("tipo"))
-            destino_id = get_or_create_local(destino.get("nome"), destino.get("estado"), destino.get("pais"), destino.get("tipo"))
-
-            connection.execute(text("""
-                INSERT INTO fretes (tipo, origem_id, destino_id, data, custo_usd, custo_brl)
-                VALUES (:tipo, :origem_id, :destino_id, :data, :custo_usd, :custo_brl)
-            """), {
-                "tipo": f.get("tipo"),
-                "origem_id": origem_id,
-                "destino_id": destino_id,
-                "data": f.get("data"),
-                "custo_usd": f.get("custo_usd"),
-                "custo_brl": f.get("custo_brl")
-            })
-
-        # Inserção de barter_ratios
-        for b in dados.get("barter_ratios", []):
-            produto_id = get_or_create_produto(b["produto"])
-            connection.execute(text("""
-                INSERT INTO barter_ratios (cultura, produto_id, estado, data, preco_cultura, barter_ratio, barter_index)
-                VALUES (:cultura, :produto_id, :estado, :data, :preco_cultura, :barter_ratio, :barter_index)
-            """), {
-                "cultura": b.get("cultura"),
-                "produto_id": produto_id,
-                "estado": b.get("estado"),
-                "data": b.get("data"),
-                "preco_cultura": b.get("preco_cultura"),
-                "barter_ratio": b.get("barter_ratio"),
-                "barter_index": b.get("barter_index")
-            })
-
-        # Inserção de cambio
-        for c in dados.get("cambio", []):
-            connection.execute(text("""
-                INSERT INTO cambio (data, usd_brl)
-                VALUES (:data, :usd_brl)
-                ON CONFLICT (data) DO NOTHING
-            """), {
-                "data": c.get("data"),
-                "usd_brl": c.get("usd_brl")
-            })
-
-        # Inserção de custos_portos
-        for custo in dados.get("custos_portos", []):
-            porto_id = get_or_create_local(custo.get("porto"), "", "Brasil", "porto")
-            connection.execute(text("""
-                INSERT INTO custos_portos (porto_id, data, armazenagem, demurrage, custo_total)
-                VALUES (:porto_id, :data, :armazenagem, :demurrage, :custo_total)
-            """), {
-                "porto_id": porto_id,
-                "data": custo.get("data"),
-                "armazenagem": custo.get("armazenagem"),
-                "demurrage": custo.get("demurrage"),
-                "custo_total": custo.get("custo_total")
-            })
+    Com `connection`, insere na transação de quem chamou (para registrar a ação junto); sem ela, abre uma.
+    """
+    if connection is None:
+        with engine.begin() as connection:
+            return inserir_dados_no_banco(dados, connection)
 
+    # Ids devolvidos pelo RETURNING de cada inserção, por tabela
+    inseridos = {"precos": [], "fretes": [], "barter_ratios": [], "custos_portos": []}
+
+    # Nomes resolvidos pela chave normalizada, aliases e similaridade, sem SELECT por linha
+    resolvedor = ResolvedorEntidades(connection)
+    get_or_create_local = resolvedor.local
+    get_or_create_produto = resolvedor.produto
+
+    # Inserção de produtos
+    for p in dados["produtos"]:
+        get_or_create_produto(p)
+
+    # Inserção de locais
+    for l in dados["locais"]:
+        get_or_create_local(l.get("nome"), l.get("estado"), l.get("pais"), l.get("tipo"))
+
+    # Inserção de preços
+    for preco in dados.get("precos", []):
+        produto_id = get_or_create_produto(preco["produto"])
+        local_info = preco.get("local") or {}
+        local_id = get_or_create_local(local_info.get("nome"), local_info.get("estado"), local_info.get("pais"), local_info.get("tipo"))
+
+        result = connection.execute(text("""
+            INSERT INTO precos (produto_id, local_id, data, tipo_preco, modalidade, fonte, moeda, preco_min, preco_max, variacao, simbolo_var)
+            VALUES (:produto_id, :local_id, :data, :tipo_preco, :modalidade, :fonte, :moeda, :preco_min, :preco_max, :variacao, :simbolo_var)
+            RETURNING id
+        """), {
+            "produto_id": produto_id,
+            "local_id": local_id,
+            "data": preco.get("data"),
+            "tipo_preco": preco.get("tipo_preco"),
+            "modalidade": preco.get("modalidade"),
+            "fonte": preco.get("fonte"),
+            "moeda": preco.get("moeda"),
+            "preco_min": preco.get("preco_min"),
+            "preco_max": preco.get("preco_max"),
+            "variacao": preco.get("variacao"),
+            "simbolo_var": preco.get("simbolo_var")
+        })
+        inseridos["precos"].append(result.fetchone()[0])
+
+    # Alertas de variação calculados só para os preços novos
+    gerar_alertas(connection, inseridos["precos"])
+
+    # Inserção de fretes
+    for f in dados.get("fretes", []):
+        origem = f.get("origem") or {}
+        destino = f.get("destino") or {}
+        origem_id = get_or_create_local(origem.get("nome"), origem.get("estado"), origem.get("pais"), origem.get("tipo"))
+        destino_id = get_or_create_local(destino.get("nome"), destino.get("estado"), destino.get("pais"), destino.get("tipo"))
+
+        result = connection.execute(text("""
+            INSERT INTO fretes (tipo, origem_id, destino_id, data, custo_usd, custo_brl)
+            VALUES (:tipo, :origem_id, :destino_id, :data, :custo_usd, :custo_brl)
+            RETURNING id
+        """), {
+            "tipo": f.get("tipo"),
+            "origem_id": origem_id,
+            "destino_id": destino_id,
+            "data": f.get("data"),
+            "custo_usd": f.get("custo_usd"),
+            "custo_brl": f.get("custo_brl")
+        })
+        inseridos["fretes"].append(result.fetchone()[0])
+
+    # Inserção de barter_ratios
+    for b in dados.get("barter_ratios", []):
+        produto_id = get_or_create_produto(b["produto"])
+        result = connection.execute(text("""
+            INSERT INTO barter_ratios (cultura, produto_id, estado, data, preco_cultura, barter_ratio, barter_index)
+            VALUES (:cultura, :produto_id, :estado, :data, :preco_cultura, :barter_ratio, :barter_index)
+            RETURNING id
+        """), {
+            "cultura": b.get("cultura"),
+            "produto_id": produto_id,
+            "estado": b.get("estado"),
+            "data": b.get("data"),
+            "preco_cultura": b.get("preco_cultura"),
+            "barter_ratio": b.get("barter_ratio"),
+            "barter_index": b.get("barter_index")
+        })
+        inseridos["barter_ratios"].append(result.fetchone()[0])
+
+    # Inserção de cambio
+    for c in dados.get("cambio", []):
+        connection.execute(text("""
+            INSERT INTO cambio (data, usd_brl)
+            VALUES (:data, :usd_brl)
+            ON CONFLICT (data) DO NOTHING
+        """), {
+            "data": c.get("data"),
+            "usd_brl": c.get("usd_brl")
+        })
+
+    # Inserção de custos_portos
+    for custo in dados.get("custos_portos", []):
+        porto_id = get_or_create_local(custo.get("porto"), "", "Brasil", "porto")
+        result = connection.execute(text("""
+            INSERT INTO custos_portos (porto_id, data, armazenagem, demurrage, custo_total)
+            VALUES (:porto_id, :data, :armazenagem, :demurrage, :custo_total)
+            RETURNING id
+        """), {
+            "porto_id": porto_id,
+            "data": custo.get("data"),
+            "armazenagem": custo.get("armazenagem"),
+            "demurrage": custo.get("demurrage"),
+            "custo_total": custo.get("custo_total")
+        })
+        inseridos["custos_portos"].append(result.fetchone()[0])
+
+    faixas = faixas_de_ids(inseridos)
+
+    # Valores em USD e BRL calculados uma vez, na escrita, com as cotações já inseridas acima
+    normalizar_moedas(connection, faixas)
+
+    r = resolvedor.resolucoes
+    print(f"🔎 Nomes resolvidos: {r['exata']} pela chave, {r['alias']} por alias, "
+          f"{r['similaridade']} por similaridade, {r['criada']} criado(s)")
+    if r['revisar']:
+        print(f"⚠️ {r['revisar']} nome(s) novo(s) parecido(s) com existentes: revise com `python cli.py entidades`")
     print("✅ Dados inseridos com sucesso no banco Supabase!")
+    return faixas
 
 
 # ======================= EXECUÇÃO =======================
 if __name__ == "__main__":
+    garantir_esquema(engine)
     print("📄 Lendo o relatório PDF...")
     texto = ler_pdf(CAMINHO_PDF)
 
@@ -4,16 +4,25 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 from processar_relatorio import processar_relatorio
+from derivados import atualizar_derivados
+from backup import criar_backup, restaurar_backup_mais_recente
 import threading  
 import time        
 from database_utils import salvar_preco_manual, salvar_frete_manual
+from alertas import ler_alertas_recentes, definir_limite_alerta, LIMITE_PADRAO_PCT
+from sazonalidade import ler_sazonalidade, TODOS_LOCAIS, MESES_MINIMOS
+from fretes import ler_matriz_fretes
+from acoes import registrar_acao, ler_ultimas_acoes, desfazer_acao
+from barter import ler_barter, LIMIAR_GAP, JANELA_PERCENTIS
+from validacao import ler_qualidade_recente
+from metricas import ler_latencias, IMPORTACOES_RECENTES
+from moedas import MOEDAS_SUPORTADAS
+from migracoes import garantir_esquema
+from outliers import atualizar_outliers, ler_outliers, revisar_outliers, LIMIAR_HAMPEL
 import os
 from uuid import uuid4  # coloque no início do arquivo, se ainda não estiver
 import threading
 import json
-import shutil
-import statsmodels.api as sm
-import glob
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 
@@ -21,6 +30,8 @@ from dotenv import load_dotenv
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 engine = create_engine(DATABASE_URL)
+# Colunas e índices das tabelas principais: uma vez por processo, fora das leituras
+garantir_esquema(engine)
 
 st.set_page_config(
     page_title="Dashboard Morro Verde",
@@ -68,14 +79,15 @@ logo_path = "img/logo-morro-verde.png"
 
 def carregar_dados():
     df_precos = pd.read_sql_query('''
-        SELECT p.nome_produto AS produto, l.nome AS localizacao, pr.data AS data_preco, pr.preco_min AS preco, pr.moeda
+        SELECT p.nome_produto AS produto, l.nome AS localizacao, pr.data AS data_preco, pr.preco_min AS preco, pr.moeda,
+               pr.preco_min_brl AS preco_brl, pr.preco_min_usd AS preco_usd, COALESCE(pr.outlier, FALSE) AS outlier
         FROM precos pr
         JOIN produtos p ON p.id = pr.produto_id
         JOIN locais l ON l.id = pr.local_id
     ''', engine)
 
     df_fretes = pd.read_sql_query('''
-        SELECT l1.nome AS origem, l2.nome AS destino, f.tipo AS tipo_transporte, f.custo_usd AS preco, 'USD' AS moeda, f.data
+        SELECT l1.nome AS origem, l2.nome AS destino, f.tipo AS tipo_transporte, f.custo_final_usd AS preco, 'USD' AS moeda, f.data
         FROM fretes f
         JOIN locais l1 ON f.origem_id = l1.id
         JOIN locais l2 ON f.destino_id = l2.id
@@ -89,125 +101,6 @@ def carregar_dados():
     return df_precos, df_fretes, df_barter
 
 
-def criar_backup(max_backups=5):
-    os.makedirs("backups_csv", exist_ok=True)
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_folder = f"backups_csv/backup_{timestamp}"
-    os.makedirs(backup_folder, exist_ok=True)
-
-    try:
-        with engine.connect() as connection:
-            # Exportar produtos
-            df_produtos = pd.read_sql("SELECT * FROM produtos", connection)
-            df_produtos.to_csv(f"{backup_folder}/produtos.csv", index=False)
-
-            # Exportar locais
-            df_locais = pd.read_sql("SELECT * FROM locais", connection)
-            df_locais.to_csv(f"{backup_folder}/locais.csv", index=False)
-
-            # Exportar precos
-            df_precos = pd.read_sql("SELECT * FROM precos", connection)
-            df_precos.to_csv(f"{backup_folder}/precos.csv", index=False)
-
-            # Exportar fretes
-            df_fretes = pd.read_sql("SELECT * FROM fretes", connection)
-            df_fretes.to_csv(f"{backup_folder}/fretes.csv", index=False)
-
-            # Exportar barter_ratios
-            df_barter = pd.read_sql("SELECT * FROM barter_ratios", connection)
-            df_barter.to_csv(f"{backup_folder}/barter_ratios.csv", index=False)
-
-            # Exportar cambio
-            df_cambio = pd.read_sql("SELECT * FROM cambio", connection)
-            df_cambio.to_csv(f"{backup_folder}/cambio.csv", index=False)
-
-            # Exportar custos_portos
-            df_custo_portos = pd.read_sql("SELECT * FROM custos_portos", connection)
-            df_custo_portos.to_csv(f"{backup_folder}/custos_portos.csv", index=False)
-
-        # Limpeza: mantém só os N mais recentes
-        backups = sorted(
-            glob.glob("backups_csv/backup_*"),
-            key=lambda x: os.path.getmtime(x)
-        )
-
-        while len(backups) > max_backups:
-            shutil.rmtree(backups[0])
-            backups.pop(0)
-
-        print(f"✅ Backup COMPLETO criado em {backup_folder}")
-
-    except Exception as e:
-        print(f"❌ Erro ao criar backup: {e}")
-        
-def restaurar_backup_mais_recente():
-    backups = sorted(
-        glob.glob("backups_csv/backup_*"),
-        key=lambda x: os.path.getmtime(x)
-    )
-
-    if not backups:
-        return False
-
-    mais_recente = backups[-1]
-
-    try:
-        with engine.begin() as connection:
-            # Limpar tabelas (modo seguro - respeita FK)
-            connection.execute(text("DELETE FROM precos"))
-            connection.execute(text("DELETE FROM fretes"))
-            connection.execute(text("DELETE FROM barter_ratios"))
-            connection.execute(text("DELETE FROM cambio"))
-            connection.execute(text("DELETE FROM custos_portos"))
-            connection.execute(text("DELETE FROM produtos"))
-            connection.execute(text("DELETE FROM locais"))
-
-            # Restaurar produtos
-            df_produtos = pd.read_csv(f"{mais_recente}/produtos.csv")
-            df_produtos.to_sql("produtos", connection, if_exists="append", index=False)
-
-            # Restaurar locais
-            df_locais = pd.read_csv(f"{mais_recente}/locais.csv")
-            df_locais.to_sql("locais", connection, if_exists="append", index=False)
-
-            # Restaurar precos
-            df_precos = pd.read_csv(f"{mais_recente}/precos.csv")
-            df_precos.to_sql("precos", connection, if_exists="append", index=False)
-
-            # Restaurar fretes
-            df_fretes = pd.read_csv(f"{mais_recente}/fretes.csv")
-            df_fretes.to_sql("fretes", connection, if_exists="append", index=False)
-
-            # Restaurar barter_ratios
-            df_barter = pd.read_csv(f"{mais_recente}/barter_ratios.csv")
-            df_barter.to_sql("barter_ratios", connection, if_exists="append", index=False)
-
-            # Restaurar cambio
-            df_cambio = pd.read_csv(f"{mais_recente}/cambio.csv")
-            df_cambio.to_sql("cambio", connection, if_exists="append", index=False)
-
-            # Restaurar custos_portos
-            df_custo_portos = pd.read_csv(f"{mais_recente}/custos_portos.csv")
-            df_custo_portos.to_sql("custos_portos", connection, if_exists="append", index=False)
-
-        print(f"✅ Backup COMPLETO restaurado de {mais_recente}")
-        return True
-
-    except Exception as e:
-        print(f"❌ Erro ao restaurar backup: {e}")
-        return False
-
-def registrar_acao(descricao):
-    log = []
-    if os.path.exists("acoes_realizadas.json"):
-        with open("acoes_realizadas.json", "r") as f:
-            log = json.load(f)
-    log.append(descricao)
-    with open("acoes_realizadas.json", "w") as f:
-        json.dump(log, f)
-
-
 # Inicializar session state
 if 'filtros_aplicados' not in st.session_state:
     st.session_state.filtros_aplicados = False
@@ -223,8 +116,10 @@ if 'processamento_concluido' not in st.session_state:
     st.session_state.processamento_concluido = False
 if 'erro_processamento' not in st.session_state:
     st.session_state.erro_processamento = None
+if 'tempos_secoes' not in st.session_state:
+    st.session_state.tempos_secoes = {}
 
-def threaded_processar_relatorio(caminho_pdf, num_partes):
+def threaded_processar_relatorio(caminho_pdf, num_partes, nome_arquivo=None):
     def executar_processamento():
         try:
             # Callback que atualiza o progresso
@@ -235,7 +130,8 @@ def threaded_processar_relatorio(caminho_pdf, num_partes):
             processar_relatorio(
                 caminho_pdf,
                 callback_progresso=progresso_callback,
-                num_partes=num_partes
+                num_partes=num_partes,
+                nome_arquivo=nome_arquivo
             )
 
             st.session_state.processamento_concluido = True
@@ -264,7 +160,7 @@ def mostrar_formulario_input():
             produto = st.text_input("Nome do Produto *", placeholder="Ex: Soja, Milho, Trigo")
             localizacao = st.text_input("Localização *", placeholder="Ex: Porto de Santos, Chicago")
             preco = st.number_input("Preço *", min_value=0.0, step=0.01, format="%.2f")
-            moeda = st.selectbox("Moeda *", ["USD", "BRL", "EUR"])
+            moeda = st.selectbox("Moeda *", MOEDAS_SUPORTADAS)
             data_preco = st.date_input("Data do Preço", value=datetime.today())
         
         with col2:
@@ -288,7 +184,7 @@ def mostrar_formulario_input():
                 st.error("❌ Preencha todos os campos obrigatórios de preço: Produto, Localização e Preço > 0")
                 return
             
-            criar_backup()
+            criar_backup(engine)
 
             # Salvar preço
             sucesso_preco, msg_preco = salvar_preco_manual(produto, localizacao, preco, moeda, data_preco)
@@ -303,7 +199,6 @@ def mostrar_formulario_input():
 
                 if sucesso_preco and sucesso_frete:
                     st.success("✅ Preço e Frete salvos com sucesso!")
-                    registrar_acao("✍️ Novo dado inputado manualmente: preço e frete.")
                 else:
                     if not sucesso_preco:
                         st.error(f"❌ Erro ao salvar preço: {msg_preco}")
@@ -312,10 +207,11 @@ def mostrar_formulario_input():
             else:
                 if sucesso_preco:
                     st.success("✅ Preço salvo com sucesso!")
-                    registrar_acao("✍️ Novo dado inputado manualmente: apenas preço.")
                 else:
                     st.error(f"❌ Erro ao salvar preço: {msg_preco}")
 
+            # Atualiza as tabelas derivadas sem travar a tela
+            threading.Thread(target=atualizar_derivados, args=(engine,), daemon=True).start()
 
             time.sleep(2)
             st.rerun()
@@ -373,15 +269,14 @@ with col2:
         with open(caminho_pdf, "wb") as f:
             f.write(uploaded_file.getbuffer())
 
-        criar_backup()  # Backup antes de processar
-        registrar_acao(f"📄 {uploaded_file.name} importado!")
+        criar_backup(engine)  # Backup antes de processar
 
         # Limpa progresso anterior
         if os.path.exists("progresso.json"):
             os.remove("progresso.json")
 
         # Chama a função de processar com thread já armazenada
-        threaded_processar_relatorio(caminho_pdf, num_partes)
+        threaded_processar_relatorio(caminho_pdf, num_partes, uploaded_file.name)
 
         # Atualiza session_state
         st.session_state.relatorio_em_processamento = True
@@ -419,6 +314,16 @@ if st.session_state.get("relatorio_em_processamento", False):
 
 elif st.session_state.get("processamento_concluido", False):
     st.success("✅ Relatório processado com sucesso!")
+    qualidade = ler_qualidade_recente(engine, n_relatorios=1)
+    if not qualidade.empty:
+        with st.expander(f"🧪 Qualidade dos dados extraídos: {int(qualidade['rejeitadas'].sum())} linha(s) rejeitada(s)"):
+            st.dataframe(
+                qualidade[['secao', 'total', 'aceitas', 'rejeitadas', 'convertidas']],
+                use_container_width=True, hide_index=True
+            )
+            motivos = {motivo: n for m in qualidade['motivos'] for motivo, n in m.items()}
+            for motivo, n in sorted(motivos.items(), key=lambda item: -item[1]):
+                st.write(f"⚠️ {n}x {motivo}")
 
 elif st.session_state.get("erro_processamento"):
     st.error(f"❌ Erro no processamento: {st.session_state.erro_processamento}")
@@ -450,6 +355,7 @@ if df_precos.empty and df_fretes.empty:
 if not df_precos.empty:
     df_precos['data_preco'] = pd.to_datetime(df_precos['data_preco'])
     df_precos['preco'] = pd.to_numeric(df_precos['preco'], errors='coerce')
+    df_precos['preco_brl'] = pd.to_numeric(df_precos['preco_brl'], errors='coerce')
 
 if not df_barter.empty:
     df_barter['data'] = pd.to_datetime(df_barter['data'], errors='coerce')
@@ -490,6 +396,8 @@ if not df_precos.empty:
                     default=list(df_precos['moeda'].unique())
                 )
             
+            st.checkbox("🧹 Ocultar preços marcados como outlier", value=True, key="ocultar_outliers")
+
             col_d1, col_d2 = st.columns(2)
             with col_d1:
                 data_inicio = st.date_input("Data Início:", value=data_min, min_value=data_min, max_value=data_max)
@@ -512,7 +420,8 @@ if not df_precos.empty:
         (df_precos['localizacao'].isin(filtro_local)) &
         (df_precos['moeda'].isin(filtro_moeda)) &
         (df_precos['data_preco'] >= pd.to_datetime(filtro_data[0])) &
-        (df_precos['data_preco'] <= pd.to_datetime(filtro_data[1]))
+        (df_precos['data_preco'] <= pd.to_datetime(filtro_data[1])) &
+        ~(df_precos['outlier'] & st.session_state.get("ocultar_outliers", True))
     ]
 else:
     df_precos_filt = df_precos
@@ -531,238 +440,281 @@ with kpi3:
     st.metric("Registros de preço", len(df_precos_filt))
 
 with kpi4:
-    if not df_precos_filt.empty and df_precos_filt['preco'].notna().any():
-        preco_medio = df_precos_filt['preco'].mean()
-        st.metric("Preço médio", f"${preco_medio:.2f}")
+    # Média sobre o valor normalizado em BRL na escrita, não sobre preços em moedas diferentes
+    if not df_precos_filt.empty and df_precos_filt['preco_brl'].notna().any():
+        preco_medio = df_precos_filt['preco_brl'].mean()
+        sem_cotacao = df_precos_filt['preco_brl'].isna().sum()
+        st.metric("Preço médio (BRL)", f"R$ {preco_medio:,.2f}",
+                  help=f"{sem_cotacao} preço(s) ainda sem cotação ficaram fora da média" if sem_cotacao else None)
     else:
-        st.metric("Preço médio", "N/A")
+        st.metric("Preço médio (BRL)", "N/A")
 
 with kpi5:
     st.metric("Registros de permuta", len(df_barter))
 
-# GRÁFICOS EXISTENTES + NOVOS + MELHORADOS
-
-# 1. Gráfico histórico de preços
-st.subheader("📈 Histórico de Preços")
-if not df_precos_filt.empty:
-    fig_preco = px.line(
-        df_precos_filt.sort_values('data_preco'),
-        x='data_preco',
-        y='preco',
-        color='produto',
-        line_dash='localizacao',
-        markers=True,
-        title="Evolução dos preços por produto e localização"
-    )
-    fig_preco.update_layout(
-        margin=dict(t=50, b=20),
-        hovermode='x unified'
-    )
-    st.plotly_chart(fig_preco, use_container_width=True)
-else:
-    st.info("Nenhum dado de preços disponível para o gráfico de histórico.")
-
-# 2. Comparação de preços por produto (Boxplot)
-if not df_precos_filt.empty and df_precos_filt['preco'].notna().any():
-    st.subheader("📊 Distribuição de Preços por Produto")
-    fig_box = px.box(
-        df_precos_filt,
-        x='produto',
-        y='preco',
-        color='produto',
-        title="Distribuição e outliers de preços por produto"
-    )
-    fig_box.update_layout(margin=dict(t=50, b=20))
-    st.plotly_chart(fig_box, use_container_width=True)
-
-# 3. Variação percentual mensal
-if not df_precos_filt.empty and len(df_precos_filt) > 1:
-    st.subheader("📊 Variação Percentual Mensal dos Preços")
-    df_precos_filt['ano_mes'] = df_precos_filt['data_preco'].dt.to_period('M')
-    df_pct = df_precos_filt.groupby(['produto', 'ano_mes']).preco.mean().reset_index()
-    df_pct['ano_mes'] = df_pct['ano_mes'].dt.to_timestamp()
-    df_pct['pct_var'] = df_pct.groupby('produto')['preco'].pct_change() * 100
-    
-    fig_pct = px.line(
-        df_pct,
-        x='ano_mes',
-        y='pct_var',
-        color='produto',
-        title="Variação percentual média mensal por produto",
-        markers=True
-    )
-    fig_pct.update_layout(margin=dict(t=50, b=20))
-    st.plotly_chart(fig_pct, use_container_width=True)
+# GRÁFICOS: cada seção é uma função, e só a seção escolhida é calculada e desenhada
 
-# 4. Heatmap de preços por localização e produto
-if not df_precos_filt.empty and len(df_precos_filt) > 3:
-    st.subheader("🔥 Mapa de Calor - Preços por Localização")
-    heatmap_data = df_precos_filt.groupby(['produto', 'localizacao'])['preco'].mean().reset_index()
-    
-    if len(heatmap_data) > 1:
-        heatmap_pivot = heatmap_data.pivot(index='produto', columns='localizacao', values='preco')
-        
-        fig_heatmap = px.imshow(
-            heatmap_pivot.values,
-            x=heatmap_pivot.columns,
-            y=heatmap_pivot.index,
-            aspect="auto",
-            title="Preços médios por produto e localização",
-            color_continuous_scale="Viridis"
+# Os preços chegam em várias moedas; os gráficos usam sempre a coluna normalizada em BRL
+ROTULOS_BRL = {'preco_brl': 'Preço (R$)'}
+
+
+def secao_precos(df_precos_filt):
+    """Histórico, distribuição, variação mensal e dispersão dos preços, em BRL (ver moedas.py)"""
+    # 1. Gráfico histórico de preços
+    st.subheader("📈 Histórico de Preços")
+    if not df_precos_filt.empty:
+        fig_preco = px.line(
+            df_precos_filt.sort_values('data_preco'),
+            x='data_preco',
+            y='preco_brl',
+            color='produto',
+            line_dash='localizacao',
+            markers=True,
+            labels=ROTULOS_BRL,
+            title="Evolução dos preços por produto e localização (R$)"
         )
-        st.plotly_chart(fig_heatmap, use_container_width=True)
-
-# 5. Dispersão preço x data
-if not df_precos_filt.empty:
-    st.subheader("🔍 Dispersão Preço x Data")
-    fig_disp = px.scatter(
-        df_precos_filt,
-        x='data_preco',
-        y='preco',
-        color='produto',
-        size='preco',
-        hover_data=['localizacao', 'moeda'],
-        title="Dispersão dos preços ao longo do tempo"
-    )
-    fig_disp.update_layout(margin=dict(t=50, b=20))
-    st.plotly_chart(fig_disp, use_container_width=True)
-
-# 6. Ranking de produtos por preço médio
-if not df_precos_filt.empty:
-    st.subheader("🏆 Ranking de Produtos por Preço Médio")
-    ranking_produtos = df_precos_filt.groupby('produto')['preco'].agg(['mean', 'count']).reset_index()
-    ranking_produtos.columns = ['Produto', 'Preço Médio', 'Qtd Registros']
-    ranking_produtos = ranking_produtos.sort_values('Preço Médio', ascending=False)
-    
-    fig_ranking = px.bar(
-        ranking_produtos.head(10),
-        x='Produto',
-        y='Preço Médio',
-        title="Top 10 Produtos por Preço Médio",
-        text='Preço Médio',
-        color='Preço Médio',
-        color_continuous_scale="Viridis"
-    )
-    fig_ranking.update_traces(texttemplate='$%{text:.2f}', textposition='outside')
-    st.plotly_chart(fig_ranking, use_container_width=True)
+        fig_preco.update_layout(
+            margin=dict(t=50, b=20),
+            hovermode='x unified'
+        )
+        st.plotly_chart(fig_preco, use_container_width=True)
+    else:
+        st.info("Nenhum dado de preços disponível para o gráfico de histórico.")
+
+    # 2. Comparação de preços por produto (Boxplot)
+    if not df_precos_filt.empty and df_precos_filt['preco_brl'].notna().any():
+        st.subheader("📊 Distribuição de Preços por Produto")
+        fig_box = px.box(
+            df_precos_filt,
+            x='produto',
+            y='preco_brl',
+            color='produto',
+            labels=ROTULOS_BRL,
+            title="Distribuição e outliers de preços por produto (R$)"
+        )
+        fig_box.update_layout(margin=dict(t=50, b=20))
+        st.plotly_chart(fig_box, use_container_width=True)
 
-# 7. NOVO: Análise de correlação entre produtos
-if not df_precos_filt.empty and len(df_precos_filt['produto'].unique()) > 1:
-    st.subheader("🔗 Correlação de Preços Entre Produtos")
-    
-    # Preparar dados para correlação
-    df_corr = df_precos_filt.pivot_table(
-        index='data_preco', 
-        columns='produto', 
-        values='preco', 
-        aggfunc='mean'
-    )
-    
-    if df_corr.shape[1] > 1:
-        corr_matrix = df_corr.corr()
-        
-        fig_corr = px.imshow(
-            corr_matrix,
-            aspect="auto",
-            title="Matriz de Correlação de Preços Entre Produtos",
-            color_continuous_scale="RdBu_r",
-            zmin=-1, zmax=1
+    # 3. Variação percentual mensal
+    if not df_precos_filt.empty and len(df_precos_filt) > 1:
+        st.subheader("📊 Variação Percentual Mensal dos Preços")
+        df_pct = df_precos_filt.assign(ano_mes=df_precos_filt['data_preco'].dt.to_period('M'))
+        df_pct = df_pct.groupby(['produto', 'ano_mes']).preco_brl.mean().reset_index()
+        df_pct['ano_mes'] = df_pct['ano_mes'].dt.to_timestamp()
+        df_pct['pct_var'] = df_pct.groupby('produto')['preco_brl'].pct_change(fill_method=None) * 100
+
+        fig_pct = px.line(
+            df_pct,
+            x='ano_mes',
+            y='pct_var',
+            color='produto',
+            title="Variação percentual média mensal por produto",
+            markers=True
         )
-        st.plotly_chart(fig_corr, use_container_width=True)
+        fig_pct.update_layout(margin=dict(t=50, b=20))
+        st.plotly_chart(fig_pct, use_container_width=True)
+
+    # 5. Dispersão preço x data
+    if not df_precos_filt.empty and df_precos_filt['preco_brl'].notna().any():
+        st.subheader("🔍 Dispersão Preço x Data")
+        fig_disp = px.scatter(
+            df_precos_filt.dropna(subset=['preco_brl']),
+            x='data_preco',
+            y='preco_brl',
+            color='produto',
+            size='preco_brl',
+            hover_data=['localizacao', 'moeda', 'preco'],
+            labels=ROTULOS_BRL,
+            title="Dispersão dos preços ao longo do tempo (R$)"
+        )
+        fig_disp.update_layout(margin=dict(t=50, b=20))
+        st.plotly_chart(fig_disp, use_container_width=True)
+
+
+def secao_comparacoes(df_precos_filt):
+    """Comparações entre produtos e localizações"""
+    # 4. Heatmap de preços por localização e produto
+    if not df_precos_filt.empty and len(df_precos_filt) > 3:
+        st.subheader("🔥 Mapa de Calor - Preços por Localização")
+        heatmap_data = df_precos_filt.groupby(['produto', 'localizacao'])['preco_brl'].mean().reset_index()
+
+        if len(heatmap_data) > 1:
+            heatmap_pivot = heatmap_data.pivot(index='produto', columns='localizacao', values='preco_brl')
+
+            fig_heatmap = px.imshow(
+                heatmap_pivot.values,
+                x=heatmap_pivot.columns,
+                y=heatmap_pivot.index,
+                aspect="auto",
+                labels=dict(color='Preço médio (R$)'),
+                title="Preços médios por produto e localização (R$)",
+                color_continuous_scale="Viridis"
+            )
+            st.plotly_chart(fig_heatmap, use_container_width=True)
 
-# Dashboard Fretes (melhorado)
-st.subheader("🚛 Análise Detalhada de Custos Logísticos (Fretes)")
-if not df_fretes.empty:
-    col_f1, col_f2 = st.columns(2)
-    
-    with col_f1:
-        # Gráfico de fretes por tipo de transporte
-        frete_por_tipo = df_fretes.groupby('tipo_transporte')['preco'].mean().reset_index()
-        fig_frete_tipo = px.pie(
-            frete_por_tipo,
-            names='tipo_transporte',
-            values='preco',
-            title="Distribuição de Custos por Tipo de Transporte"
+    # 6. Ranking de produtos por preço médio
+    if not df_precos_filt.empty:
+        st.subheader("🏆 Ranking de Produtos por Preço Médio")
+        ranking_produtos = df_precos_filt.groupby('produto')['preco_brl'].agg(['mean', 'count']).reset_index()
+        ranking_produtos.columns = ['Produto', 'Preço Médio (R$)', 'Qtd Registros']
+        ranking_produtos = ranking_produtos.dropna(subset=['Preço Médio (R$)']).sort_values('Preço Médio (R$)', ascending=False)
+
+        fig_ranking = px.bar(
+            ranking_produtos.head(10),
+            x='Produto',
+            y='Preço Médio (R$)',
+            title="Top 10 Produtos por Preço Médio (R$)",
+            text='Preço Médio (R$)',
+            color='Preço Médio (R$)',
+            color_continuous_scale="Viridis"
         )
-        st.plotly_chart(fig_frete_tipo, use_container_width=True)
-    
-    with col_f2:
-        # Scatter plot origem-destino
-        df_fretes_agrup = df_fretes.groupby(['origem', 'destino', 'tipo_transporte']).agg({
-            'preco':'mean', 
-            'data':'count'
-        }).reset_index()
-        df_fretes_agrup.rename(columns={'data':'volume'}, inplace=True)
-        
-        fig_fretes = px.scatter(
-            df_fretes_agrup,
-            x='origem',
-            y='destino',
-            size='volume',
-            color='tipo_transporte',
-            hover_name='tipo_transporte',
-            title="Volume e Preço Médio dos Fretes por Rota"
+        fig_ranking.update_traces(texttemplate='R$ %{text:,.2f}', textposition='outside')
+        st.plotly_chart(fig_ranking, use_container_width=True)
+
+    # 7. NOVO: Análise de correlação entre produtos
+    if not df_precos_filt.empty and len(df_precos_filt['produto'].unique()) > 1:
+        st.subheader("🔗 Correlação de Preços Entre Produtos")
+
+        # Preparar dados para correlação
+        df_corr = df_precos_filt.pivot_table(
+            index='data_preco', 
+            columns='produto', 
+            values='preco_brl', 
+            aggfunc='mean'
         )
-        st.plotly_chart(fig_fretes, use_container_width=True)
-else:
-    st.info("Nenhum dado de fretes disponível para exibir.")
 
-# Análise Sazonal (melhorada)
-st.subheader("📅 Análise Sazonal dos Preços")
-try:
-    
-    ts_data = df_precos_filt.copy()
-    ts_data['ano_mes'] = ts_data['data_preco'].dt.to_period('M')
-    ts_data = ts_data.groupby('ano_mes')['preco'].mean()
-    ts_data = ts_data.dropna()
-    ts_data.index = ts_data.index.to_timestamp()
-    
-    if len(ts_data) >= 24:
-        decomposition = sm.tsa.seasonal_decompose(ts_data, model='additive', period=12)
-        
-        fig_seasonal = go.Figure()
-        fig_seasonal.add_trace(go.Scatter(
-            x=decomposition.seasonal.index,
-            y=decomposition.seasonal.values,
-            mode='lines',
-            name='Componente Sazonal',
-            line=dict(color='blue')
-        ))
-        fig_seasonal.update_layout(
-            title='Componente Sazonal dos Preços Médios',
-            margin=dict(t=50, b=20),
-            xaxis_title="Data",
-            yaxis_title="Variação Sazonal"
+        if df_corr.shape[1] > 1:
+            corr_matrix = df_corr.corr()
+
+            fig_corr = px.imshow(
+                corr_matrix,
+                aspect="auto",
+                title="Matriz de Correlação de Preços Entre Produtos",
+                color_continuous_scale="RdBu_r",
+                zmin=-1, zmax=1
+            )
+            st.plotly_chart(fig_corr, use_container_width=True)
+
+    # Distribuição preço médio por produto (melhorado)
+    st.subheader("📊 Distribuição do Preço Médio por Produto")
+    if not df_precos_filt.empty:
+        preco_medio_produto = df_precos_filt.groupby('produto')['preco_brl'].mean().dropna().reset_index()
+        fig_pie = px.pie(
+            preco_medio_produto, 
+            names='produto', 
+            values='preco_brl', 
+            labels=ROTULOS_BRL,
+            title='Distribuição de Preço Médio por Produto (R$)'
         )
-        st.plotly_chart(fig_seasonal, use_container_width=True)
-    else:
-        st.info(f"A série temporal precisa de pelo menos 24 meses para análise sazonal. Atualmente possui {len(ts_data)} meses.")
-        
-        # Mostrar análise mensal alternativa
-        if len(ts_data) >= 6:
-            fig_mensal = px.line(
-                x=ts_data.index,
-                y=ts_data.values,
-                title="Evolução dos Preços Médios Mensais",
-                labels={'x': 'Data', 'y': 'Preço Médio'}
+        fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+        st.plotly_chart(fig_pie, use_container_width=True)
+
+
+def secao_fretes(df_precos_filt):
+    """Custos logísticos a partir da matriz de fretes"""
+    # Dashboard Fretes (lido da matriz origem x destino x modal, em BRL)
+    st.subheader("🚛 Análise Detalhada de Custos Logísticos (Fretes)")
+    matriz_fretes = ler_matriz_fretes(engine)
+    if not matriz_fretes.empty:
+        col_f1, col_f2 = st.columns(2)
+
+        with col_f1:
+            # Gráfico de fretes por tipo de transporte
+            frete_por_tipo = matriz_fretes.groupby('tipo_transporte')['custo_medio_brl'].mean().reset_index()
+            fig_frete_tipo = px.pie(
+                frete_por_tipo,
+                names='tipo_transporte',
+                values='custo_medio_brl',
+                title="Distribuição de Custos por Tipo de Transporte (R$)"
             )
-            st.plotly_chart(fig_mensal, use_container_width=True)
+            st.plotly_chart(fig_frete_tipo, use_container_width=True)
+
+        with col_f2:
+            # Scatter plot origem-destino
+            fig_fretes = px.scatter(
+                matriz_fretes,
+                x='origem',
+                y='destino',
+                size='n_registros',
+                color='tipo_transporte',
+                hover_name='tipo_transporte',
+                hover_data=['custo_ultimo_brl', 'custo_medio_brl', 'data_ultimo'],
+                title="Volume e Custo Médio dos Fretes por Rota (R$)"
+            )
+            st.plotly_chart(fig_fretes, use_container_width=True)
+    else:
+        st.info("Nenhum dado de fretes disponível para exibir.")
 
-except Exception as e:
-    st.warning(f"Análise sazonal não disponível: {e}")
 
-# Alertas automáticos (melhorados)
-st.subheader("⚠️ Alertas Automáticos")
-try:
-    if not df_precos_filt.empty and len(df_precos_filt) > 1:
-        df_precos_filt_sorted = df_precos_filt.sort_values(['produto', 'localizacao', 'data_preco'])
-        df_precos_filt_sorted['pct_change'] = df_precos_filt_sorted.groupby(['produto', 'localizacao'])['preco'].pct_change(fill_method=None) * 100
-        
-        alertas = df_precos_filt_sorted[
-            (df_precos_filt_sorted['pct_change'].abs() > 10) & 
-            (df_precos_filt_sorted['pct_change'].notna())
+def secao_sazonalidade(df_precos_filt):
+    """Componente sazonal da série escolhida"""
+    # Análise Sazonal (lida do cache de decomposição STL por série)
+    st.subheader("📅 Análise Sazonal dos Preços")
+    try:
+        if not df_precos_filt.empty:
+            col_s1, col_s2 = st.columns(2)
+            with col_s1:
+                produto_sazonal = st.selectbox("Produto:", sorted(df_precos_filt['produto'].unique()), key="produto_sazonal")
+            df_locais_sazonal = pd.read_sql_query(text("""
+                SELECT DISTINCT l.id, l.nome
+                FROM precos pr
+                JOIN produtos p ON p.id = pr.produto_id
+                JOIN locais l ON l.id = pr.local_id
+                WHERE p.nome_produto = :produto
+                ORDER BY l.nome
+            """), engine, params={"produto": produto_sazonal})
+            opcoes_local = {"Todos os locais": TODOS_LOCAIS}
+            opcoes_local.update(dict(zip(df_locais_sazonal['nome'], df_locais_sazonal['id'])))
+            with col_s2:
+                local_sazonal = st.selectbox("Localização:", list(opcoes_local.keys()), key="local_sazonal")
+
+            componentes, n_meses = ler_sazonalidade(engine, produto_sazonal, int(opcoes_local[local_sazonal]))
+
+            if not componentes.empty:
+                fig_seasonal = go.Figure()
+                fig_seasonal.add_trace(go.Scatter(
+                    x=componentes['data'],
+                    y=componentes['sazonal'],
+                    mode='lines',
+                    name='Componente Sazonal',
+                    line=dict(color='blue')
+                ))
+                fig_seasonal.add_trace(go.Scatter(
+                    x=componentes['data'],
+                    y=componentes['tendencia'],
+                    mode='lines',
+                    name='Tendência',
+                    line=dict(color='gray', dash='dot'),
+                    yaxis='y2'
+                ))
+                fig_seasonal.update_layout(
+                    title=f'Componente Sazonal (STL) - {produto_sazonal} / {local_sazonal}',
+                    margin=dict(t=50, b=20),
+                    xaxis_title="Data",
+                    yaxis_title="Variação Sazonal (R$)",
+                    yaxis2=dict(title="Tendência", overlaying='y', side='right')
+                )
+                st.plotly_chart(fig_seasonal, use_container_width=True)
+            elif n_meses is None:
+                st.info("A decomposição sazonal desta série ainda não foi calculada. Ela é atualizada após cada importação.")
+            else:
+                st.info(f"A série temporal precisa de pelo menos {MESES_MINIMOS} meses para análise sazonal. Atualmente possui {n_meses} meses.")
+
+    except Exception as e:
+        st.warning(f"Análise sazonal não disponível: {e}")
+
+
+def secao_alertas(df_precos_filt):
+    """Alertas de variação gerados na ingestão"""
+    # Alertas automáticos (lidos da tabela gerada na ingestão)
+    st.subheader("⚠️ Alertas Automáticos")
+    try:
+        alertas = ler_alertas_recentes(engine, limite=50)
+        alertas = alertas[
+            (alertas['produto'].isin(df_precos_filt['produto'].unique())) &
+            (alertas['localizacao'].isin(df_precos_filt['localizacao'].unique()))
         ]
-        
+
         if not alertas.empty:
             st.markdown("**🚨 Variações Significativas Detectadas:**")
             for _, row in alertas.head(5).iterrows():
@@ -771,45 +723,194 @@ try:
                 else:
                     st.error(f"📉 {row['produto']} em {row['localizacao']}: {row['pct_change']:.1f}% em {row['data_preco'].date()}")
         else:
-            st.info("✅ Nenhuma variação significativa detectada (>10%).")
-    else:
-        st.info("Dados insuficientes para análise de variação.")
-        
-except Exception as e:
-    st.warning(f"Erro ao gerar alertas: {e}")
-
-# Distribuição preço médio por produto (melhorado)
-st.subheader("📊 Distribuição do Preço Médio por Produto")
-if not df_precos_filt.empty:
-    preco_medio_produto = df_precos_filt.groupby('produto')['preco'].mean().reset_index()
-    fig_pie = px.pie(
-        preco_medio_produto, 
-        names='produto', 
-        values='preco', 
-        title='Distribuição de Preço Médio por Produto'
+            st.info("✅ Nenhuma variação significativa detectada.")
+
+        with st.expander("⚙️ Configurar limite de alerta por produto"):
+            df_produtos_alerta = pd.read_sql_query("SELECT id, nome_produto FROM produtos ORDER BY nome_produto", engine)
+            if not df_produtos_alerta.empty:
+                col_l1, col_l2 = st.columns(2)
+                with col_l1:
+                    produto_alerta = st.selectbox("Produto:", df_produtos_alerta['nome_produto'].unique(), key="produto_alerta")
+                with col_l2:
+                    limite_alerta = st.number_input("Limite (%)", min_value=0.5, value=LIMITE_PADRAO_PCT, step=0.5, key="limite_alerta")
+                if st.button("💾 Salvar limite", use_container_width=True):
+                    with engine.begin() as connection:
+                        for produto_id in df_produtos_alerta.loc[df_produtos_alerta['nome_produto'] == produto_alerta, 'id']:
+                            definir_limite_alerta(connection, int(produto_id), limite_alerta)
+                    st.success(f"Limite de {limite_alerta:.1f}% salvo para {produto_alerta}. Vale para os próximos preços inseridos.")
+
+    except Exception as e:
+        st.warning(f"Erro ao gerar alertas: {e}")
+
+
+def secao_tabelas(df_precos_filt):
+    """Últimos preços e fretes registrados"""
+    # Tabelas de dados (melhoradas)
+    col_tab1, col_tab2 = st.columns(2)
+
+    with col_tab1:
+        st.subheader("💰 Últimos Preços Registrados")
+        if not df_precos_filt.empty:
+            tabela_precos = df_precos_filt.sort_values("data_preco", ascending=False).head(10)
+            tabela_precos['data_preco'] = tabela_precos['data_preco'].dt.strftime('%d/%m/%Y')
+            st.dataframe(tabela_precos[['produto', 'localizacao', 'preco', 'moeda', 'data_preco']], use_container_width=True)
+        else:
+            st.info("Nenhum dado de preços disponível.")
+
+    with col_tab2:
+        st.subheader("🚚 Últimos Fretes Registrados")
+        if not df_fretes.empty:
+            tabela_fretes = df_fretes.sort_values("data", ascending=False).head(10)
+            st.dataframe(tabela_fretes, use_container_width=True)
+        else:
+            st.info("Nenhum dado de fretes disponível.")
+
+
+def secao_outliers(df_precos_filt):
+    """Revisão dos preços marcados pelo filtro de Hampel na ingestão"""
+    st.subheader("🧹 Revisão de Outliers")
+    st.caption("Preços que se afastam da mediana móvel da série (produto x local) por mais de "
+               f"{LIMIAR_HAMPEL:.0f} desvios robustos. Desmarque os que são movimentos reais de mercado.")
+
+    if st.button("🔄 Recalcular outliers"):
+        with st.spinner("Recalculando..."):
+            atualizar_outliers(engine)
+
+    outliers = ler_outliers(engine)
+    if outliers.empty:
+        st.info("Nenhum preço marcado como outlier.")
+        return
+
+    editado = st.data_editor(
+        outliers,
+        column_config={
+            "outlier": st.column_config.CheckboxColumn("É outlier?"),
+            "outlier_score": st.column_config.NumberColumn("Score", format="%.1f"),
+        },
+        disabled=[c for c in outliers.columns if c != "outlier"],
+        hide_index=True,
+        use_container_width=True,
+        key="editor_outliers"
     )
-    fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-    st.plotly_chart(fig_pie, use_container_width=True)
 
-# Tabelas de dados (melhoradas)
-col_tab1, col_tab2 = st.columns(2)
+    mudancas = editado[editado['outlier'] != outliers['outlier']]
+    if st.button(f"💾 Salvar revisão ({len(mudancas)} alteração(ões))", disabled=mudancas.empty):
+        with engine.begin() as connection:
+            revisar_outliers(connection, dict(zip(mudancas['id'], mudancas['outlier'])))
+        st.success("Revisão salva!")
+        st.rerun()
 
-with col_tab1:
-    st.subheader("💰 Últimos Preços Registrados")
-    if not df_precos_filt.empty:
-        tabela_precos = df_precos_filt.sort_values("data_preco", ascending=False).head(10)
-        tabela_precos['data_preco'] = tabela_precos['data_preco'].dt.strftime('%d/%m/%Y')
-        st.dataframe(tabela_precos[['produto', 'localizacao', 'preco', 'moeda', 'data_preco']], use_container_width=True)
+
+def secao_barter(df_precos_filt):
+    """Razão de troca informada x implícita e percentis móveis, lidos das séries pré-calculadas"""
+    st.subheader("🌾 Barter: Razão de Troca")
+    barter = ler_barter(engine)
+    if barter.empty:
+        st.info("Nenhuma série de barter calculada ainda. Ela é atualizada após cada importação.")
+        return
+
+    col_b1, col_b2, col_b3 = st.columns(3)
+    with col_b1:
+        cultura = st.selectbox("Cultura:", sorted(barter['cultura'].unique()), key="cultura_barter")
+    barter = barter[barter['cultura'] == cultura]
+    with col_b2:
+        estado = st.selectbox("Estado:", sorted(barter['estado'].unique()), key="estado_barter")
+    barter = barter[barter['estado'] == estado]
+    with col_b3:
+        produto = st.selectbox("Produto:", sorted(barter['produto'].fillna("(sem produto)").unique()), key="produto_barter")
+    serie = barter[barter['produto'].fillna("(sem produto)") == produto]
+
+    fig_barter = go.Figure()
+    fig_barter.add_trace(go.Scatter(x=serie['data'], y=serie['p90'], mode='lines', line=dict(width=0), showlegend=False))
+    fig_barter.add_trace(go.Scatter(
+        x=serie['data'], y=serie['p10'], mode='lines', line=dict(width=0), fill='tonexty',
+        fillcolor='rgba(0, 128, 0, 0.15)', name=f'P10–P90 ({JANELA_PERCENTIS} registros)'
+    ))
+    fig_barter.add_trace(go.Scatter(x=serie['data'], y=serie['p50'], mode='lines', name='Mediana móvel',
+                                    line=dict(color='green', dash='dot')))
+    fig_barter.add_trace(go.Scatter(x=serie['data'], y=serie['razao_informada'], mode='lines+markers',
+                                    name='Razão informada', line=dict(color='green')))
+    fig_barter.add_trace(go.Scatter(x=serie['data'], y=serie['razao_implicita'], mode='lines+markers',
+                                    name='Razão implícita (preços)', line=dict(color='orange')))
+    sinalizados = serie[serie['gap_sinalizado']]
+    fig_barter.add_trace(go.Scatter(x=sinalizados['data'], y=sinalizados['razao_informada'], mode='markers',
+                                    name=f'Gap > {LIMIAR_GAP:.0%}', marker=dict(color='red', size=11, symbol='x')))
+    fig_barter.update_layout(
+        title=f"Razão de troca - {cultura} / {estado} / {produto}",
+        margin=dict(t=50, b=20), xaxis_title="Data", yaxis_title="Unidades da cultura por unidade do produto"
+    )
+    st.plotly_chart(fig_barter, use_container_width=True)
+
+    ultimo = serie.iloc[-1]
+    col_m1, col_m2, col_m3 = st.columns(3)
+    col_m1.metric("Razão informada", f"{ultimo['razao_informada']:.2f}")
+    col_m2.metric("Razão implícita", "N/A" if pd.isna(ultimo['razao_implicita']) else f"{ultimo['razao_implicita']:.2f}",
+                  delta=None if pd.isna(ultimo['gap_pct']) else f"gap {ultimo['gap_pct']:+.1%}", delta_color="off")
+    col_m3.metric("Percentil na janela", "N/A" if pd.isna(ultimo['percentil_atual']) else f"{ultimo['percentil_atual']:.0%}")
+
+    if not sinalizados.empty:
+        st.markdown(f"**🚩 Registros com gap acima de {LIMIAR_GAP:.0%}:**")
+        st.dataframe(
+            sinalizados[['data', 'preco_cultura', 'razao_informada', 'preco_produto_brl', 'fonte_preco',
+                         'razao_implicita', 'gap_pct']].sort_values('data', ascending=False),
+            hide_index=True, use_container_width=True
+        )
+
+
+SECOES_DASHBOARD = {
+    "📈 Preços": secao_precos,
+    "🔥 Comparações": secao_comparacoes,
+    "🚛 Fretes": secao_fretes,
+    "📅 Sazonalidade": secao_sazonalidade,
+    "⚠️ Alertas": secao_alertas,
+    "🌾 Barter": secao_barter,
+    "📋 Tabelas": secao_tabelas,
+    "🧹 Outliers": secao_outliers,
+}
+
+@st.fragment
+def renderizar_secao(nome_secao, df_precos_filt):
+    """Renderiza uma seção e registra o tempo gasto, para acompanhar regressões de desempenho.
+
+    Por ser um fragment, interações dentro da seção reexecutam só ela, não a página inteira.
+    """
+    inicio = time.perf_counter()
+    SECOES_DASHBOARD[nome_secao](df_precos_filt)
+    duracao_ms = (time.perf_counter() - inicio) * 1000
+
+    tempos = st.session_state.tempos_secoes.setdefault(nome_secao, [])
+    tempos.append(duracao_ms)
+    del tempos[:-20]  # mantém só as últimas 20 medições de cada seção
+    print(f"[render] {nome_secao}: {duracao_ms:.0f} ms")
+    st.caption(f"⏱️ Seção renderizada em {duracao_ms:.0f} ms")
+
+secao_escolhida = st.radio("Seção do dashboard:", list(SECOES_DASHBOARD.keys()), horizontal=True, key="secao_dashboard")
+renderizar_secao(secao_escolhida, df_precos_filt)
+
+with st.expander("⏱️ Tempos de renderização por seção"):
+    if st.session_state.tempos_secoes:
+        st.dataframe(pd.DataFrame([
+            {"Seção": nome, "Última (ms)": round(tempos[-1]), "Mediana (ms)": round(pd.Series(tempos).median()), "Medições": len(tempos)}
+            for nome, tempos in st.session_state.tempos_secoes.items()
+        ]), use_container_width=True)
     else:
-        st.info("Nenhum dado de preços disponível.")
+        st.info("Nenhuma seção renderizada ainda.")
 
-with col_tab2:
-    st.subheader("🚚 Últimos Fretes Registrados")
-    if not df_fretes.empty:
-        tabela_fretes = df_fretes.sort_values("data", ascending=False).head(10)
-        st.dataframe(tabela_fretes, use_container_width=True)
+with st.expander(f"⏱️ Latência das etapas de importação (últimas {IMPORTACOES_RECENTES} importações)"):
+    latencias = ler_latencias(engine)
+    if latencias.empty:
+        st.info("Nenhuma importação medida ainda.")
     else:
-        st.info("Nenhum dado de fretes disponível.")
+        st.dataframe(
+            latencias.rename(columns={
+                "etapa": "Etapa", "importacoes": "Importações", "spans": "Medições",
+                "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)", "bytes_por_importacao": "Bytes/importação",
+                "linhas_por_importacao": "Linhas/importação", "tokens_por_importacao": "Tokens/importação",
+                "erros": "Erros",
+            }).round(0),
+            use_container_width=True, hide_index=True
+        )
+
 
 # Rodapé visual
 st.markdown("---")
@@ -817,27 +918,41 @@ st.markdown("**Dashboard Morro Verde** - Análise de Concorrência | Dados atual
 
 # Seção de Desfazer e Histórico de Ações
 st.markdown("---")
-st.markdown("### ⏪ Deseja desfazer a última atualização?")
+st.markdown("#### 📚 Histórico de alterações no banco:")
+
+acoes = ler_ultimas_acoes(engine, n=5)
+if acoes.empty:
+    st.info("Nenhuma ação registrada ainda.")
+for _, acao in acoes.iterrows():
+    col_a1, col_a2 = st.columns([5, 1])
+    with col_a1:
+        detalhe = ", ".join(
+            f"{tabela} {inicio}–{fim}" for tabela, faixas in acao['faixas'].items() for inicio, fim in faixas
+        )
+        st.markdown(
+            f"- {acao['descricao']}  \n"
+            f"  <small>{acao['criado_em']:%d/%m/%Y %H:%M} · {acao['usuario']} · {acao['tipo']}"
+            f"{' · ' + detalhe if detalhe else ''}{' · desfeita' if acao['desfeita'] else ''}</small>",
+            unsafe_allow_html=True
+        )
+    with col_a2:
+        pode_desfazer = bool(acao['faixas']) and not acao['desfeita'] and acao['tipo'] != "desfazer"
+        if pode_desfazer and st.button("↩️ Desfazer", key=f"desfazer_{acao['id']}", use_container_width=True):
+            sucesso, msg = desfazer_acao(engine, int(acao['id']))
+            if sucesso:
+                threading.Thread(target=atualizar_derivados, args=(engine,), daemon=True).start()
+                st.success(f"✅ {msg}")
+                time.sleep(1)
+                st.rerun()
+            else:
+                st.error(f"❌ {msg}")
 
 if os.path.exists("backups_csv"):
-    if st.button("Desfazer Última Atualização", use_container_width=True):
-        if restaurar_backup_mais_recente():
-            if os.path.exists("acoes_realizadas.json"):
-                with open("acoes_realizadas.json", "r") as f:
-                    log = json.load(f)
-                if log:
-                    log.pop()  # Remove a última ação do histórico
-                    with open("acoes_realizadas.json", "w") as f:
-                        json.dump(log, f)
-            st.success("✅ Banco de dados restaurado com sucesso!")
-            st.rerun()
-
-if os.path.exists("acoes_realizadas.json"):
-    with open("acoes_realizadas.json", "r") as f:
-        acoes = json.load(f)
-    if acoes:
-        st.markdown("#### 📚 Histórico de alterações no banco:")
-        for acao in reversed(acoes[-5:]):
-            st.markdown(f"- {acao}")
-
-
+    with st.expander("⏪ Restaurar o backup completo mais recente"):
+        if st.button("Restaurar Backup", use_container_width=True):
+            if restaurar_backup_mais_recente(engine):
+                with engine.begin() as connection:
+                    registrar_acao(connection, "restauracao_backup", "⏪ Banco restaurado a partir do backup mais recente.")
+                threading.Thread(target=atualizar_derivados, args=(engine,), daemon=True).start()
+                st.success("✅ Banco de dados restaurado com sucesso!")
+                st.rerun()
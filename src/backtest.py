@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import resource
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sklearn.metrics import mean_absolute_percentage_error, mean_absolute_error
+from previsao import (
+    carregar_dados, preparar_series_lote, remover_outliers_marcados, criar_features_lote, selecionar_features,
+    criar_pipeline, simular_trajetorias, MINIMO_REGISTROS
+)
+from catalogo_modelos import selecionar_candidatos
+from previsao_lote import enumerar_combinacoes
+from migracoes import garantir_esquema
+
+# Backtest com origens rolantes de todas as séries: modelos do catálogo e baselines, com erro,
+# tempo de fit/predict e pico de memória (RSS) de cada previsão.
+# Uso: python backtest.py --origens 4 --horizonte 3 --saida backtest.json
+
+ORIGENS_PADRAO = 4
+HORIZONTE_PADRAO = 3
+BASELINES = ['naive', 'sazonal_naive']
+# Intervalo da amostragem do RSS durante cada chamada medida
+INTERVALO_AMOSTRA_RSS_S = 0.005
+
+
+def origens_rolantes(n_linhas, n_origens, horizonte):
+    """Posições de corte (fim do treino) das últimas `n_origens` janelas de teste, sem sobreposição"""
+    origens = [n_linhas - horizonte * k for k in range(n_origens, 0, -1)]
+    return [o for o in origens if o >= MINIMO_REGISTROS]
+
+
+def prever_baseline(nome, df_treino, df_teste):
+    """Naive repete o último valor; sazonal naive usa o valor de 12 meses antes de cada data (ou o último)"""
+    ultimo = df_treino['valor_entregue'].iloc[-1]
+    if nome == 'naive':
+        return np.full(len(df_teste), ultimo)
+
+    historico = df_treino[['data', 'valor_entregue']].sort_values('data')
+    alvo = pd.DataFrame({'data': (df_teste['data'] - pd.DateOffset(months=12)).to_numpy()})
+    sazonal = pd.merge_asof(alvo, historico, on='data', direction='backward')['valor_entregue']
+    return sazonal.fillna(ultimo).to_numpy()
+
+
+def rss_mb():
+    """RSS atual do processo em MB (/proc no Linux); sem /proc, o pico do processo informado pelo resource"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def medir(funcao):
+    """Executa `funcao` e retorna (resultado, segundos, pico de RSS em MB acima do RSS do início).
+
+    O tempo não sofre a instrumentação de cada alocação do tracemalloc: a memória vem de uma thread que
+    amostra o RSS enquanto a chamada roda, e assim inclui as alocações nativas (XGBoost, numpy).
+    """
+    base = rss_mb()
+    pico = [base]
+    parar = threading.Event()
+
+    def amostrar():
+        while not parar.wait(INTERVALO_AMOSTRA_RSS_S):
+            pico[0] = max(pico[0], rss_mb())
+
+    amostrador = threading.Thread(target=amostrar, daemon=True)
+    amostrador.start()
+    inicio = time.perf_counter()
+    try:
+        resultado = funcao()
+    finally:
+        duracao = time.perf_counter() - inicio
+        parar.set()
+        amostrador.join()
+    return resultado, duracao, max(pico[0], rss_mb()) - base
+
+
+def backtest_serie(df_features, n_origens, horizonte):
+    """Avalia modelos e baselines em cada origem rolante de uma série; retorna uma linha por (origem, modelo)"""
+    df_clean, features_to_use = selecionar_features(df_features)
+    df_clean = df_clean.reset_index(drop=True)
+    linhas = []
+
+    for origem in origens_rolantes(len(df_clean), n_origens, horizonte):
+        df_treino, df_teste = df_clean.iloc[:origem], df_clean.iloc[origem:origem + horizonte]
+        X_treino, y_treino = df_treino[features_to_use], df_treino['valor_entregue']
+        y_teste = df_teste['valor_entregue'].to_numpy()
+
+        resultados = {}
+        for nome in BASELINES:
+            previsto, tempo_predict, pico = medir(lambda: prever_baseline(nome, df_treino, df_teste))
+            resultados[nome] = (previsto, 0.0, tempo_predict, pico)
+
+        # Todos os modelos do catálogo elegíveis pelo tamanho do treino, sem limite de latência
+        for nome in selecionar_candidatos(len(X_treino), orcamento_latencia_s=float('inf')):
+            if nome in BASELINES:
+                continue
+            pipeline = criar_pipeline(nome, X_treino)
+            _, tempo_fit, pico_fit = medir(lambda: pipeline.fit(X_treino, y_treino))
+            # Previsão recursiva com frete e câmbio realizados, como o motor faria com cenários conhecidos
+            previsto, tempo_predict, pico_predict = medir(lambda: simular_trajetorias(
+                pipeline, X_treino, df_treino, pd.DatetimeIndex(df_teste['data']),
+                df_teste['frete_final'].to_numpy(dtype=float)[None, :],
+                df_teste['usd_brl'].to_numpy(dtype=float)[None, :]
+            )[0])
+            resultados[nome] = (previsto, tempo_fit, tempo_predict, max(pico_fit, pico_predict))
+
+        for nome, (previsto, tempo_fit, tempo_predict, pico) in resultados.items():
+            linhas.append({
+                'origem_backtest': df_treino['data'].iloc[-1].strftime('%Y-%m-%d'),
+                'modelo': nome,
+                'n_treino': len(df_treino),
+                'n_teste': len(df_teste),
+                'mae': mean_absolute_error(y_teste, previsto),
+                'mape': mean_absolute_percentage_error(y_teste, previsto),
+                'tempo_fit_s': tempo_fit,
+                'tempo_predict_s': tempo_predict,
+                'memoria_pico_mb': pico,
+            })
+    return linhas
+
+
+def resumir(df_resultados):
+    """Médias de erro e somas de tempo por modelo, ordenadas pelo MAPE"""
+    resumo = df_resultados.groupby('modelo').agg(
+        mape=('mape', 'mean'),
+        mae=('mae', 'mean'),
+        tempo_fit_s=('tempo_fit_s', 'sum'),
+        tempo_predict_s=('tempo_predict_s', 'sum'),
+        memoria_pico_mb=('memoria_pico_mb', 'max'),
+        n_previsoes=('mape', 'size'),
+    ).sort_values('mape')
+    return resumo.reset_index().to_dict(orient='records')
+
+
+def executar_backtest(engine, n_origens=ORIGENS_PADRAO, horizonte=HORIZONTE_PADRAO, produtos=None, max_series=None):
+    """Backtest de todas as combinações viáveis (ou dos `produtos` pedidos); retorna o relatório como dict"""
+    df, fretes, _ = carregar_dados(engine)
+    combinacoes = enumerar_combinacoes(df, fretes)
+    if produtos:
+        combinacoes = combinacoes[combinacoes['nome_produto'].isin(produtos)]
+    if max_series:
+        combinacoes = combinacoes.head(max_series)
+    print(f"🔢 {len(combinacoes)} série(s) no backtest")
+
+    series = preparar_series_lote(df, fretes, combinacoes[['origem_id', 'destino_id']])
+    series = series.merge(combinacoes, on=['nome_produto', 'origem_id', 'destino_id'])
+    features = criar_features_lote(remover_outliers_marcados(series))
+
+    resultados, falhas = [], 0
+    for (produto, origem_id, destino_id), df_features in features.groupby(['nome_produto', 'origem_id', 'destino_id']):
+        try:
+            linhas = backtest_serie(df_features, n_origens, horizonte)
+        except Exception as e:
+            falhas += 1
+            print(f"❌ Erro no backtest de {produto} {origem_id}→{destino_id}: {e}")
+            continue
+        for linha in linhas:
+            resultados.append({'produto': produto, 'origem_id': int(origem_id), 'destino_id': int(destino_id), **linha})
+        print(f"✅ {produto} {origem_id}→{destino_id}: {len(linhas)} previsão(ões)")
+
+    df_resultados = pd.DataFrame(resultados)
+    return {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'parametros': {'origens': n_origens, 'horizonte': horizonte, 'produtos': produtos, 'max_series': max_series},
+        'falhas': falhas,
+        'resumo': resumir(df_resultados) if not df_resultados.empty else [],
+        'resultados': resultados,
+    }
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Backtest com origens rolantes do motor de previsão")
+    parser.add_argument("--origens", type=int, default=ORIGENS_PADRAO, help="Origens rolantes por série")
+    parser.add_argument("--horizonte", type=int, default=HORIZONTE_PADRAO, help="Registros previstos a partir de cada origem")
+    parser.add_argument("--produto", action="append", help="Restringe a um produto (pode repetir)")
+    parser.add_argument("--max-series", type=int, default=None, help="Limita a quantidade de séries")
+    parser.add_argument("--saida", default="backtest.json", help="Arquivo JSON do relatório")
+    args = parser.parse_args()
+
+    engine = create_engine(os.getenv("DATABASE_URL"))
+    garantir_esquema(engine)
+
+    inicio = time.perf_counter()
+    relatorio = executar_backtest(engine, args.origens, args.horizonte, args.produto, args.max_series)
+    relatorio['duracao_s'] = round(time.perf_counter() - inicio, 2)
+
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2, default=float)
+    print(json.dumps(relatorio['resumo'], ensure_ascii=False, default=float))
@@ -0,0 +1,82 @@
+import os
+import glob
+import shutil
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import text
+from alertas import gerar_alertas
+
+# Backup completo do banco em CSV (uma pasta por backup) e restauração do mais recente.
+# Usado pela tela principal e pelo cli.py.
+
+DIRETORIO_BACKUPS = "backups_csv"
+MAX_BACKUPS = 5
+
+# Ordem de exportação e restauração: tabelas referenciadas antes das que as referenciam
+TABELAS_BACKUP = ["produtos", "locais", "precos", "fretes", "barter_ratios", "cambio", "custos_portos"]
+
+
+def listar_backups():
+    """Pastas de backup existentes, da mais antiga para a mais recente"""
+    return sorted(glob.glob(f"{DIRETORIO_BACKUPS}/backup_*"), key=lambda x: os.path.getmtime(x))
+
+
+def criar_backup(engine, max_backups=MAX_BACKUPS):
+    """Exporta as tabelas para uma nova pasta e mantém só os `max_backups` mais recentes.
+
+    Retorna o caminho da pasta criada, ou None se o backup falhar.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_folder = f"{DIRETORIO_BACKUPS}/backup_{timestamp}"
+    os.makedirs(backup_folder, exist_ok=True)
+
+    try:
+        with engine.connect() as connection:
+            for tabela in TABELAS_BACKUP:
+                df = pd.read_sql(f"SELECT * FROM {tabela}", connection)
+                df.to_csv(f"{backup_folder}/{tabela}.csv", index=False)
+
+        # Limpeza: mantém só os N mais recentes
+        backups = listar_backups()
+        while len(backups) > max_backups:
+            shutil.rmtree(backups[0])
+            backups.pop(0)
+
+        print(f"✅ Backup COMPLETO criado em {backup_folder}")
+        return backup_folder
+
+    except Exception as e:
+        print(f"❌ Erro ao criar backup: {e}")
+        return None
+
+
+def restaurar_backup_mais_recente(engine, pasta=None):
+    """Substitui o conteúdo das tabelas pelo backup mais recente (ou pela `pasta` indicada).
+
+    Retorna a pasta restaurada, ou None se não houver backup ou a restauração falhar.
+    """
+    if pasta is None:
+        backups = listar_backups()
+        if not backups:
+            return None
+        pasta = backups[-1]
+
+    try:
+        with engine.begin() as connection:
+            # Limpar tabelas (modo seguro - respeita FK)
+            for tabela in reversed(TABELAS_BACKUP):
+                connection.execute(text(f"DELETE FROM {tabela}"))
+
+            for tabela in TABELAS_BACKUP:
+                df = pd.read_csv(f"{pasta}/{tabela}.csv")
+                df.to_sql(tabela, connection, if_exists="append", index=False)
+
+            # Alertas dos preços apagados caem em cascata; recalcula sobre os dados restaurados
+            gerar_alertas(connection)
+
+        print(f"✅ Backup COMPLETO restaurado de {pasta}")
+        return pasta
+
+    except Exception as e:
+        print(f"❌ Erro ao restaurar backup: {e}")
+        return None
@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from juncoes_asof import juntar_asof
+
+# Séries de barter por cultura x estado x produto: razão informada no relatório, razão implícita
+# (preço do fertilizante em BRL / preço da cultura), diferença entre as duas e percentis móveis da
+# razão informada. Como na sazonalidade, só as séries cuja versão mudou são recalculadas.
+
+# Janela (em registros da série) dos percentis móveis
+JANELA_PERCENTIS = 12
+MINIMO_JANELA = 3
+# Diferença relativa entre razão informada e implícita a partir da qual o registro é sinalizado
+LIMIAR_GAP = 0.15
+# Preço do fertilizante mais antigo que isso (em relação à data do barter) não entra na razão implícita
+TOLERANCIA_PRECO = pd.Timedelta(days=45)
+
+CHAVES_BARTER = ['cultura', 'estado', 'produto_id']
+
+
+def garantir_tabelas_barter(connection):
+    """Cria as tabelas das séries de barter pré-calculadas, se ainda não existirem"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS barter_series (
+            cultura TEXT,
+            estado TEXT,
+            produto_id INTEGER,
+            versao TEXT,
+            n_registros INTEGER,
+            calculado_em TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (cultura, estado, produto_id)
+        )
+    """))
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS barter_analise (
+            barter_id INTEGER PRIMARY KEY,
+            cultura TEXT,
+            estado TEXT,
+            produto_id INTEGER,
+            data TEXT,
+            preco_cultura REAL,
+            razao_informada REAL,
+            preco_produto_brl REAL,
+            fonte_preco TEXT,
+            razao_implicita REAL,
+            gap_pct REAL,
+            gap_sinalizado BOOLEAN,
+            p10 REAL,
+            p50 REAL,
+            p90 REAL,
+            percentil_atual REAL
+        )
+    """))
+    connection.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_barter_analise_serie ON barter_analise (cultura, estado, produto_id, data)
+    """))
+
+
+def versoes_series_barter(connection):
+    """Versão de cada série de barter: contagem e maior id dos registros da série e dos preços do produto
+    (incluindo marcações de outlier e valores em BRL preenchidos depois pelo backfill de câmbio)"""
+    return pd.read_sql_query(text("""
+        WITH versoes_precos AS (
+            SELECT produto_id, COUNT(*) || ':' || MAX(id) || ':' || COUNT(*) FILTER (WHERE outlier)
+                   || ':' || COALESCE(SUM(preco_min_brl), 0) AS versao_precos
+            FROM precos
+            GROUP BY produto_id
+        )
+        SELECT COALESCE(b.cultura, '') AS cultura, COALESCE(b.estado, '') AS estado,
+               COALESCE(b.produto_id, 0) AS produto_id,
+               COUNT(*) || ':' || MAX(b.id) || '|' || COALESCE(MAX(vp.versao_precos), '') AS versao
+        FROM barter_ratios b
+        LEFT JOIN versoes_precos vp ON vp.produto_id = b.produto_id
+        GROUP BY 1, 2, 3
+    """), connection)
+
+
+def precos_produto_brl(precos):
+    """Preços mínimos em BRL (normalizados na escrita), médios por dia.
+
+    Retorna (por estado, nacional): o primeiro com produto_id, estado e data; o segundo sem estado.
+    """
+    precos = precos.dropna(subset=['preco_brl'])
+    por_estado = precos.groupby(['produto_id', 'estado', 'data'], as_index=False)['preco_brl'].mean()
+    nacional = precos.groupby(['produto_id', 'data'], as_index=False)['preco_brl'].mean()
+    return por_estado, nacional
+
+
+def calcular_analise_barter(barter, precos):
+    """Razão implícita, gap e percentis móveis de todas as séries de `barter` de uma vez.
+
+    O preço do fertilizante vem da média do dia nos locais do mesmo estado (as-of, dentro de
+    TOLERANCIA_PRECO); sem preço no estado, usa a média de todos os locais.
+    """
+    barter = barter.sort_values(CHAVES_BARTER + ['data', 'id'], kind='mergesort').reset_index(drop=True)
+    barter['estado_chave'] = barter['estado'].str.upper().str.strip()
+
+    por_estado, nacional = precos_produto_brl(precos)
+    por_estado = por_estado.rename(columns={'estado': 'estado_chave'})
+    por_estado['estado_chave'] = por_estado['estado_chave'].astype(str).str.upper().str.strip()
+
+    barter = juntar_asof(barter, por_estado, ['preco_brl'], ['produto_id', 'estado_chave'], tolerancia=TOLERANCIA_PRECO)
+    barter = barter.rename(columns={'preco_brl': 'preco_estado'})
+    barter = juntar_asof(barter, nacional, ['preco_brl'], ['produto_id'], tolerancia=TOLERANCIA_PRECO)
+    barter['preco_produto_brl'] = barter['preco_estado'].fillna(barter['preco_brl'])
+    barter['fonte_preco'] = np.where(
+        barter['preco_estado'].notna(), 'estado', np.where(barter['preco_brl'].notna(), 'nacional', None)
+    )
+
+    barter['razao_implicita'] = barter['preco_produto_brl'] / barter['preco_cultura'].where(barter['preco_cultura'] > 0)
+    barter['gap_pct'] = barter['razao_informada'] / barter['razao_implicita'] - 1
+    barter['gap_sinalizado'] = (barter['gap_pct'].abs() > LIMIAR_GAP).fillna(False)
+
+    # Percentis móveis da razão informada dentro de cada série
+    janelas = barter.groupby(CHAVES_BARTER, sort=False)['razao_informada'].rolling(
+        JANELA_PERCENTIS, min_periods=MINIMO_JANELA
+    )
+    for nome, quantil in [('p10', 0.1), ('p50', 0.5), ('p90', 0.9)]:
+        barter[nome] = janelas.quantile(quantil).reset_index(level=list(range(len(CHAVES_BARTER))), drop=True)
+    barter['percentil_atual'] = janelas.rank(pct=True).reset_index(level=list(range(len(CHAVES_BARTER))), drop=True)
+
+    return barter.rename(columns={'id': 'barter_id'})[[
+        'barter_id', 'cultura', 'estado', 'produto_id', 'data', 'preco_cultura', 'razao_informada',
+        'preco_produto_brl', 'fonte_preco', 'razao_implicita', 'gap_pct', 'gap_sinalizado',
+        'p10', 'p50', 'p90', 'percentil_atual'
+    ]]
+
+
+def atualizar_barter(engine):
+    """Recalcula apenas as séries de barter cuja versão mudou (novos registros ou preços do produto).
+
+    Roda depois de cada importação; o dashboard só lê barter_analise.
+    """
+    with engine.begin() as connection:
+        garantir_tabelas_barter(connection)
+        versoes = versoes_series_barter(connection)
+        cache = pd.read_sql_query(text("SELECT cultura, estado, produto_id, versao FROM barter_series"), connection)
+
+        for df in (versoes, cache):
+            df['produto_id'] = df['produto_id'].astype(int)
+        comparacao = versoes.merge(cache, on=CHAVES_BARTER, how='outer', suffixes=('', '_cache'))
+        alteradas = comparacao[comparacao['versao'] != comparacao['versao_cache']]
+        if alteradas.empty:
+            return 0
+
+        # Séries alteradas (ou que sumiram, p.ex. por um desfazer) saem das duas tabelas e são regravadas
+        chaves = alteradas[CHAVES_BARTER].to_dict(orient='records')
+        connection.execute(text("""
+            DELETE FROM barter_analise
+            WHERE cultura = :cultura AND estado = :estado AND produto_id = :produto_id
+        """), chaves)
+        connection.execute(text("""
+            DELETE FROM barter_series WHERE cultura = :cultura AND estado = :estado AND produto_id = :produto_id
+        """), chaves)
+
+        atuais = alteradas.dropna(subset=['versao'])
+        if atuais.empty:
+            return len(alteradas)
+
+        barter = pd.read_sql_query(text("""
+            SELECT id, COALESCE(cultura, '') AS cultura, COALESCE(estado, '') AS estado,
+                   COALESCE(produto_id, 0) AS produto_id, data, preco_cultura, barter_ratio AS razao_informada
+            FROM barter_ratios
+        """), connection)
+        barter = barter.merge(atuais[CHAVES_BARTER], on=CHAVES_BARTER)
+        precos = pd.read_sql_query(text("""
+            SELECT pr.produto_id, l.estado, pr.data, pr.preco_min_brl AS preco_brl
+            FROM precos pr
+            JOIN locais l ON l.id = pr.local_id
+            WHERE pr.preco_min_brl IS NOT NULL AND NOT COALESCE(pr.outlier, FALSE) AND pr.produto_id = ANY(:produtos)
+        """), connection, params={"produtos": [int(p) for p in atuais['produto_id'].unique()]})
+
+        for df in (barter, precos):
+            df['data'] = pd.to_datetime(df['data'], errors='coerce')
+        for coluna in ['preco_cultura', 'razao_informada']:
+            barter[coluna] = pd.to_numeric(barter[coluna], errors='coerce')
+        barter = barter.dropna(subset=['data'])
+
+        analise = calcular_analise_barter(barter, precos.dropna(subset=['data']))
+        analise['data'] = analise['data'].dt.strftime('%Y-%m-%d')
+        analise.to_sql("barter_analise", connection, if_exists="append", index=False)
+
+        contagens = analise.groupby(CHAVES_BARTER).size().rename('n_registros').reset_index()
+        series = atuais[CHAVES_BARTER + ['versao']].merge(contagens, on=CHAVES_BARTER, how='left')
+        series['n_registros'] = series['n_registros'].fillna(0).astype(int)
+        series.to_sql("barter_series", connection, if_exists="append", index=False)
+
+    print(f"✅ Barter recalculado para {len(alteradas)} série(s)")
+    return len(alteradas)
+
+
+def ler_barter(engine, cultura=None, estado=None, produto_id=None):
+    """Séries de barter pré-calculadas com o nome do produto (opcionalmente filtradas)"""
+    filtros, params = [], {}
+    for coluna, valor in [("cultura", cultura), ("estado", estado), ("produto_id", produto_id)]:
+        if valor is not None:
+            filtros.append(f"b.{coluna} = :{coluna}")
+            params[coluna] = valor
+
+    with engine.begin() as connection:
+        garantir_tabelas_barter(connection)
+        df = pd.read_sql_query(text(f"""
+            SELECT b.*, p.nome_produto AS produto
+            FROM barter_analise b
+            LEFT JOIN produtos p ON p.id = b.produto_id
+            WHERE {" AND ".join(filtros) or "TRUE"}
+            ORDER BY b.cultura, b.estado, b.produto_id, b.data
+        """), connection, params=params)
+
+    df['data'] = pd.to_datetime(df['data'])
+    return df
@@ -0,0 +1,62 @@
+import argparse
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+import numpy as np
+
+# Teste de carga da API HTTP: dispara requisições concorrentes e mede vazão e latência.
+# Para medir em um núcleo, suba o servidor fixado em uma CPU: taskset -c 0 python servidor_http.py
+# Uso: python carga_http.py --url "http://127.0.0.1:8800/precos?produto=Ureia" --requisicoes 2000 --concorrencia 8
+
+
+def requisitar(url, etag=None):
+    """Faz um GET e retorna (status, segundos)"""
+    headers = {"If-None-Match": etag} if etag else {}
+    inicio = time.perf_counter()
+    try:
+        with urlopen(Request(url, headers=headers)) as resposta:
+            resposta.read()
+            status = resposta.status
+    except HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - inicio
+
+
+def executar_carga(url, requisicoes, concorrencia, usar_etag=False):
+    """Dispara `requisicoes` GETs com `concorrencia` threads; com usar_etag, revalida (espera 304)"""
+    etag = None
+    if usar_etag:
+        with urlopen(url) as resposta:
+            etag = resposta.headers.get("ETag")
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        resultados = list(pool.map(lambda _: requisitar(url, etag), range(requisicoes)))
+    duracao = time.perf_counter() - inicio
+
+    latencias = np.array([r[1] for r in resultados]) * 1000
+    return {
+        "url": url,
+        "requisicoes": requisicoes,
+        "concorrencia": concorrencia,
+        "etag": usar_etag,
+        "duracao_s": round(duracao, 3),
+        "requisicoes_por_s": round(requisicoes / duracao, 1),
+        "latencia_p50_ms": round(float(np.percentile(latencias, 50)), 2),
+        "latencia_p95_ms": round(float(np.percentile(latencias, 95)), 2),
+        "status": dict(Counter(str(r[0]) for r in resultados)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga da API HTTP")
+    parser.add_argument("--url", default="http://127.0.0.1:8800/saude")
+    parser.add_argument("--requisicoes", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--etag", action="store_true", help="Envia If-None-Match (mede o caminho do 304)")
+    args = parser.parse_args()
+
+    print(json.dumps(executar_carga(args.url, args.requisicoes, args.concorrencia, args.etag), ensure_ascii=False))
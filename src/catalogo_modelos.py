@@ -0,0 +1,106 @@
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+# Catálogo de modelos em camadas, do mais barato ao mais caro. A seleção considera o tamanho da série
+# e um orçamento de latência para o treino (validação cruzada + ajuste final).
+
+LATENCIA_PADRAO_S = 10.0
+
+# nome -> (linhas mínimas, custo estimado de um ajuste em segundos: fixo + por linha)
+CATALOGO_MODELOS = {
+    'naive': (0, 0.0, 0.0),
+    'ets': (10, 0.05, 0.0001),
+    'ridge': (20, 0.01, 0.00002),
+    'xgb': (60, 0.3, 0.002),
+    'rf': (60, 0.5, 0.004),
+}
+
+
+class ModeloNaive(BaseEstimator, RegressorMixin):
+    """Repete o último valor do treino; predict(X) devolve len(X) passos à frente"""
+    univariado = True
+
+    def fit(self, X, y):
+        self.ultimo_ = float(np.asarray(y)[-1])
+        return self
+
+    def prever_passos(self, n_passos):
+        return np.full(n_passos, self.ultimo_)
+
+    def prever_um_passo(self, y, n_passos):
+        """Previsões de um passo das últimas n_passos posições de y, cada uma a partir do valor anterior"""
+        return np.asarray(y, dtype=float)[-n_passos - 1:-1]
+
+    def predict(self, X):
+        return self.prever_passos(len(X))
+
+
+class ModeloETS(BaseEstimator, RegressorMixin):
+    """Suavização exponencial com tendência amortecida sobre y; predict(X) devolve len(X) passos à frente"""
+    univariado = True
+
+    def fit(self, X, y):
+        y = np.asarray(y, dtype=float)
+        try:
+            self.modelo_ = ExponentialSmoothing(y, trend='add', damped_trend=True).fit()
+        except Exception:
+            # Série curta ou degenerada demais para o ETS: cai para o último valor
+            self.modelo_ = None
+        self.ultimo_ = y[-1]
+        return self
+
+    def prever_passos(self, n_passos):
+        if self.modelo_ is None:
+            return np.full(n_passos, self.ultimo_)
+        return np.asarray(self.modelo_.forecast(n_passos))
+
+    def prever_um_passo(self, y, n_passos):
+        """Previsões de um passo das últimas n_passos posições de y, com os parâmetros do ajuste.
+
+        Refaz a suavização sobre y inteiro com os parâmetros e o estado inicial fixos (sem reotimizar),
+        então cada valor ajustado usa só as observações anteriores a ele.
+        """
+        y = np.asarray(y, dtype=float)
+        if self.modelo_ is None:
+            return y[-n_passos - 1:-1]
+        p = self.modelo_.params
+        suavizado = ExponentialSmoothing(
+            y, trend='add', damped_trend=True, initialization_method='known',
+            initial_level=p['initial_level'], initial_trend=p['initial_trend'],
+        ).fit(
+            smoothing_level=p['smoothing_level'], smoothing_trend=p['smoothing_trend'],
+            damping_trend=p['damping_trend'], optimized=False,
+        )
+        return np.asarray(suavizado.fittedvalues)[-n_passos:]
+
+    def predict(self, X):
+        return self.prever_passos(len(X))
+
+
+def custo_estimado(nome, n_linhas, n_splits=3):
+    """Segundos estimados para validar (n_splits ajustes) e treinar o modelo com n_linhas"""
+    _, fixo, por_linha = CATALOGO_MODELOS[nome]
+    return (n_splits + 1) * (fixo + por_linha * n_linhas)
+
+
+def selecionar_candidatos(n_linhas, orcamento_latencia_s=LATENCIA_PADRAO_S, n_splits=3):
+    """Modelos do catálogo elegíveis para a série, em ordem de custo, enquanto couberem no orçamento.
+
+    O naive entra sempre, como referência e como resposta mínima para séries muito curtas.
+    """
+    candidatos, gasto = [], 0.0
+    for nome, (linhas_minimas, _, _) in CATALOGO_MODELOS.items():
+        if n_linhas < linhas_minimas:
+            continue
+        custo = custo_estimado(nome, n_linhas, n_splits)
+        if candidatos and gasto + custo > orcamento_latencia_s:
+            break
+        candidatos.append(nome)
+        gasto += custo
+    return candidatos
+
+
+def modelo_univariado(pipeline):
+    """Se o estimador final prevê só a partir do histórico de y (naive, ETS)"""
+    return getattr(pipeline.steps[-1][1], 'univariado', False)
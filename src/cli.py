@@ -0,0 +1,188 @@
+import argparse
+import contextlib
+import fcntl
+import json
+import os
+import sys
+import time
+import traceback
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+# Linha de comando para as tarefas pesadas, sem a interface: importar relatório, recalcular agregados,
+# atualizar as previsões em lote, backup, restauração, fusão de duplicatas e migração do esquema. Feita para o cron: os logs vão para o stderr,
+# o stdout recebe só uma linha JSON com status e duração, e o código de saída diz se deu certo.
+# Uso: python cli.py previsoes --meses 6
+#      python cli.py entidades --entidade locais --manter 12 --remover 40 57
+#      0 3 * * * cd /app/src && python cli.py agregados >> /var/log/morro_verde.jsonl
+
+SAIDA_OK = 0
+SAIDA_FALHA = 1
+# 2 é o código do argparse para uso incorreto
+SAIDA_PARCIAL = 3
+SAIDA_OCUPADO = 4
+
+# Um comando por vez: execuções do cron que se sobrepõem saem com SAIDA_OCUPADO
+ARQUIVO_TRAVA = "cli.lock"
+
+
+def comando_importar(engine, args):
+    from backup import criar_backup
+    # Importado só aqui: o processamento do relatório carrega o cliente do Gemini
+    from processar_relatorio import processar_relatorio
+
+    if not os.path.exists(args.pdf):
+        raise FileNotFoundError(f"Relatório não encontrado: {args.pdf}")
+    backup = None
+    if not args.sem_backup:
+        backup = criar_backup(engine)
+        if backup is None:
+            raise RuntimeError("Backup antes da importação falhou; use --sem-backup para importar mesmo assim")
+
+    faixas, qualidade, etapas = processar_relatorio(args.pdf, num_partes=args.partes, nome_arquivo=os.path.basename(args.pdf))
+    return SAIDA_OK, {"backup": backup, "faixas": faixas, "qualidade": qualidade, "etapas": etapas}
+
+
+def comando_agregados(engine, args):
+    from derivados import atualizar_derivados
+
+    erros = atualizar_derivados(engine)
+    codigo = SAIDA_PARCIAL if any(erros.values()) else SAIDA_OK
+    return codigo, {"etapas": {nome: erro or "ok" for nome, erro in erros.items()}}
+
+
+def comando_previsoes(engine, args):
+    from previsao_lote import executar_lote, MESES_LOTE
+
+    resumo = executar_lote(engine, os.getenv("DATABASE_URL"), args.meses or MESES_LOTE, args.processos)
+    if resumo["falhas"] and not resumo["sucesso"]:
+        return SAIDA_FALHA, resumo
+    return (SAIDA_PARCIAL if resumo["falhas"] else SAIDA_OK), resumo
+
+
+def comando_backup(engine, args):
+    from backup import criar_backup, MAX_BACKUPS
+
+    pasta = criar_backup(engine, args.manter or MAX_BACKUPS)
+    return (SAIDA_OK if pasta else SAIDA_FALHA), {"pasta": pasta}
+
+
+def comando_restaurar(engine, args):
+    from backup import restaurar_backup_mais_recente
+    from acoes import registrar_acao
+    from derivados import atualizar_derivados
+
+    pasta = restaurar_backup_mais_recente(engine, args.pasta)
+    if pasta is None:
+        return SAIDA_FALHA, {"pasta": args.pasta}
+    with engine.begin() as connection:
+        registrar_acao(connection, "restauracao_backup", f"⏪ Banco restaurado a partir de {pasta}.", usuario="cli")
+    erros = atualizar_derivados(engine)
+    return (SAIDA_PARCIAL if any(erros.values()) else SAIDA_OK), {
+        "pasta": pasta, "etapas": {nome: erro or "ok" for nome, erro in erros.items()}
+    }
+
+
+def comando_entidades(engine, args):
+    from entidades import candidatas_duplicatas, fundir_entidades, fundir_duplicatas_exatas, LIMIAR_CANDIDATAS
+    from derivados import atualizar_derivados
+
+    entidades = [args.entidade] if args.entidade else ["produtos", "locais"]
+    if args.manter is not None:
+        if not args.entidade or not args.remover:
+            raise ValueError("--manter exige --entidade e --remover")
+        fundidas = {args.entidade: fundir_entidades(engine, args.entidade, args.manter, args.remover, usuario="cli")}
+    elif args.fundir_exatas:
+        fundidas = {entidade: fundir_duplicatas_exatas(engine, entidade, usuario="cli") for entidade in entidades}
+    else:
+        limiar = args.limiar or LIMIAR_CANDIDATAS
+        return SAIDA_OK, {
+            entidade: candidatas_duplicatas(engine, entidade, limiar).to_dict(orient="records") for entidade in entidades
+        }
+
+    erros = atualizar_derivados(engine) if any(fundidas.values()) else {}
+    return (SAIDA_PARCIAL if any(erros.values()) else SAIDA_OK), {
+        "fundidas": fundidas, "etapas": {nome: erro or "ok" for nome, erro in erros.items()}
+    }
+
+
+def comando_migrar(engine, args):
+    from migracoes import migrar, VERSAO_ESQUEMA
+
+    return SAIDA_OK, {"versao": VERSAO_ESQUEMA, "aplicada": migrar(engine, forcar=args.forcar)}
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Tarefas do Morro Verde sem a interface (para cron)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    importar = sub.add_parser("importar", help="Importa um relatório PDF (com backup antes)")
+    importar.add_argument("pdf", help="Caminho do relatório PDF")
+    importar.add_argument("--partes", type=int, default=15, help="Partes em que o texto é dividido para o Gemini")
+    importar.add_argument("--sem-backup", action="store_true", help="Não cria backup antes de importar")
+    importar.set_defaults(funcao=comando_importar)
+
+    agregados = sub.add_parser("agregados", help="Recalcula moedas, sazonalidade, matriz de fretes, outliers, custo entregue e barter")
+    agregados.set_defaults(funcao=comando_agregados)
+
+    previsoes = sub.add_parser("previsoes", help="Atualiza o feature store e as previsões de todas as rotas")
+    previsoes.add_argument("--meses", type=int, default=None, help="Horizonte em meses (padrão: o do lote)")
+    previsoes.add_argument("--processos", type=int, default=None, help="Processos no pool (padrão: núcleos da máquina)")
+    previsoes.set_defaults(funcao=comando_previsoes)
+
+    backup = sub.add_parser("backup", help="Cria um backup completo em CSV")
+    backup.add_argument("--manter", type=int, default=None, help="Quantos backups manter (padrão: 5)")
+    backup.set_defaults(funcao=comando_backup)
+
+    restaurar = sub.add_parser("restaurar", help="Restaura o backup mais recente (ou --pasta)")
+    restaurar.add_argument("--pasta", default=None, help="Pasta de backup específica")
+    restaurar.set_defaults(funcao=comando_restaurar)
+
+    entidades = sub.add_parser("entidades", help="Lista e funde produtos/locais duplicados (grafias diferentes)")
+    entidades.add_argument("--entidade", choices=["produtos", "locais"], default=None, help="Padrão: as duas")
+    entidades.add_argument("--limiar", type=float, default=None, help="Similaridade mínima dos pares listados (padrão: 0.5)")
+    entidades.add_argument("--fundir-exatas", action="store_true", help="Funde as que só diferem em acento, caixa ou pontuação")
+    entidades.add_argument("--manter", type=int, default=None, help="Id que fica na fusão manual")
+    entidades.add_argument("--remover", type=int, nargs="+", default=None, help="Ids fundidos em --manter")
+    entidades.set_defaults(funcao=comando_entidades)
+
+    migrar = sub.add_parser("migrar", help="Aplica as colunas e índices das tabelas principais (uma vez por versão)")
+    migrar.add_argument("--forcar", action="store_true", help="Reaplica mesmo se o banco já estiver na versão atual")
+    migrar.set_defaults(funcao=comando_migrar)
+
+    return parser
+
+
+def executar(args):
+    """Roda o comando com a trava e os logs no stderr; retorna (código de saída, relatório JSON)"""
+    relatorio = {"comando": args.comando, "inicio": datetime.now().isoformat(timespec="seconds")}
+    inicio = time.perf_counter()
+
+    with open(ARQUIVO_TRAVA, "w") as trava, contextlib.redirect_stdout(sys.stderr):
+        try:
+            fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            codigo, relatorio["erro"] = SAIDA_OCUPADO, "Outro comando do cli.py está em execução"
+        else:
+            try:
+                engine = create_engine(os.getenv("DATABASE_URL"))
+                if args.comando != "migrar":
+                    from migracoes import garantir_esquema
+                    garantir_esquema(engine)
+                codigo, relatorio["resultado"] = args.funcao(engine, args)
+            except Exception as e:
+                traceback.print_exc()
+                codigo, relatorio["erro"] = SAIDA_FALHA, str(e)
+
+    relatorio["status"] = {SAIDA_OK: "ok", SAIDA_PARCIAL: "parcial", SAIDA_OCUPADO: "ocupado"}.get(codigo, "falha")
+    relatorio["codigo_saida"] = codigo
+    relatorio["duracao_s"] = round(time.perf_counter() - inicio, 2)
+    return codigo, relatorio
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    codigo, relatorio = executar(criar_parser().parse_args())
+    print(json.dumps(relatorio, ensure_ascii=False, default=str))
+    sys.exit(codigo)
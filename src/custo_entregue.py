@@ -0,0 +1,140 @@
+import pandas as pd
+from sqlalchemy import text
+from fretes import garantir_tabela_matriz_fretes
+
+# Matriz de custo entregue (produto x origem x destino) em BRL: último preço de cada produto na origem,
+# em BRL pela cotação da data dele (normalizado na escrita, moedas.py), + custo portuário mais recente
+# da origem + frete mais barato da rota na matriz de fretes. Recalculada de uma vez a cada mudança nos dados, para que comparações
+# entre origens sejam uma consulta indexada e não um treino de modelo.
+
+
+def garantir_tabela_custos_entregues(connection):
+    """Cria a matriz de custo entregue e o índice da busca pela origem mais barata, se ainda não existirem"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS custos_entregues (
+            produto_id INTEGER,
+            origem_id INTEGER,
+            destino_id INTEGER,
+            moeda_preco TEXT,
+            preco_original REAL,
+            preco_brl REAL,
+            data_preco TEXT,
+            custo_porto_brl REAL,
+            frete_brl REAL,
+            tipo_frete TEXT,
+            data_frete TEXT,
+            custo_entregue_brl REAL,
+            usd_brl REAL,
+            atualizado_em TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (produto_id, origem_id, destino_id)
+        )
+    """))
+    connection.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_custos_entregues_destino
+        ON custos_entregues (destino_id, produto_id, custo_entregue_brl)
+    """))
+
+
+def ultimos_por_chave(df, chaves):
+    """Linha mais recente (maior data) de cada combinação de `chaves`"""
+    return df.sort_values('data', kind='mergesort').drop_duplicates(chaves, keep='last')
+
+
+def calcular_custos_entregues(precos, matriz, custos_portos):
+    """Custo entregue de todas as combinações produto x origem x destino em uma passada.
+
+    `precos` traz produto_id, local_id, data, moeda, preco_min, preco_min_brl e usd_brl_aplicado;
+    `matriz` é a matriz de fretes (custo_ultimo_brl por rota e modal); `custos_portos` traz
+    custo_total_brl. Preços sem valor em BRL (sem cotação ou em outra moeda) ficam de fora, e origens
+    sem custo portuário entram com custo zero.
+    """
+    ultimos = ultimos_por_chave(precos.dropna(subset=['data', 'preco_min_brl']), ['produto_id', 'local_id'])
+    ultimos = ultimos.rename(columns={'preco_min_brl': 'preco_brl', 'usd_brl_aplicado': 'usd_brl'})
+
+    # Modal mais barato de cada rota
+    rotas = (
+        matriz.dropna(subset=['custo_ultimo_brl'])
+        .sort_values('custo_ultimo_brl', kind='mergesort')
+        .drop_duplicates(['origem_id', 'destino_id'])
+    )
+
+    portos = ultimos_por_chave(custos_portos.dropna(subset=['custo_total_brl']), ['porto_id'])
+
+    custos = ultimos.merge(rotas, left_on='local_id', right_on='origem_id')
+    custos = custos.merge(
+        portos[['porto_id', 'custo_total_brl']], left_on='origem_id', right_on='porto_id', how='left'
+    )
+    custos['custo_porto_brl'] = custos['custo_total_brl'].fillna(0.0)
+    custos['custo_entregue_brl'] = custos['preco_brl'] + custos['custo_porto_brl'] + custos['custo_ultimo_brl']
+
+    custos = custos.rename(columns={
+        'moeda': 'moeda_preco', 'preco_min': 'preco_original', 'data': 'data_preco',
+        'custo_ultimo_brl': 'frete_brl', 'tipo': 'tipo_frete', 'data_ultimo': 'data_frete',
+    })
+    custos['data_preco'] = pd.to_datetime(custos['data_preco']).dt.strftime('%Y-%m-%d')
+    custos['data_frete'] = pd.to_datetime(custos['data_frete']).dt.strftime('%Y-%m-%d')
+    return custos[[
+        'produto_id', 'origem_id', 'destino_id', 'moeda_preco', 'preco_original', 'preco_brl', 'data_preco',
+        'custo_porto_brl', 'frete_brl', 'tipo_frete', 'data_frete', 'custo_entregue_brl', 'usd_brl'
+    ]]
+
+
+def atualizar_custos_entregues(engine):
+    """Reconstrói a matriz de custo entregue a partir dos últimos preços, da matriz de fretes e dos portos"""
+    with engine.begin() as connection:
+        garantir_tabela_custos_entregues(connection)
+        garantir_tabela_matriz_fretes(connection)
+        # Preços marcados como outlier não entram
+        precos = pd.read_sql_query(text("""
+            SELECT produto_id, local_id, data, moeda, preco_min, preco_min_brl, usd_brl_aplicado
+            FROM precos
+            WHERE NOT COALESCE(outlier, FALSE)
+        """), connection)
+        matriz = pd.read_sql_query(text("""
+            SELECT origem_id, destino_id, tipo, custo_ultimo_brl, data_ultimo FROM matriz_fretes
+        """), connection)
+        custos_portos = pd.read_sql_query(text("SELECT porto_id, data, custo_total_brl FROM custos_portos"), connection)
+
+        precos['data'] = pd.to_datetime(precos['data'], errors='coerce')
+        custos_portos['data'] = pd.to_datetime(custos_portos['data'], errors='coerce')
+        custos = calcular_custos_entregues(precos, matriz, custos_portos)
+
+        connection.execute(text("DELETE FROM custos_entregues"))
+        if not custos.empty:
+            custos.to_sql("custos_entregues", connection, if_exists="append", index=False)
+
+    print(f"✅ Matriz de custo entregue atualizada com {len(custos)} combinação(ões)")
+    return len(custos)
+
+
+def ler_custos_entregues(engine, produto_id=None, destino_id=None):
+    """Matriz de custo entregue com os nomes de produto, origem e destino (opcionalmente filtrada)"""
+    filtros, params = [], {}
+    if produto_id is not None:
+        filtros.append("c.produto_id = :produto_id")
+        params["produto_id"] = int(produto_id)
+    if destino_id is not None:
+        filtros.append("c.destino_id = :destino_id")
+        params["destino_id"] = int(destino_id)
+
+    with engine.begin() as connection:
+        garantir_tabela_custos_entregues(connection)
+        custos = pd.read_sql_query(text(f"""
+            SELECT c.*, p.nome_produto AS produto, l1.nome AS origem, l2.nome AS destino
+            FROM custos_entregues c
+            JOIN produtos p ON p.id = c.produto_id
+            JOIN locais l1 ON l1.id = c.origem_id
+            JOIN locais l2 ON l2.id = c.destino_id
+            WHERE {" AND ".join(filtros) or "TRUE"}
+            ORDER BY c.produto_id, c.destino_id, c.custo_entregue_brl
+        """), connection, params=params)
+
+    for coluna in ['data_preco', 'data_frete']:
+        custos[coluna] = pd.to_datetime(custos[coluna])
+    return custos
+
+
+def origens_mais_baratas(engine, destino_id, produto_id=None, n=1):
+    """As `n` origens de menor custo entregue até o destino, por produto (ou só do produto indicado)"""
+    custos = ler_custos_entregues(engine, produto_id, destino_id)
+    return custos.groupby('produto_id', sort=False).head(n).reset_index(drop=True)
@@ -2,6 +2,10 @@ from sqlalchemy import create_engine, text
 from datetime import datetime
 from dotenv import load_dotenv
 import os
+from alertas import gerar_alertas
+from acoes import registrar_acao, faixas_de_ids
+from moedas import normalizar_moedas, MOEDAS_SUPORTADAS
+from entidades import ResolvedorEntidades
 
 # Load .env
 load_dotenv()
@@ -12,37 +16,25 @@ engine = create_engine(DATABASE_URL)
 
 
 def salvar_preco_manual(produto, localizacao, preco, moeda, data_preco):
+    if moeda not in MOEDAS_SUPORTADAS:
+        return False, f"Moeda não suportada: {moeda} (use {' ou '.join(MOEDAS_SUPORTADAS)})"
     try:
         with engine.begin() as connection:
 
-            # Verificar/inserir produto
-            connection.execute(text('''
-                INSERT INTO produtos (nome_produto, formulacao, origem, tipo, unidade)
-                VALUES (:produto, '', '', 'Manual', 'USD')
-                ON CONFLICT (nome_produto, formulacao, origem) DO NOTHING
-            '''), {"produto": produto})
-
-            result = connection.execute(text('SELECT id FROM produtos WHERE nome_produto = :produto'),
-                                        {"produto": produto})
-            produto_id = result.fetchone()[0]
-
-            # Verificar/inserir local
-            connection.execute(text('''
-                INSERT INTO locais (nome, estado, pais, tipo)
-                VALUES (:localizacao, '', '', 'Manual')
-                ON CONFLICT (nome, estado, pais, tipo) DO NOTHING
-            '''), {"localizacao": localizacao})
-
-            result = connection.execute(text('SELECT id FROM locais WHERE nome = :localizacao'),
-                                        {"localizacao": localizacao})
-            local_id = result.fetchone()[0]
+            # Verificar/inserir produto e local (grafias diferentes caem na mesma entidade)
+            resolvedor = ResolvedorEntidades(connection)
+            produto_id = resolvedor.produto(
+                {"nome_produto": produto, "formulacao": "", "origem": ""}, tipo='Manual', unidade='USD'
+            )
+            local_id = resolvedor.local(localizacao, '', '', 'Manual')
 
             # Inserir preço
             data_formatada = data_preco.strftime('%Y-%m-%d') if data_preco else datetime.today().strftime('%Y-%m-%d')
 
-            connection.execute(text('''
+            result = connection.execute(text('''
                 INSERT INTO precos (produto_id, local_id, data, tipo_preco, modalidade, fonte, moeda, preco_min, preco_max, variacao, simbolo_var)
                 VALUES (:produto_id, :local_id, :data, 'Manual', 'Spot', 'Input Manual', :moeda, :preco_min, :preco_max, 0, '')
+                RETURNING id
             '''), {
                 "produto_id": produto_id,
                 "local_id": local_id,
@@ -52,6 +44,13 @@ def salvar_preco_manual(produto, localizacao, preco, moeda, data_preco):
                 "preco_max": preco
             })
 
+            preco_id = result.fetchone()[0]
+            faixas = faixas_de_ids({"precos": [preco_id]})
+            normalizar_moedas(connection, faixas)
+            gerar_alertas(connection, [preco_id])
+            registrar_acao(connection, "input_manual", f"✍️ Preço inputado manualmente: {produto} em {localizacao}.",
+                           faixas)
+
             return True, "Preço inserido com sucesso!"
 
     except Exception as e:
@@ -62,47 +61,33 @@ def salvar_frete_manual(origem, destino, valor, moeda, data_frete):
     try:
         with engine.begin() as connection:
 
-            # Verificar/inserir origem
-            connection.execute(text('''
-                INSERT INTO locais (nome, estado, pais, tipo)
-                VALUES (:origem, '', '', 'Manual')
-                ON CONFLICT (nome, estado, pais, tipo) DO NOTHING
-            '''), {"origem": origem})
-
-            origem_result = connection.execute(text('SELECT id FROM locais WHERE nome = :origem'),
-                                               {"origem": origem}).fetchone()
-            if not origem_result:
-                return False, f"Erro: origem '{origem}' não encontrada"
-            origem_id = origem_result[0]
-
-            # Verificar/inserir destino
-            connection.execute(text('''
-                INSERT INTO locais (nome, estado, pais, tipo)
-                VALUES (:destino, '', '', 'Manual')
-                ON CONFLICT (nome, estado, pais, tipo) DO NOTHING
-            '''), {"destino": destino})
-
-            destino_result = connection.execute(text('SELECT id FROM locais WHERE nome = :destino'),
-                                                {"destino": destino}).fetchone()
-            if not destino_result:
-                return False, f"Erro: destino '{destino}' não encontrada"
-            destino_id = destino_result[0]
+            # Verificar/inserir origem e destino (grafias diferentes caem no mesmo local)
+            resolvedor = ResolvedorEntidades(connection)
+            origem_id = resolvedor.local(origem, '', '', 'Manual')
+            destino_id = resolvedor.local(destino, '', '', 'Manual')
 
             # Inserir frete
             data_formatada = data_frete.strftime('%Y-%m-%d') if data_frete else datetime.today().strftime('%Y-%m-%d')
 
-            connection.execute(text('''
+            result = connection.execute(text('''
                 INSERT INTO fretes (tipo, origem_id, destino_id, data, custo_usd, custo_brl)
                 VALUES (:tipo, :origem_id, :destino_id, :data, :custo_usd, :custo_brl)
+                RETURNING id
             '''), {
                 "tipo": 'Manual',
                 "origem_id": origem_id,
                 "destino_id": destino_id,
                 "data": data_formatada,
-                "custo_usd": valor,
-                "custo_brl": valor * 5.5  # Você pode refinar essa conversão depois
+                # Grava só a moeda informada; a outra vem da cotação as-of na normalização abaixo
+                "custo_usd": valor if moeda == "USD" else None,
+                "custo_brl": valor if moeda == "BRL" else None
             })
 
+            faixas = faixas_de_ids({"fretes": [result.fetchone()[0]]})
+            normalizar_moedas(connection, faixas)
+            registrar_acao(connection, "input_manual", f"✍️ Frete inputado manualmente: {origem} → {destino}.",
+                           faixas)
+
             return True, "Frete inserido com sucesso!"
 
     except Exception as e:
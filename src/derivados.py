@@ -0,0 +1,52 @@
+from sqlalchemy import text
+from moedas import atualizar_moedas
+from sazonalidade import atualizar_sazonalidade
+from fretes import atualizar_matriz_fretes
+from outliers import atualizar_outliers
+from custo_entregue import atualizar_custos_entregues
+from barter import atualizar_barter
+
+# Tabelas derivadas recalculadas depois de cada mudança nos dados, na ordem de execução
+ETAPAS_DERIVADAS = {
+    # Backfill de cotações que chegaram atrasadas; as etapas seguintes usam os valores normalizados
+    "moedas": atualizar_moedas,
+    "sazonalidade": atualizar_sazonalidade,
+    "matriz de fretes": atualizar_matriz_fretes,
+    "outliers": atualizar_outliers,
+    # Depende da matriz de fretes e das marcações de outlier acima
+    "custo entregue": atualizar_custos_entregues,
+    "barter": atualizar_barter,
+}
+
+# Chave do pg_advisory_lock que serializa as execuções (threads do app, importações e cli.py)
+CHAVE_TRAVA_DERIVADOS = 4_827_002
+
+
+def atualizar_derivados(engine, metricas=None):
+    """Recalcula as tabelas derivadas; uma etapa com erro não impede as seguintes.
+
+    Execuções simultâneas (de qualquer processo) esperam uma trava consultiva do Postgres e rodam uma
+    de cada vez, para que duas não leiam e regravem as mesmas tabelas ao mesmo tempo.
+    Com `metricas` (MetricasImportacao), cada etapa vira um span "derivados: <etapa>".
+    Retorna um dict etapa -> mensagem de erro (None quando a etapa terminou bem).
+    """
+    erros = {}
+    with engine.connect() as trava:
+        trava.execute(text("SELECT pg_advisory_lock(:chave)"), {"chave": CHAVE_TRAVA_DERIVADOS})
+        try:
+            for nome, etapa in ETAPAS_DERIVADAS.items():
+                try:
+                    if metricas is None:
+                        etapa(engine)
+                    else:
+                        with metricas.etapa(f"derivados: {nome}") as span:
+                            span["linhas"] = etapa(engine)
+                    erros[nome] = None
+                except Exception as e:
+                    print(f"[ERRO ao atualizar {nome}]: {e}")
+                    erros[nome] = str(e)
+        finally:
+            # A trava é da sessão: sem o unlock ela continuaria presa à conexão devolvida ao pool
+            trava.execute(text("SELECT pg_advisory_unlock(:chave)"), {"chave": CHAVE_TRAVA_DERIVADOS})
+            trava.commit()
+    return erros
@@ -0,0 +1,413 @@
+import re
+import unicodedata
+from collections import defaultdict
+import pandas as pd
+from sqlalchemy import text
+from acoes import registrar_acao
+
+# Resolução de nomes de produtos e locais. O Gemini escreve o mesmo porto ou produto de vários jeitos
+# ("Paranaguá"/"Paranagua", "Urea"/"Ureia"), e cada grafia nova virava outra linha em locais/produtos,
+# partindo as séries. Cada nome ganha uma chave normalizada (sem acentos, caixa ou pontuação, com
+# sinônimos inglês -> português). Na importação o nome é procurado pela chave, depois na tabela de
+# aliases e, por fim, por similaridade de trigramas (como no pg_trgm) num índice montado em memória.
+# Duplicatas que já estão no banco são fundidas com fundir_entidades (ou `python cli.py entidades`).
+
+# Similaridade mínima para a importação reaproveitar uma entidade existente sem perguntar. Fica alta
+# porque um alias errado mistura séries em silêncio: "Santos"/"Santos SP" dá 0.78 e "Rio Grande"/
+# "Rio Grande do Sul" 0.73; esses viram entidades novas e aparecem entre as candidatas para revisão
+LIMIAR_SIMILARIDADE = 0.85
+# Similaridade mínima para listar um par como possível duplicata (revisão manual)
+LIMIAR_CANDIDATAS = 0.5
+
+# Palavras que o relatório traz em inglês, normalizadas para o termo usado nas séries em português
+SINONIMOS = {
+    "urea": "ureia",
+    "granular": "granulada",
+    "prilled": "perolada",
+    "potash": "kcl",
+    "ammonium": "amonio",
+    "sulphate": "sulfato",
+    "sulfate": "sulfato",
+    "nitrate": "nitrato",
+    "phosphate": "fosfato",
+    "superphosphate": "superfosfato",
+    "single": "simples",
+    "triple": "triplo",
+    "port": "porto",
+    "brazil": "brasil",
+}
+# Conectivos que entram e saem dos nomes ("Rio Grande do Sul"/"Rio Grande Sul") sem mudar o lugar
+PALAVRAS_IGNORADAS = {"de", "do", "da", "dos", "das", "e"}
+
+# Tabelas de dados que apontam para cada entidade (repontadas na fusão)
+REFERENCIAS = {
+    "produtos": [("precos", "produto_id"), ("barter_ratios", "produto_id"), ("alertas_precos", "produto_id")],
+    "locais": [
+        ("precos", "local_id"), ("fretes", "origem_id"), ("fretes", "destino_id"),
+        ("custos_portos", "porto_id"), ("alertas_precos", "local_id"),
+    ],
+}
+
+# Caches derivados das entidades fundidas: apagados na fusão e refeitos pelas etapas derivadas
+DERIVADAS = {
+    "produtos": [("barter_series", "produto_id"), ("barter_analise", "produto_id"), ("custos_entregues", "produto_id")],
+    "locais": [
+        ("matriz_fretes", "origem_id"), ("matriz_fretes", "destino_id"), ("custos_entregues", "origem_id"),
+        ("custos_entregues", "destino_id"), ("sazonalidade_series", "local_id"), ("sazonalidade", "local_id"),
+    ],
+}
+
+
+def garantir_tabela_aliases(connection):
+    """Cria a tabela de aliases (chave normalizada -> entidade), se ainda não existir"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS aliases_entidades (
+            entidade TEXT,
+            chave TEXT,
+            entidade_id INTEGER,
+            nome_original TEXT,
+            origem TEXT,
+            similaridade REAL,
+            criado_em TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (entidade, chave)
+        )
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_aliases_entidades_id ON aliases_entidades (entidade, entidade_id)"))
+
+
+def normalizar_nome(nome):
+    """Chave do nome: sem acentos, minúsculo, só letras e números separados por um espaço, com sinônimos
+    e sem conectivos"""
+    if nome is None or (isinstance(nome, float) and pd.isna(nome)):
+        return ""
+    texto = unicodedata.normalize("NFKD", str(nome))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    palavras = [SINONIMOS.get(palavra, palavra) for palavra in re.findall(r"[a-z0-9]+", texto)]
+    return " ".join(palavra for palavra in palavras if palavra not in PALAVRAS_IGNORADAS)
+
+
+def trigramas(chave):
+    """Trigramas de cada palavra da chave, com as bordas marcadas por espaços (como no pg_trgm)"""
+    return {f"  {palavra} "[i:i + 3] for palavra in chave.split() for i in range(len(palavra) + 1)}
+
+
+def similaridade(a, b):
+    """Similaridade de Jaccard entre os conjuntos de trigramas"""
+    uniao = len(a | b)
+    return len(a & b) / uniao if uniao else 0.0
+
+
+class IndiceNomes:
+    """Índice invertido trigrama -> ids, para achar candidatos parecidos sem comparar com todos"""
+
+    def __init__(self):
+        self.por_trigrama = defaultdict(set)
+        self.trigramas = {}
+        self.numeros = {}
+
+    def adicionar(self, entidade_id, chave):
+        self.trigramas[entidade_id] = trigramas(chave)
+        # Números precisam bater exatamente: NPK 20-05-20 e NPK 20-00-20 são produtos diferentes
+        self.numeros[entidade_id] = re.findall(r"\d+", chave)
+        for trigrama in self.trigramas[entidade_id]:
+            self.por_trigrama[trigrama].add(entidade_id)
+
+    def candidatos(self, chave, limiar, aceitar=None):
+        """Ids com similaridade >= limiar, do mais parecido para o menos: [(id, similaridade)]"""
+        alvo = trigramas(chave)
+        numeros = re.findall(r"\d+", chave)
+        ids = set().union(*(self.por_trigrama.get(t, set()) for t in alvo)) if alvo else set()
+        resultado = []
+        for entidade_id in ids:
+            if self.numeros[entidade_id] != numeros or (aceitar and not aceitar(entidade_id)):
+                continue
+            valor = similaridade(alvo, self.trigramas[entidade_id])
+            if valor >= limiar:
+                resultado.append((entidade_id, valor))
+        return sorted(resultado, key=lambda item: (-item[1], item[0]))
+
+
+def chave_produto(p):
+    """Identidade de um produto: chaves de nome, formulação e origem (vazio e nulo são iguais)"""
+    return (normalizar_nome(p.get("nome_produto")), normalizar_nome(p.get("formulacao")), normalizar_nome(p.get("origem")))
+
+
+def chave_alias_produto(chave):
+    return "|".join(chave)
+
+
+class ResolvedorEntidades:
+    """Resolve nomes em ids de produtos e locais dentro de uma transação, criando os que não existem.
+
+    Carrega produtos, locais e aliases uma vez e mantém o índice atualizado com o que for criado,
+    para que as milhares de linhas de um relatório não façam um SELECT por nome.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        garantir_tabela_aliases(connection)
+        # "revisar": entidades criadas que lembram uma existente (ficam para `python cli.py entidades`)
+        self.resolucoes = {"exata": 0, "alias": 0, "similaridade": 0, "criada": 0, "revisar": 0}
+
+        self.locais, self.estados, self.tipos, self.indice_locais = {}, {}, {}, IndiceNomes()
+        for local_id, nome, estado, tipo in connection.execute(text("SELECT id, nome, estado, tipo FROM locais ORDER BY id")):
+            self.adicionar_local(local_id, normalizar_nome(nome), normalizar_nome(estado), normalizar_nome(tipo))
+
+        self.produtos, self.variantes, self.indice_produtos = {}, {}, IndiceNomes()
+        for produto_id, nome, formulacao, origem in connection.execute(text(
+            "SELECT id, nome_produto, formulacao, origem FROM produtos ORDER BY id"
+        )):
+            self.adicionar_produto(produto_id, chave_produto({"nome_produto": nome, "formulacao": formulacao, "origem": origem}))
+
+        # Aliases de entidades que não existem mais (p.ex. após restaurar um backup) são ignorados
+        self.aliases = {
+            (entidade, chave): entidade_id
+            for entidade, chave, entidade_id in connection.execute(text(
+                "SELECT entidade, chave, entidade_id FROM aliases_entidades"
+            ))
+            if entidade_id in (self.estados if entidade == "locais" else self.variantes)
+        }
+
+    def adicionar_local(self, local_id, chave, estado, tipo):
+        self.locais.setdefault(chave, local_id)
+        self.estados[local_id] = estado
+        self.tipos[local_id] = tipo
+        self.indice_locais.adicionar(local_id, chave)
+
+    def adicionar_produto(self, produto_id, chave):
+        self.produtos.setdefault(chave, produto_id)
+        self.variantes[produto_id] = chave[1:]
+        self.indice_produtos.adicionar(produto_id, chave[0])
+
+    def registrar_alias(self, entidade, chave, entidade_id, nome, origem, valor=None):
+        self.aliases[(entidade, chave)] = entidade_id
+        self.connection.execute(text("""
+            INSERT INTO aliases_entidades (entidade, chave, entidade_id, nome_original, origem, similaridade)
+            VALUES (:entidade, :chave, :entidade_id, :nome, :origem, :similaridade)
+            ON CONFLICT (entidade, chave) DO NOTHING
+        """), {"entidade": entidade, "chave": chave, "entidade_id": entidade_id, "nome": nome,
+               "origem": origem, "similaridade": valor})
+
+    def contar_criada(self, indice, chave):
+        """Conta a entidade criada e, se ela lembra uma existente abaixo do limiar automático, o par a revisar"""
+        self.resolucoes["criada"] += 1
+        if chave and indice.candidatos(chave, LIMIAR_CANDIDATAS):
+            self.resolucoes["revisar"] += 1
+
+    def local(self, nome, estado=None, pais=None, tipo=None):
+        """Id do local pelo nome (chave, alias ou similaridade), criando-o se não houver correspondente"""
+        chave = normalizar_nome(nome)
+        if chave in self.locais:
+            self.resolucoes["exata"] += 1
+            return self.locais[chave]
+        if ("locais", chave) in self.aliases:
+            self.resolucoes["alias"] += 1
+            return self.aliases[("locais", chave)]
+
+        # Por similaridade, só locais com o mesmo estado e o mesmo tipo (vazio só casa com vazio):
+        # "Rio Grande" (porto) e "Rio Grande do Sul" (estado) têm nomes parecidos
+        chave_estado, chave_tipo = normalizar_nome(estado), normalizar_nome(tipo)
+        candidatos = self.indice_locais.candidatos(
+            chave, LIMIAR_SIMILARIDADE,
+            lambda local_id: self.estados[local_id] == chave_estado and self.tipos[local_id] == chave_tipo,
+        ) if chave else []
+        if candidatos:
+            local_id, valor = candidatos[0]
+            self.registrar_alias("locais", chave, local_id, nome, "similaridade", valor)
+            self.resolucoes["similaridade"] += 1
+            return local_id
+
+        local_id = self.connection.execute(text("""
+            INSERT INTO locais (nome, estado, pais, tipo)
+            VALUES (:nome, :estado, :pais, :tipo)
+            RETURNING id
+        """), {"nome": nome, "estado": estado, "pais": pais, "tipo": tipo}).scalar()
+        self.contar_criada(self.indice_locais, chave)
+        self.adicionar_local(local_id, chave, chave_estado, chave_tipo)
+        return local_id
+
+    def produto(self, p, tipo=None, unidade=None):
+        """Id do produto (nome, formulação e origem), criando-o se não houver correspondente"""
+        if not isinstance(p, dict):
+            print("⚠️ Erro: produto inválido ->", p)
+            return None
+
+        chave = chave_produto(p)
+        if chave in self.produtos:
+            self.resolucoes["exata"] += 1
+            return self.produtos[chave]
+        alias = chave_alias_produto(chave)
+        if ("produtos", alias) in self.aliases:
+            self.resolucoes["alias"] += 1
+            return self.aliases[("produtos", alias)]
+
+        # Só o nome é comparado por similaridade; formulação e origem precisam ser as mesmas
+        candidatos = self.indice_produtos.candidatos(
+            chave[0], LIMIAR_SIMILARIDADE, lambda produto_id: self.variantes[produto_id] == chave[1:]
+        ) if chave[0] else []
+        if candidatos:
+            produto_id, valor = candidatos[0]
+            self.registrar_alias("produtos", alias, produto_id, p.get("nome_produto"), "similaridade", valor)
+            self.resolucoes["similaridade"] += 1
+            return produto_id
+
+        produto_id = self.connection.execute(text("""
+            INSERT INTO produtos (nome_produto, formulacao, origem, tipo, unidade)
+            VALUES (:nome_produto, :formulacao, :origem, :tipo, :unidade)
+            RETURNING id
+        """), {
+            "nome_produto": p.get("nome_produto"),
+            "formulacao": p.get("formulacao"),
+            "origem": p.get("origem"),
+            "tipo": p.get("tipo", tipo),
+            "unidade": p.get("unidade", unidade),
+        }).scalar()
+        self.contar_criada(self.indice_produtos, chave[0])
+        self.adicionar_produto(produto_id, chave)
+        return produto_id
+
+
+# ----------------------- duplicatas já existentes -----------------------
+
+def ler_entidades(connection, entidade):
+    """Produtos ou locais com nome exibido, chave e número de preços que apontam para cada um"""
+    if entidade == "produtos":
+        df = pd.read_sql_query(text("""
+            SELECT p.id, p.nome_produto AS nome, p.formulacao, p.origem, COUNT(pr.id) AS n_precos
+            FROM produtos p LEFT JOIN precos pr ON pr.produto_id = p.id
+            GROUP BY p.id, p.nome_produto, p.formulacao, p.origem ORDER BY p.id
+        """), connection)
+        df['variante'] = [chave_produto({"formulacao": f, "origem": o})[1:] for f, o in zip(df['formulacao'], df['origem'])]
+    else:
+        df = pd.read_sql_query(text("""
+            SELECT l.id, l.nome, l.estado, COUNT(pr.id) AS n_precos
+            FROM locais l LEFT JOIN precos pr ON pr.local_id = l.id
+            GROUP BY l.id, l.nome, l.estado ORDER BY l.id
+        """), connection)
+        df['variante'] = df['estado'].map(normalizar_nome)
+    df['chave'] = df['nome'].map(normalizar_nome)
+    return df
+
+
+def candidatas_duplicatas(engine, entidade, limiar=LIMIAR_CANDIDATAS):
+    """Pares de entidades com nomes parecidos (mesma formulação/origem, ou mesmo estado para locais).
+
+    A sugestão é manter a que tem mais preços (`manter_id`) e fundir a outra (`remover_id`).
+    """
+    with engine.begin() as connection:
+        df = ler_entidades(connection, entidade)
+
+    indice = IndiceNomes()
+    for entidade_id, chave in zip(df['id'], df['chave']):
+        indice.adicionar(entidade_id, chave)
+    linhas = df.set_index('id')
+    compativel = (lambda a, b: a == b) if entidade == "produtos" else (lambda a, b: not a or not b or a == b)
+
+    pares = []
+    for entidade_id, chave, variante in zip(df['id'], df['chave'], df['variante']):
+        for outro_id, valor in indice.candidatos(
+            chave, limiar, lambda i: i > entidade_id and compativel(variante, linhas.at[i, 'variante'])
+        ):
+            a, b = linhas.loc[entidade_id], linhas.loc[outro_id]
+            manter, remover = (entidade_id, outro_id) if a['n_precos'] >= b['n_precos'] else (outro_id, entidade_id)
+            pares.append({
+                "manter_id": manter, "manter_nome": linhas.at[manter, 'nome'],
+                "remover_id": remover, "remover_nome": linhas.at[remover, 'nome'],
+                "similaridade": round(valor, 3),
+                "n_precos_manter": int(linhas.at[manter, 'n_precos']),
+                "n_precos_remover": int(linhas.at[remover, 'n_precos']),
+            })
+    colunas = ["manter_id", "manter_nome", "remover_id", "remover_nome", "similaridade", "n_precos_manter", "n_precos_remover"]
+    return pd.DataFrame(pares, columns=colunas).sort_values("similaridade", ascending=False, ignore_index=True)
+
+
+def tabela_existe(connection, tabela):
+    return connection.execute(text("SELECT to_regclass(:tabela)"), {"tabela": tabela}).scalar() is not None
+
+
+def fundir_entidades(engine, entidade, manter_id, remover_ids, usuario=None):
+    """Funde produtos ou locais duplicados em `manter_id`: repontando os dados, registrando os nomes
+    removidos como aliases (para a próxima importação já cair no certo) e apagando as duplicatas.
+
+    Os caches derivados das entidades envolvidas são apagados; rode as etapas derivadas em seguida.
+    """
+    if entidade not in REFERENCIAS:
+        raise ValueError(f"Entidade inválida: {entidade} (use 'produtos' ou 'locais')")
+    remover_ids = [int(i) for i in remover_ids if int(i) != int(manter_id)]
+    if not remover_ids:
+        return 0
+    params = {"manter": int(manter_id), "remover": remover_ids}
+
+    with engine.begin() as connection:
+        garantir_tabela_aliases(connection)
+        df = ler_entidades(connection, entidade)
+        envolvidas = df[df['id'].isin(remover_ids + [int(manter_id)])].set_index('id')
+        faltando = set(remover_ids + [int(manter_id)]) - set(envolvidas.index)
+        if faltando:
+            raise ValueError(f"{entidade} não encontrado(s): {sorted(faltando)}")
+
+        for tabela, coluna in REFERENCIAS[entidade]:
+            if tabela_existe(connection, tabela):
+                connection.execute(text(f"UPDATE {tabela} SET {coluna} = :manter WHERE {coluna} = ANY(:remover)"), params)
+        if entidade == "produtos" and tabela_existe(connection, "limites_alerta"):
+            # O limite configurado da que fica prevalece; senão, herda o de uma das removidas
+            connection.execute(text("""
+                INSERT INTO limites_alerta (produto_id, limite_pct)
+                SELECT :manter, limite_pct FROM limites_alerta WHERE produto_id = ANY(:remover) LIMIT 1
+                ON CONFLICT (produto_id) DO NOTHING
+            """), params)
+            connection.execute(text("DELETE FROM limites_alerta WHERE produto_id = ANY(:remover)"), params)
+
+        for tabela, coluna in DERIVADAS[entidade]:
+            if tabela_existe(connection, tabela):
+                connection.execute(text(f"DELETE FROM {tabela} WHERE {coluna} = ANY(:manter_e_remover)"),
+                                   {"manter_e_remover": remover_ids + [int(manter_id)]})
+        if entidade == "produtos" and tabela_existe(connection, "sazonalidade_series"):
+            # A sazonalidade é guardada pelo nome do produto
+            nomes = [str(n) for n in envolvidas['nome'].dropna().unique()]
+            connection.execute(text("DELETE FROM sazonalidade WHERE produto = ANY(:nomes)"), {"nomes": nomes})
+            connection.execute(text("DELETE FROM sazonalidade_series WHERE produto = ANY(:nomes)"), {"nomes": nomes})
+
+        # Nomes removidos viram aliases; aliases que apontavam para eles passam para a que fica
+        connection.execute(text("""
+            UPDATE aliases_entidades SET entidade_id = :manter WHERE entidade = :entidade AND entidade_id = ANY(:remover)
+        """), {**params, "entidade": entidade})
+        for remover_id in remover_ids:
+            linha = envolvidas.loc[remover_id]
+            chave = (
+                chave_alias_produto((linha['chave'],) + tuple(linha['variante'])) if entidade == "produtos" else linha['chave']
+            )
+            connection.execute(text("""
+                INSERT INTO aliases_entidades (entidade, chave, entidade_id, nome_original, origem)
+                VALUES (:entidade, :chave, :manter, :nome, 'fusao')
+                ON CONFLICT (entidade, chave) DO UPDATE SET entidade_id = EXCLUDED.entidade_id, origem = 'fusao'
+            """), {"entidade": entidade, "chave": chave, "manter": int(manter_id), "nome": linha['nome']})
+
+        connection.execute(text(f"DELETE FROM {entidade} WHERE id = ANY(:remover)"), params)
+
+        nomes_removidos = ", ".join(str(envolvidas.at[i, 'nome']) for i in remover_ids)
+        registrar_acao(
+            connection, "fusao_entidades",
+            f"🔗 {entidade.capitalize()} fundidos em {envolvidas.at[int(manter_id), 'nome']}: {nomes_removidos}",
+            usuario=usuario,
+        )
+
+    print(f"✅ {len(remover_ids)} duplicata(s) de {entidade} fundida(s) em {manter_id}")
+    return len(remover_ids)
+
+
+def fundir_duplicatas_exatas(engine, entidade, usuario=None):
+    """Funde as entidades cuja chave normalizada é idêntica (só acento, caixa ou pontuação diferentes)"""
+    with engine.begin() as connection:
+        df = ler_entidades(connection, entidade)
+    df['grupo'] = [
+        (chave,) + tuple(variante) if entidade == "produtos" else (chave, variante)
+        for chave, variante in zip(df['chave'], df['variante'])
+    ]
+
+    fundidas = 0
+    for _, grupo in df[df['chave'] != ""].groupby('grupo', sort=False):
+        if len(grupo) > 1:
+            grupo = grupo.sort_values(['n_precos', 'id'], ascending=[False, True])
+            fundidas += fundir_entidades(engine, entidade, grupo['id'].iloc[0], grupo['id'].iloc[1:].tolist(), usuario)
+    return fundidas
@@ -0,0 +1,134 @@
+import os
+import pandas as pd
+from previsao import criar_features_lote, CHAVES_SERIE, VERSAO_FEATURES, HISTORICO_FEATURES
+
+# Features de todas as séries, guardadas em disco para reaproveitamento entre execuções
+ARQUIVO_FEATURE_STORE = os.path.join(os.path.dirname(__file__), "feature_store.pkl")
+
+
+def ler_feature_store(caminho=ARQUIVO_FEATURE_STORE):
+    if not os.path.exists(caminho):
+        return None
+    store = pd.read_pickle(caminho)
+    # Store salvo com outra definição de features é descartado e recalculado
+    if store.attrs.get('versao_features') != VERSAO_FEATURES:
+        return None
+    return store
+
+
+def hashes_linhas(df_series, chaves=CHAVES_SERIE):
+    """Linhas de entrada ordenadas por série e data, com o hash de cada uma e a posição dela na série"""
+    chaves = list(chaves)
+    entrada = df_series.sort_values(chaves + ['data'], kind='mergesort')
+    # O hash por linha é deslocado para que a soma por série não estoure o int64
+    hashes = pd.Series(pd.util.hash_pandas_object(entrada, index=False).to_numpy() >> 20, index=entrada.index).astype('int64')
+    posicao = entrada.groupby(chaves, sort=False, dropna=False).cumcount()
+    return entrada, hashes, posicao
+
+
+def versoes_series(df_series, chaves=CHAVES_SERIE):
+    """Versão de cada série: quantidade de linhas, um hash das colunas de entrada e a última data.
+
+    Qualquer mudança nas linhas de origem (preço retroativo, exclusão desfeita/refeita, outlier remarcado,
+    câmbio ou frete preenchido depois, produtos fundidos) muda a versão da série.
+    """
+    entrada, hashes, _ = hashes_linhas(df_series, chaves)
+    grupos = [entrada[c] for c in chaves]
+    return pd.DataFrame({
+        'linhas': hashes.groupby(grupos, dropna=False).size(),
+        'hash': hashes.groupby(grupos, dropna=False).sum(),
+        'ultima_data': entrada['data'].groupby(grupos, dropna=False).max(),
+    })
+
+
+def series_acrescidas(df_series, anteriores, chaves=CHAVES_SERIE):
+    """Séries que só ganharam linhas no fim desde a versão `anteriores`.
+
+    A série conta como acrescida quando as primeiras `linhas` anteriores (em ordem de data) têm o mesmo
+    hash de antes e todas as linhas novas são posteriores à última data anterior; as features das linhas
+    antigas só olham para trás, então continuam valendo.
+    """
+    chaves = list(chaves)
+    if 'ultima_data' not in anteriores:
+        # Store salvo antes da última data entrar na versão
+        return anteriores.index[:0]
+
+    entrada, hashes, posicao = hashes_linhas(df_series, chaves)
+    anterior = entrada[chaves].merge(anteriores.reset_index(), on=chaves, how='left')
+    linhas_anteriores = anterior['linhas'].to_numpy()
+    grupos = [entrada[c] for c in chaves]
+
+    prefixo = hashes.where(posicao.to_numpy() < linhas_anteriores, 0).groupby(grupos, dropna=False).sum()
+    primeira_nova = entrada['data'].where(posicao.to_numpy() == linhas_anteriores).groupby(grupos, dropna=False).min()
+    comparacao = anteriores.join(pd.DataFrame({'prefixo': prefixo, 'primeira_nova': primeira_nova}), how='inner')
+    return comparacao[
+        (comparacao['prefixo'] == comparacao['hash']) & (comparacao['primeira_nova'] > comparacao['ultima_data'])
+    ].index
+
+
+def atualizar_feature_store(df_series, caminho=ARQUIVO_FEATURE_STORE, completo=False):
+    """Atualiza o feature store recalculando só as séries cuja versão de origem mudou.
+
+    A versão de cada série (linhas, hash das entradas e última data, ver `versoes_series`) fica nos attrs
+    do store. Séries que só ganharam linhas no fim (o caso comum de uma ingestão) calculam só as linhas
+    novas, com as últimas HISTORICO_FEATURES linhas antigas como contexto; séries novas ou editadas
+    (preço retroativo, exclusão, outlier remarcado) são recalculadas por inteiro e as que sumiram da
+    origem são removidas. Com `completo=True` (ou sem store salvo), recalcula tudo.
+    """
+    chaves = list(CHAVES_SERIE)
+    store = None if completo else ler_feature_store(caminho)
+    versoes = versoes_series(df_series, chaves)
+
+    if store is None or store.empty or 'versoes' not in store.attrs:
+        store = criar_features_lote(df_series, chaves)
+        store.attrs.update(versao_features=VERSAO_FEATURES, versoes=versoes)
+        store.to_pickle(caminho)
+        print(f"✅ Feature store recriado com {len(store)} linha(s)")
+        return store
+
+    anteriores = store.attrs['versoes']
+    comparacao = versoes.join(anteriores, how='outer', rsuffix='_anterior')
+    alteradas = comparacao[
+        (comparacao['linhas'] != comparacao['linhas_anterior']) | (comparacao['hash'] != comparacao['hash_anterior'])
+    ].index
+
+    if alteradas.empty:
+        return store
+
+    acrescidas = alteradas[alteradas.isin(series_acrescidas(df_series, anteriores, chaves))]
+    refeitas = alteradas[~alteradas.isin(acrescidas)]
+
+    # Sai do store tudo o que foi editado ou sumiu; entra o recálculo completo das séries novas ou editadas
+    manter = ~store.set_index(chaves).index.isin(refeitas)
+    recalcular = df_series.set_index(chaves).index.isin(refeitas)
+    calculadas = [criar_features_lote(df_series[recalcular], chaves)] if recalcular.any() else []
+
+    if not acrescidas.empty:
+        # Séries acrescidas: só as linhas novas, com o fim do histórico antigo como contexto das janelas
+        entrada, _, posicao = hashes_linhas(df_series, chaves)
+        linhas_anteriores = entrada[chaves].merge(anteriores['linhas'].reset_index(), on=chaves, how='left')['linhas'].to_numpy()
+        contexto = (
+            entrada.set_index(chaves).index.isin(acrescidas)
+            & (posicao.to_numpy() >= linhas_anteriores - HISTORICO_FEATURES)
+        )
+        cauda = criar_features_lote(entrada[contexto].assign(_nova=posicao[contexto] >= linhas_anteriores[contexto]), chaves)
+        calculadas.append(cauda[cauda.pop('_nova').to_numpy()])
+
+    store = pd.concat([store[manter], *calculadas], ignore_index=True)
+    store.attrs.update(versao_features=VERSAO_FEATURES, versoes=versoes)
+    store.to_pickle(caminho)
+    removidas = len(refeitas) - versoes.index.isin(refeitas).sum()
+    print(
+        f"✅ Feature store atualizado: {len(acrescidas)} série(s) acrescida(s), "
+        f"{len(refeitas) - removidas} recalculada(s), {removidas} removida(s)"
+    )
+    return store
+
+
+def serie_do_store(store, produto, origem_id, destino_id):
+    """Linhas de uma série do feature store, em ordem cronológica"""
+    return store[
+        (store['nome_produto'] == produto) &
+        (store['local_id'] == origem_id) &
+        (store['destino_id'] == destino_id)
+    ].sort_values('data')
@@ -0,0 +1,81 @@
+import pandas as pd
+from sqlalchemy import text
+
+# Quantidade de registros mais recentes de cada rota usados na média móvel
+JANELA_MEDIA = 3
+
+
+def garantir_tabela_matriz_fretes(connection):
+    """Cria a matriz origem x destino x modal, se ainda não existir"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS matriz_fretes (
+            origem_id INTEGER,
+            destino_id INTEGER,
+            tipo TEXT,
+            custo_ultimo_brl REAL,
+            custo_medio_brl REAL,
+            n_registros INTEGER,
+            data_ultimo TEXT,
+            atualizado_em TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (origem_id, destino_id, tipo)
+        )
+    """))
+
+
+def calcular_matriz_fretes(fretes_brl, janela=JANELA_MEDIA):
+    """Último custo e média móvel dos últimos `janela` registros de cada rota e modal"""
+    fretes_brl = fretes_brl.dropna(subset=['custo_final_brl']).sort_values(['origem_id', 'destino_id', 'tipo', 'data'])
+    rotas = fretes_brl.groupby(['origem_id', 'destino_id', 'tipo'], dropna=False)
+
+    fretes_brl['custo_medio_brl'] = rotas['custo_final_brl'].transform(
+        lambda s: s.rolling(janela, min_periods=1).mean()
+    )
+    fretes_brl['n_registros'] = rotas['custo_final_brl'].transform('size')
+
+    matriz = rotas.tail(1).rename(columns={'custo_final_brl': 'custo_ultimo_brl', 'data': 'data_ultimo'})
+    matriz['data_ultimo'] = matriz['data_ultimo'].dt.strftime('%Y-%m-%d')
+    return matriz[['origem_id', 'destino_id', 'tipo', 'custo_ultimo_brl', 'custo_medio_brl', 'n_registros', 'data_ultimo']]
+
+
+def atualizar_matriz_fretes(engine, janela=JANELA_MEDIA):
+    """Reconstrói a matriz de custos de frete em BRL a partir dos fretes normalizados na escrita"""
+    with engine.begin() as connection:
+        garantir_tabela_matriz_fretes(connection)
+        fretes = pd.read_sql_query(text("""
+            SELECT origem_id, destino_id, COALESCE(tipo, '') AS tipo, data, custo_final_brl
+            FROM fretes
+        """), connection)
+        fretes['data'] = pd.to_datetime(fretes['data'], errors='coerce')
+
+        matriz = calcular_matriz_fretes(fretes.dropna(subset=['data']), janela)
+
+        connection.execute(text("DELETE FROM matriz_fretes"))
+        if not matriz.empty:
+            matriz.to_sql("matriz_fretes", connection, if_exists="append", index=False)
+
+    print(f"✅ Matriz de fretes atualizada com {len(matriz)} rota(s)")
+    return len(matriz)
+
+
+def ler_matriz_fretes(engine):
+    """Lê a matriz de fretes já com os nomes de origem e destino"""
+    with engine.begin() as connection:
+        garantir_tabela_matriz_fretes(connection)
+        matriz = pd.read_sql_query(text("""
+            SELECT m.origem_id, m.destino_id, l1.nome AS origem, l2.nome AS destino, m.tipo AS tipo_transporte,
+                   m.custo_ultimo_brl, m.custo_medio_brl, m.n_registros, m.data_ultimo
+            FROM matriz_fretes m
+            JOIN locais l1 ON l1.id = m.origem_id
+            JOIN locais l2 ON l2.id = m.destino_id
+        """), connection)
+
+    matriz['data_ultimo'] = pd.to_datetime(matriz['data_ultimo'])
+    return matriz
+
+
+def frete_atual_rota(matriz, origem_id, destino_id):
+    """Custo de frete mais recente (BRL) da rota, considerando o modal com registro mais novo"""
+    rota = matriz[(matriz['origem_id'] == origem_id) & (matriz['destino_id'] == destino_id)]
+    if rota.empty:
+        return None
+    return float(rota.sort_values('data_ultimo')['custo_ultimo_brl'].iloc[-1])
@@ -0,0 +1,197 @@
+import json
+import time
+import numpy as np
+from sqlalchemy import text
+from sklearn.model_selection import TimeSeriesSplit, ParameterSampler
+from sklearn.metrics import mean_absolute_percentage_error
+from threadpoolctl import threadpool_limits
+from previsao import criar_modelo, criar_preprocessador, treinar_melhor_modelo
+from catalogo_modelos import selecionar_candidatos, LATENCIA_PADRAO_S
+from registro_modelos import versao_serie
+from validacao_paralela import nucleos_disponiveis
+
+# Ajuste de hiperparâmetros dos modelos de árvores por successive halving dentro de um orçamento de
+# tempo, com early stopping do XGBoost nos folds temporais. O melhor resultado fica salvo por série
+# e versão dos dados, e as execuções seguintes só leem a tabela. O ajuste respeita o orçamento de
+# núcleos do chamador (no lote, a fatia de cada worker), como a validação cruzada.
+
+ORCAMENTO_AJUSTE_S = 30.0
+CONFIGURACOES_INICIAIS = 9
+FATOR_ELIMINACAO = 3
+PACIENCIA_XGB = 20
+# Fração final do treino de cada fold separada para o early stopping (o fold de validação só mede o MAPE)
+FRACAO_PARADA = 0.2
+
+# Recurso do successive halving: número de árvores da primeira rodada (multiplicado a cada rodada)
+RECURSO_INICIAL = {
+    'xgb': 50,
+    'rf': 25,
+}
+
+ESPACO_BUSCA = {
+    'xgb': {
+        'learning_rate': [0.03, 0.05, 0.08, 0.12],
+        'max_depth': [3, 4, 6, 8],
+        'subsample': [0.7, 0.9, 1.0],
+        'colsample_bytree': [0.7, 0.9, 1.0],
+        'min_child_weight': [1, 3, 5],
+    },
+    'rf': {
+        'max_depth': [5, 10, 15, None],
+        'min_samples_split': [2, 5, 10],
+        'min_samples_leaf': [1, 2, 4],
+        'max_features': [1.0, 0.7, 'sqrt'],
+    },
+}
+
+
+def garantir_tabela_hiperparametros(connection):
+    """Cria a tabela de hiperparâmetros ajustados, se ainda não existir"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS hiperparametros (
+            produto TEXT,
+            origem_id INTEGER,
+            destino_id INTEGER,
+            modelo TEXT,
+            versao_dados TEXT,
+            parametros TEXT,
+            mape REAL,
+            configuracoes_testadas INTEGER,
+            duracao_s REAL,
+            criado_em TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (produto, origem_id, destino_id, modelo, versao_dados)
+        )
+    """))
+
+
+def avaliar_configuracao(nome, parametros, n_arvores, X, y, n_splits=3, n_threads=1):
+    """MAPE médio da configuração nos folds temporais e o número de árvores que ela realmente precisou.
+
+    No XGBoost o early stopping usa as últimas FRACAO_PARADA linhas do treino de cada fold, e as
+    árvores usadas são as da melhor iteração; na RF são as `n_arvores` pedidas. O fold de validação
+    fica de fora das duas coisas e só mede o MAPE. Cada modelo usa no máximo `n_threads` threads.
+    """
+    mapes, arvores = [], []
+    for train_idx, val_idx in TimeSeriesSplit(n_splits=n_splits).split(X):
+        if nome == 'xgb':
+            n_parada = max(1, int(len(train_idx) * FRACAO_PARADA))
+            train_idx, parada_idx = train_idx[:-n_parada], train_idx[-n_parada:]
+        prep = criar_preprocessador(X)
+        X_train = prep.fit_transform(X.iloc[train_idx])
+        X_val = prep.transform(X.iloc[val_idx])
+        y_train, y_val = y.iloc[train_idx], y.iloc[val_idx]
+
+        modelo = criar_modelo(nome, {nome: {**parametros, 'n_estimators': n_arvores, 'n_jobs': n_threads}})
+        with threadpool_limits(limits=n_threads):
+            if nome == 'xgb':
+                modelo.set_params(early_stopping_rounds=PACIENCIA_XGB)
+                eval_set = [(prep.transform(X.iloc[parada_idx]), y.iloc[parada_idx])]
+                modelo.fit(X_train, y_train, eval_set=eval_set, verbose=False)
+                arvores.append(modelo.best_iteration + 1)
+            else:
+                modelo.fit(X_train, y_train)
+                arvores.append(n_arvores)
+
+            mapes.append(mean_absolute_percentage_error(y_val, modelo.predict(X_val)))
+    return float(np.mean(mapes)), int(np.ceil(np.mean(arvores)))
+
+
+def successive_halving(nome, X, y, orcamento_s=ORCAMENTO_AJUSTE_S, seed=42, n_threads=1):
+    """Sorteia configurações e elimina as piores a cada rodada, multiplicando as árvores das sobreviventes.
+
+    Para quando sobra uma configuração ou o orçamento de tempo acaba (a rodada em andamento é interrompida
+    e vale o melhor resultado já medido). Retorna (parametros, mape, configuracoes_testadas).
+    """
+    inicio = time.perf_counter()
+    configuracoes = list(ParameterSampler(ESPACO_BUSCA[nome], n_iter=CONFIGURACOES_INICIAIS, random_state=seed))
+    n_arvores = RECURSO_INICIAL[nome]
+    melhor = (None, np.inf)
+    testadas = 0
+
+    while configuracoes:
+        resultados = []
+        for parametros in configuracoes:
+            if time.perf_counter() - inicio > orcamento_s:
+                break
+            mape, arvores = avaliar_configuracao(nome, parametros, n_arvores, X, y, n_threads=n_threads)
+            testadas += 1
+            resultados.append((mape, parametros, arvores))
+            if mape < melhor[1]:
+                melhor = ({**parametros, 'n_estimators': arvores}, mape)
+
+        if len(resultados) < len(configuracoes) or len(configuracoes) == 1:
+            break
+        resultados.sort(key=lambda r: r[0])
+        configuracoes = [r[1] for r in resultados[:max(1, len(resultados) // FATOR_ELIMINACAO)]]
+        n_arvores *= FATOR_ELIMINACAO
+
+    return melhor[0], melhor[1], testadas
+
+
+def ler_parametros(connection, produto, origem_id, destino_id, versao_dados):
+    """Hiperparâmetros já ajustados para essa série e versão dos dados: dict modelo -> parametros"""
+    registros = connection.execute(text("""
+        SELECT modelo, parametros FROM hiperparametros
+        WHERE produto = :produto AND origem_id = :origem_id AND destino_id = :destino_id
+          AND versao_dados = :versao_dados
+    """), {"produto": produto, "origem_id": int(origem_id), "destino_id": int(destino_id),
+           "versao_dados": versao_dados}).fetchall()
+    return {modelo: json.loads(parametros) for modelo, parametros in registros}
+
+
+def parametros_ajustados(engine, produto, origem_id, destino_id, X, y, modelos, orcamento_s=ORCAMENTO_AJUSTE_S,
+                         orcamento_nucleos=None):
+    """Hiperparâmetros dos `modelos` para a série: lidos da tabela ou ajustados agora e salvos.
+
+    O orçamento de tempo é dividido entre os modelos que ainda não têm ajuste nessa versão dos dados;
+    o ajuste usa no máximo `orcamento_nucleos` threads (padrão: todos os núcleos).
+    """
+    modelos = [m for m in modelos if m in ESPACO_BUSCA]
+    if not modelos:
+        return {}
+
+    versao = versao_serie(X, y)
+    with engine.begin() as connection:
+        garantir_tabela_hiperparametros(connection)
+        parametros = ler_parametros(connection, produto, origem_id, destino_id, versao)
+
+    pendentes = [m for m in modelos if m not in parametros]
+    for nome in pendentes:
+        inicio = time.perf_counter()
+        melhores, mape, testadas = successive_halving(
+            nome, X, y, orcamento_s / len(pendentes), n_threads=orcamento_nucleos or nucleos_disponiveis()
+        )
+        if melhores is None:
+            continue
+        duracao = time.perf_counter() - inicio
+        parametros[nome] = melhores
+
+        with engine.begin() as connection:
+            connection.execute(text("""
+                INSERT INTO hiperparametros (produto, origem_id, destino_id, modelo, versao_dados, parametros,
+                                             mape, configuracoes_testadas, duracao_s)
+                VALUES (:produto, :origem_id, :destino_id, :modelo, :versao_dados, :parametros,
+                        :mape, :testadas, :duracao)
+                ON CONFLICT (produto, origem_id, destino_id, modelo, versao_dados) DO UPDATE
+                SET parametros = EXCLUDED.parametros, mape = EXCLUDED.mape,
+                    configuracoes_testadas = EXCLUDED.configuracoes_testadas,
+                    duracao_s = EXCLUDED.duracao_s, criado_em = NOW()
+            """), {
+                "produto": produto, "origem_id": int(origem_id), "destino_id": int(destino_id),
+                "modelo": nome, "versao_dados": versao, "parametros": json.dumps(melhores),
+                "mape": mape, "testadas": testadas, "duracao": duracao
+            })
+        print(f"✅ Hiperparâmetros de {nome.upper()} ajustados para {produto} {origem_id}→{destino_id} "
+              f"({testadas} configurações, {duracao:.1f}s, MAPE {mape:.2%})")
+
+    return {m: parametros[m] for m in modelos if m in parametros}
+
+
+def treinar_com_ajuste(engine, produto, origem_id, destino_id, X, y, orcamento_ajuste_s=ORCAMENTO_AJUSTE_S,
+                       orcamento_latencia_s=LATENCIA_PADRAO_S, orcamento_nucleos=None, **kwargs):
+    """treinar_melhor_modelo com os hiperparâmetros ajustados (ou salvos) dos candidatos de árvores da série"""
+    candidatos = selecionar_candidatos(len(X), orcamento_latencia_s)
+    parametros = parametros_ajustados(engine, produto, origem_id, destino_id, X, y, candidatos, orcamento_ajuste_s,
+                                      orcamento_nucleos)
+    return treinar_melhor_modelo(X, y, orcamento_latencia_s=orcamento_latencia_s, parametros=parametros,
+                                 orcamento_nucleos=orcamento_nucleos, **kwargs)
@@ -0,0 +1,52 @@
+import pandas as pd
+from sqlalchemy import text
+
+# Junções as-of: cada linha recebe o valor mais recente da tabela de referência até a sua data
+# (por chave, p.ex. rota ou porto), desde que ele não seja mais antigo que a tolerância.
+
+TOLERANCIA_CAMBIO = pd.Timedelta(days=15)
+TOLERANCIA_FRETE = pd.Timedelta(days=60)
+TOLERANCIA_CUSTO_PORTO = pd.Timedelta(days=30)
+
+
+def garantir_indices_asof(connection):
+    """Índices por chave e data que sustentam a leitura ordenada das tabelas de referência"""
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_fretes_rota_data ON fretes (origem_id, destino_id, data)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_cambio_data ON cambio (data)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_custos_portos_porto_data ON custos_portos (porto_id, data)"))
+
+
+def juntar_asof(df, referencia, colunas, chaves=None, chaves_referencia=None, tolerancia=None):
+    """Anexa a `df` as `colunas` da linha mais recente de `referencia` com data <= data da linha.
+
+    `chaves` (em df) e `chaves_referencia` (em referencia, padrão: os mesmos nomes) restringem a busca à
+    mesma série, p.ex. rota ou porto. Linhas sem referência dentro da `tolerancia`, e linhas sem data ou
+    sem chave (que o merge_asof não aceita), ficam com NaN. A ordem e o índice de `df` são preservados.
+    """
+    chaves = list(chaves or [])
+    chaves_referencia = list(chaves_referencia or chaves)
+
+    referencia = referencia[chaves_referencia + ['data'] + list(colunas)].copy()
+    referencia = referencia.rename(columns=dict(zip(chaves_referencia, chaves)))
+    referencia['data'] = pd.to_datetime(referencia['data'], errors='coerce')
+    referencia = referencia.dropna(subset=['data'] + chaves)
+    for chave in chaves:
+        referencia[chave] = referencia[chave].astype(df[chave].dtype)
+    # Vários registros na mesma data e chave (p.ex. modais diferentes) viram a média do dia
+    referencia = referencia.groupby(chaves + ['data'], as_index=False)[list(colunas)].mean()
+
+    esquerda = df.drop(columns=[c for c in colunas if c in df.columns])
+    esquerda = esquerda.assign(
+        data=pd.to_datetime(esquerda['data'], errors='coerce'), _ordem=range(len(esquerda)), _indice=esquerda.index
+    )
+    valida = esquerda[['data'] + chaves].notna().all(axis=1)
+
+    resultado = pd.merge_asof(
+        esquerda[valida].sort_values('data', kind='mergesort'), referencia.sort_values('data', kind='mergesort'),
+        on='data', by=chaves or None, direction='backward', tolerance=tolerancia
+    )
+    if not valida.all():
+        resultado = pd.concat([resultado, esquerda[~valida].reindex(columns=resultado.columns)], ignore_index=True)
+    resultado = resultado.sort_values('_ordem')
+    resultado.index = resultado.pop('_indice').to_numpy()
+    return resultado.drop(columns='_ordem')
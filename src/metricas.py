@@ -0,0 +1,139 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from uuid import uuid4
+import pandas as pd
+from sqlalchemy import text
+
+# Instrumentação da importação: cada etapa (leitura do PDF, divisão, cada chamada ao Gemini, combinação,
+# validação, inserção e etapas derivadas) vira um span com duração, bytes, linhas e tokens. Os spans
+# ficam em memória durante a importação e são gravados de uma vez no fim, numa linha por span,
+# identificados pelo job; o dashboard mostra p50/p95 por etapa nas importações recentes.
+
+# Ordem das etapas no painel (as não listadas vêm depois, em ordem alfabética)
+ORDEM_ETAPAS = ["ler_pdf", "dividir_texto", "gerar_json_estruturado", "combinar_json", "validar_relatorio",
+                "inserir_dados_no_banco", "derivados"]
+
+# Quantas importações recentes entram no cálculo dos percentis
+IMPORTACOES_RECENTES = 20
+
+CAMPOS_SPAN = ["bytes_entrada", "bytes_saida", "linhas", "tokens_entrada", "tokens_saida", "tokens_total", "erro"]
+
+
+def garantir_tabela_metricas(connection):
+    """Cria a tabela de spans da importação, se ainda não existir; roda só nas migrações (migracoes.py)"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS metricas_etapas (
+            id SERIAL PRIMARY KEY,
+            job TEXT,
+            relatorio TEXT,
+            etapa TEXT,
+            parte INTEGER,
+            inicio TIMESTAMP,
+            duracao_ms REAL,
+            bytes_entrada BIGINT,
+            bytes_saida BIGINT,
+            linhas INTEGER,
+            tokens_entrada INTEGER,
+            tokens_saida INTEGER,
+            tokens_total INTEGER,
+            erro TEXT,
+            criado_em TIMESTAMP DEFAULT NOW()
+        )
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_metricas_etapas_job ON metricas_etapas (job)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_metricas_etapas_criado_em ON metricas_etapas (criado_em DESC)"))
+
+
+def tokens_resposta(resposta):
+    """Tokens de entrada, saída e total de uma resposta do Gemini (None quando ausentes)"""
+    uso = getattr(resposta, "usage_metadata", None)
+    return {
+        "tokens_entrada": getattr(uso, "prompt_token_count", None),
+        "tokens_saida": getattr(uso, "candidates_token_count", None),
+        "tokens_total": getattr(uso, "total_token_count", None),
+    }
+
+
+def contar_linhas(dados):
+    """Total de linhas de um JSON de relatório (soma das listas de todas as seções)"""
+    return sum(len(valor) for valor in dados.values() if isinstance(valor, list)) if isinstance(dados, dict) else 0
+
+
+class MetricasImportacao:
+    """Spans de uma importação; `etapa` mede um trecho e `salvar` grava todos de uma vez"""
+
+    def __init__(self, relatorio=None):
+        self.job = uuid4().hex[:12]
+        self.relatorio = relatorio
+        self.spans = []
+
+    @contextmanager
+    def etapa(self, nome, parte=None):
+        """Mede o bloco; o span (dict) é entregue para o bloco preencher bytes, linhas e tokens.
+
+        Uma exceção no bloco fica registrada no span e é relançada.
+        """
+        span = {"etapa": nome, "parte": parte, "inicio": datetime.now(), **dict.fromkeys(CAMPOS_SPAN)}
+        inicio = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span["erro"] = str(e)[:500]
+            raise
+        finally:
+            span["duracao_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+            self.spans.append(span)
+
+    def resumo(self):
+        """Duração total (ms) e tokens por etapa, para logs e para a saída do cli.py"""
+        df = pd.DataFrame(self.spans)
+        if df.empty:
+            return {}
+        agregado = df.groupby("etapa", sort=False).agg(duracao_ms=("duracao_ms", "sum"), tokens_total=("tokens_total", "sum"))
+        return {
+            etapa: {"duracao_ms": round(float(linha.duracao_ms), 2), "tokens_total": int(linha.tokens_total or 0)}
+            for etapa, linha in agregado.iterrows()
+        }
+
+    def salvar(self, engine):
+        """Grava os spans da importação; falhas aqui não derrubam a importação"""
+        if not self.spans:
+            return
+        try:
+            with engine.begin() as connection:
+                connection.execute(text("""
+                    INSERT INTO metricas_etapas (job, relatorio, etapa, parte, inicio, duracao_ms, bytes_entrada,
+                                                 bytes_saida, linhas, tokens_entrada, tokens_saida, tokens_total, erro)
+                    VALUES (:job, :relatorio, :etapa, :parte, :inicio, :duracao_ms, :bytes_entrada,
+                            :bytes_saida, :linhas, :tokens_entrada, :tokens_saida, :tokens_total, :erro)
+                """), [{**span, "job": self.job, "relatorio": self.relatorio} for span in self.spans])
+        except Exception as e:
+            print(f"[ERRO ao salvar métricas da importação]: {e}")
+
+
+def ler_latencias(engine, n_importacoes=IMPORTACOES_RECENTES):
+    """p50/p95 de duração por etapa nas últimas importações, com bytes, linhas e tokens médios por importação"""
+    with engine.connect() as connection:
+        df = pd.read_sql_query(text("""
+            WITH recentes AS (
+                SELECT job FROM metricas_etapas GROUP BY job ORDER BY MAX(criado_em) DESC LIMIT :n
+            )
+            SELECT m.etapa,
+                   COUNT(DISTINCT m.job) AS importacoes,
+                   COUNT(*) AS spans,
+                   PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY m.duracao_ms) AS p50_ms,
+                   PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY m.duracao_ms) AS p95_ms,
+                   SUM(m.bytes_entrada)::REAL / COUNT(DISTINCT m.job) AS bytes_por_importacao,
+                   SUM(m.linhas)::REAL / COUNT(DISTINCT m.job) AS linhas_por_importacao,
+                   SUM(m.tokens_total)::REAL / COUNT(DISTINCT m.job) AS tokens_por_importacao,
+                   COUNT(m.erro) AS erros
+            FROM metricas_etapas m
+            JOIN recentes r ON r.job = m.job
+            GROUP BY m.etapa
+        """), connection, params={"n": n_importacoes})
+
+    ordem = {etapa: i for i, etapa in enumerate(ORDEM_ETAPAS)}
+    # Etapas derivadas ("derivados: barter") ficam junto de "derivados"
+    df['ordem'] = df['etapa'].map(lambda etapa: ordem.get(etapa.split(":")[0], len(ORDEM_ETAPAS)))
+    return df.sort_values(['ordem', 'etapa']).drop(columns='ordem').reset_index(drop=True)
@@ -0,0 +1,67 @@
+from sqlalchemy import text
+from juncoes_asof import garantir_indices_asof
+from outliers import garantir_colunas_outlier
+from moedas import garantir_colunas_moeda
+from alertas import garantir_tabelas_alertas
+from metricas import garantir_tabela_metricas
+
+# Migrações do esquema das tabelas principais (precos, fretes, cambio, custos_portos): colunas e índices
+# que as funcionalidades acrescentaram a elas, e as tabelas auxiliares (alertas, métricas da importação).
+# ALTER TABLE e CREATE INDEX pegam locks fortes nessas tabelas mesmo quando não há nada a fazer, então
+# rodam uma vez por versão do esquema, na inicialização do app, do servidor HTTP e do cli.py (ou com
+# `python cli.py migrar`), e nunca no caminho de leitura.
+# Para mudar o esquema: acrescente a função em MIGRACOES e incremente VERSAO_ESQUEMA.
+
+VERSAO_ESQUEMA = 3
+
+MIGRACOES = [
+    garantir_indices_asof, garantir_colunas_outlier, garantir_colunas_moeda, garantir_tabelas_alertas,
+    garantir_tabela_metricas,
+]
+
+# Chave do pg_advisory_xact_lock que impede dois processos de migrarem ao mesmo tempo
+CHAVE_TRAVA_MIGRACAO = 4_827_001
+
+# Processos que já conferiram a versão do esquema não consultam de novo
+_esquema_conferido = False
+
+
+def garantir_tabela_versao(connection):
+    """Cria a tabela com o histórico de versões do esquema aplicadas, se ainda não existir"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS versao_esquema (
+            versao INTEGER PRIMARY KEY,
+            aplicada_em TIMESTAMP DEFAULT NOW()
+        )
+    """))
+
+
+def versao_aplicada(connection):
+    return connection.execute(text("SELECT COALESCE(MAX(versao), 0) FROM versao_esquema")).scalar()
+
+
+def migrar(engine, forcar=False):
+    """Aplica as migrações se o banco estiver numa versão anterior (ou com `forcar`); retorna se aplicou"""
+    with engine.begin() as connection:
+        garantir_tabela_versao(connection)
+        if versao_aplicada(connection) >= VERSAO_ESQUEMA and not forcar:
+            return False
+        connection.execute(text("SELECT pg_advisory_xact_lock(:chave)"), {"chave": CHAVE_TRAVA_MIGRACAO})
+        # Outro processo pode ter migrado enquanto este esperava a trava
+        if versao_aplicada(connection) >= VERSAO_ESQUEMA and not forcar:
+            return False
+        for migracao in MIGRACOES:
+            migracao(connection)
+        connection.execute(text("""
+            INSERT INTO versao_esquema (versao) VALUES (:versao) ON CONFLICT (versao) DO NOTHING
+        """), {"versao": VERSAO_ESQUEMA})
+    print(f"✅ Esquema migrado para a versão {VERSAO_ESQUEMA}")
+    return True
+
+
+def garantir_esquema(engine):
+    """Migra o esquema na primeira chamada do processo; as seguintes não tocam no banco"""
+    global _esquema_conferido
+    if not _esquema_conferido:
+        migrar(engine)
+        _esquema_conferido = True
@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from juncoes_asof import juntar_asof, TOLERANCIA_CAMBIO
+from acoes import filtro_faixas, listar_faixas
+
+# Normalização de moeda na escrita: cada linha de preço, frete e custo portuário ganha os valores em USD
+# e em BRL pela cotação as-of da sua data (a mais recente até ela, dentro de TOLERANCIA_CAMBIO), além da
+# cotação e da data usadas. Linhas sem cotação ficam pendentes e são preenchidas pelo backfill quando
+# a cotação chega; o backfill também refaz linhas para as quais chegou uma cotação mais próxima.
+
+# Moedas que a normalização sabe converter (só há cotação USD/BRL); as demais ficariam sem valor normalizado
+MOEDAS_SUPORTADAS = ["USD", "BRL"]
+
+# tabela -> colunas normalizadas (além de usd_brl_aplicado e data_cambio)
+COLUNAS_MOEDA = {
+    "precos": ["preco_min_usd", "preco_min_brl", "preco_max_usd", "preco_max_brl"],
+    "fretes": ["custo_final_usd", "custo_final_brl"],
+    "custos_portos": ["custo_total_usd", "custo_total_brl"],
+}
+
+# Colunas originais lidas de cada tabela para calcular a normalização
+COLUNAS_ORIGINAIS = {
+    "precos": ["moeda", "preco_min", "preco_max"],
+    "fretes": ["custo_usd", "custo_brl"],
+    "custos_portos": ["custo_total"],
+}
+
+
+def garantir_colunas_moeda(connection):
+    """Cria as colunas normalizadas em USD/BRL e os índices de pendências e de agregação, se não existirem"""
+    for tabela, colunas in COLUNAS_MOEDA.items():
+        adicionar = ",\n".join(
+            f"ADD COLUMN IF NOT EXISTS {coluna} REAL"
+            for coluna in colunas + ["usd_brl_aplicado"]
+        )
+        connection.execute(text(f"ALTER TABLE {tabela} {adicionar}, ADD COLUMN IF NOT EXISTS data_cambio TEXT"))
+        # Linhas ainda sem cotação: o que o backfill procura primeiro
+        connection.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS idx_{tabela}_cambio_pendente ON {tabela} (data) WHERE usd_brl_aplicado IS NULL
+        """))
+    # Agregações entre moedas por produto e data sem voltar à tabela
+    connection.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_precos_produto_data_moedas
+        ON precos (produto_id, data) INCLUDE (preco_min_brl, preco_min_usd)
+    """))
+
+
+def converter(tabela, df):
+    """Valores em USD e BRL das linhas de `df` (com usd_brl já anexado), conforme a moeda de origem"""
+    taxa = df['usd_brl']
+    if tabela == "precos":
+        moeda = df['moeda'].astype(str).str.upper().str.strip()
+        for coluna in ['preco_min', 'preco_max']:
+            df[f'{coluna}_usd'] = np.select([moeda == 'USD', moeda == 'BRL'], [df[coluna], df[coluna] / taxa], np.nan)
+            df[f'{coluna}_brl'] = np.select([moeda == 'BRL', moeda == 'USD'], [df[coluna], df[coluna] * taxa], np.nan)
+    elif tabela == "fretes":
+        # O relatório pode trazer só uma das moedas; a informada sempre prevalece
+        df['custo_final_usd'] = df['custo_usd'].where(df['custo_usd'].notna(), df['custo_brl'] / taxa)
+        df['custo_final_brl'] = df['custo_brl'].where(df['custo_brl'].notna(), df['custo_usd'] * taxa)
+    elif tabela == "custos_portos":
+        # Custos de portos brasileiros, informados em BRL
+        df['custo_total_usd'] = df['custo_total'] / taxa
+        df['custo_total_brl'] = df['custo_total']
+    return df
+
+
+def calcular_normalizacao(tabela, df, cambio):
+    """Anexa a cotação as-of e calcula as colunas normalizadas de `tabela` para as linhas de `df`"""
+    df = df.copy()
+    df['data'] = pd.to_datetime(df['data'], errors='coerce')
+    for coluna in COLUNAS_ORIGINAIS[tabela]:
+        if coluna != 'moeda':
+            df[coluna] = pd.to_numeric(df[coluna], errors='coerce')
+
+    com_data = df[df['data'].notna()]
+    com_data = juntar_asof(com_data, cambio, ['usd_brl', 'data_cambio'], tolerancia=TOLERANCIA_CAMBIO)
+    df = df.drop(columns=['usd_brl', 'data_cambio'], errors='ignore').join(com_data[['usd_brl', 'data_cambio']])
+
+    df = converter(tabela, df)
+    df['usd_brl_aplicado'] = df['usd_brl']
+    df['data_cambio'] = pd.to_datetime(df['data_cambio']).dt.strftime('%Y-%m-%d')
+    return df
+
+
+def ler_cambio(connection):
+    """Cotações válidas, com a própria data repetida em data_cambio para a junção as-of"""
+    cambio = pd.read_sql_query(text("SELECT data, usd_brl FROM cambio WHERE usd_brl IS NOT NULL"), connection)
+    cambio['data_cambio'] = pd.to_datetime(cambio['data'], errors='coerce')
+    return cambio
+
+
+def normalizar_moedas(connection, faixas=None):
+    """Preenche as colunas normalizadas e grava só as linhas que mudaram; retorna o total atualizado.
+
+    Com `faixas` (tabela -> [[primeiro_id, ultimo_id], ...], como no log de ações), processa só as linhas
+    recém-inseridas. Sem `faixas` é o backfill: linhas pendentes e linhas para as quais chegou uma
+    cotação mais próxima da sua data do que a usada.
+    """
+    cambio = ler_cambio(connection)
+    atualizadas = 0
+
+    for tabela, colunas in COLUNAS_MOEDA.items():
+        if faixas is not None:
+            if tabela not in faixas:
+                continue
+            filtro, params = filtro_faixas(listar_faixas(faixas)[tabela])
+        else:
+            filtro = """usd_brl_aplicado IS NULL OR EXISTS (
+                SELECT 1 FROM cambio c WHERE c.data > t.data_cambio AND c.data <= t.data AND c.usd_brl IS NOT NULL
+            )"""
+            params = {}
+
+        df = pd.read_sql_query(text(f"""
+            SELECT id, data, {", ".join(COLUNAS_ORIGINAIS[tabela] + colunas + ["usd_brl_aplicado", "data_cambio"])}
+            FROM {tabela} t
+            WHERE {filtro}
+        """), connection, params=params)
+        if df.empty:
+            continue
+
+        atual = df[colunas + ['usd_brl_aplicado', 'data_cambio']].copy()
+        novo = calcular_normalizacao(tabela, df, cambio)
+
+        mudou = novo['data_cambio'].fillna('') != atual['data_cambio'].fillna('')
+        for coluna in colunas + ['usd_brl_aplicado']:
+            mudou |= ~np.isclose(novo[coluna].astype(float), atual[coluna].astype(float), equal_nan=True)
+        if not mudou.any():
+            continue
+
+        registros = [
+            {chave: (None if pd.isna(valor) else valor) for chave, valor in linha.items()}
+            for linha in novo.loc[mudou, ['id'] + colunas + ['usd_brl_aplicado', 'data_cambio']].to_dict(orient='records')
+        ]
+        connection.execute(text(f"""
+            UPDATE {tabela}
+            SET {", ".join(f"{coluna} = :{coluna}" for coluna in colunas + ["usd_brl_aplicado", "data_cambio"])}
+            WHERE id = :id
+        """), registros)
+        atualizadas += len(registros)
+
+    return atualizadas
+
+
+def atualizar_moedas(engine):
+    """Backfill da normalização de moeda (etapa derivada, depois de importações e de cotações atrasadas)"""
+    with engine.begin() as connection:
+        atualizadas = normalizar_moedas(connection)
+    print(f"✅ Moedas normalizadas: {atualizadas} linha(s) atualizada(s)")
+    return atualizadas
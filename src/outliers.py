@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# Filtro de Hampel por série (produto x local): um preço é outlier quando se afasta da mediana móvel
+# centrada por mais de LIMIAR_HAMPEL desvios robustos (1,4826 x MAD móvel). O score usa o preço em BRL
+# normalizado na escrita (moedas.py), para que uma série com cotações em USD e BRL não marque a troca de moeda.
+# A marcação fica gravada em precos e só é recalculada depois de importações e alterações.
+
+JANELA_HAMPEL = 7
+LIMIAR_HAMPEL = 3.0
+MINIMO_JANELA = 3
+# Piso do desvio robusto, relativo à mediana, para séries quase constantes não marcarem qualquer variação
+PISO_RELATIVO = 0.005
+
+
+def garantir_colunas_outlier(connection):
+    """Cria as colunas de marcação de outlier em precos e o índice parcial das linhas marcadas"""
+    connection.execute(text("""
+        ALTER TABLE precos
+            ADD COLUMN IF NOT EXISTS outlier BOOLEAN DEFAULT FALSE,
+            ADD COLUMN IF NOT EXISTS outlier_score REAL,
+            ADD COLUMN IF NOT EXISTS outlier_revisado BOOLEAN DEFAULT FALSE
+    """))
+    connection.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_precos_outlier ON precos (produto_id, local_id, data) WHERE outlier
+    """))
+
+
+def calcular_scores_hampel(df, coluna='preco_min', chaves=('produto_id', 'local_id')):
+    """Score de Hampel de cada linha, calculado em todas as séries de uma vez (rolling agrupado).
+
+    Retorna uma Series alinhada ao índice de `df`; linhas sem janela suficiente ficam com NaN.
+    """
+    chaves = list(chaves)
+    indice_original = df.index
+    df = df.sort_values(chaves + ['data', 'id'], kind='mergesort')
+
+    def mediana_movel(valores):
+        return (
+            valores.groupby([df[c] for c in chaves], sort=False)
+            .rolling(JANELA_HAMPEL, center=True, min_periods=MINIMO_JANELA).median()
+            .reset_index(level=list(range(len(chaves))), drop=True)
+        )
+
+    mediana = mediana_movel(df[coluna])
+    desvio = (df[coluna] - mediana).abs()
+    mad = mediana_movel(desvio)
+
+    escala = np.maximum(1.4826 * mad, PISO_RELATIVO * mediana.abs())
+    return (desvio / escala.replace(0, np.nan)).reindex(indice_original)
+
+
+def atualizar_outliers(engine):
+    """Recalcula score e marcação de todos os preços e grava só as linhas que mudaram.
+
+    Linhas revisadas manualmente mantêm a marcação escolhida (o score continua sendo atualizado).
+    Linhas ainda sem valor em BRL (sem cotação) ficam sem score e sem marcação.
+    """
+    with engine.begin() as connection:
+        df = pd.read_sql_query(text("""
+            SELECT id, produto_id, local_id, data, preco_min_brl, outlier, outlier_score
+            FROM precos
+        """), connection)
+
+        if df.empty:
+            return 0
+
+        df['data'] = pd.to_datetime(df['data'], errors='coerce')
+        com_brl = df.dropna(subset=['preco_min_brl'])
+        score = calcular_scores_hampel(com_brl, coluna='preco_min_brl').reindex(df.index)
+        marcado = (score > LIMIAR_HAMPEL).fillna(False)
+
+        mudou = (marcado != df['outlier'].fillna(False).astype(bool)) | ~np.isclose(
+            score.astype(float), df['outlier_score'].astype(float), equal_nan=True
+        )
+        alteracoes = [
+            {"id": int(i), "outlier": bool(o), "score": None if pd.isna(s) else float(s)}
+            for i, o, s in zip(df.loc[mudou, 'id'], marcado[mudou], score[mudou])
+        ]
+        if alteracoes:
+            connection.execute(text("""
+                UPDATE precos
+                SET outlier = CASE WHEN outlier_revisado THEN outlier ELSE :outlier END,
+                    outlier_score = :score
+                WHERE id = :id
+            """), alteracoes)
+
+    print(f"✅ Outliers recalculados: {int(marcado.sum())} marcado(s), {len(alteracoes)} linha(s) atualizada(s)")
+    return int(marcado.sum())
+
+
+def ler_outliers(engine, limite=200):
+    """Preços marcados como outlier (ou revisados), com o score, para revisão na interface"""
+    with engine.begin() as connection:
+        df = pd.read_sql_query(text("""
+            SELECT pr.id, p.nome_produto AS produto, l.nome AS localizacao, pr.data, pr.preco_min AS preco,
+                   pr.moeda, pr.outlier_score, pr.outlier, pr.outlier_revisado
+            FROM precos pr
+            JOIN produtos p ON p.id = pr.produto_id
+            JOIN locais l ON l.id = pr.local_id
+            WHERE pr.outlier OR pr.outlier_revisado
+            ORDER BY pr.outlier_score DESC NULLS LAST
+            LIMIT :limite
+        """), connection, params={"limite": limite})
+    df['data'] = pd.to_datetime(df['data'], errors='coerce')
+    return df
+
+
+def revisar_outliers(connection, marcacoes):
+    """Grava a revisão manual: `marcacoes` é um dict preco_id -> é outlier (bool)"""
+    if not marcacoes:
+        return
+    connection.execute(text("""
+        UPDATE precos SET outlier = :outlier, outlier_revisado = TRUE WHERE id = :id
+    """), [{"id": int(i), "outlier": bool(o)} for i, o in marcacoes.items()])
@@ -3,17 +3,19 @@ import pandas as pd
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
 import os
-from datetime import timedelta
-from sklearn.model_selection import TimeSeriesSplit
-from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.pipeline import Pipeline
-from sklearn.metrics import mean_absolute_percentage_error, mean_absolute_error, mean_squared_error
-from sklearn.ensemble import RandomForestRegressor
-from xgboost import XGBRegressor
+import time
 import plotly.graph_objects as go
-import numpy as np
-from scipy import stats
+from fretes import ler_matriz_fretes, frete_atual_rota
+from custo_entregue import ler_custos_entregues
+from previsao import (
+    carregar_dados, preparar_serie, preparar_dados_modelo,
+    prever_futuro, prever_cenarios, simular_monte_carlo, resumir_monte_carlo, analisar_tendencia,
+    MINIMO_REGISTROS, N_CAMINHOS, LIMIAR_CENARIO
+)
+from previsao_lote import ler_previsoes_lote
+from registro_modelos import obter_modelo, versao_serie
+from hiperparametros import treinar_com_ajuste
+from migracoes import garantir_esquema
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -21,6 +23,7 @@ warnings.filterwarnings('ignore')
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 engine = create_engine(DATABASE_URL)
+garantir_esquema(engine)
 
 # Configuração da página
 st.set_page_config(
@@ -60,169 +63,47 @@ with st.sidebar:
 st.title("📈 Página de Previsões")
 
 @st.cache_data
-def carregar_dados():
-    df = pd.read_sql_query("""
-        SELECT pr.data, pr.preco_min, pr.variacao, pr.modalidade, pr.moeda,
-               p.nome_produto, p.formulacao, p.origem AS origem_produto, p.tipo AS tipo_produto, p.unidade,
-               l.id as local_id, l.nome AS local, l.estado, l.pais, l.tipo AS tipo_local,
-               c.usd_brl, co.custo_total
-        FROM precos pr
-        JOIN produtos p ON pr.produto_id = p.id
-        JOIN locais l ON pr.local_id = l.id
-        LEFT JOIN cambio c ON pr.data = c.data
-        LEFT JOIN custos_portos co ON co.data = pr.data AND co.porto_id = l.id
-    """, engine)
-
-    fretes = pd.read_sql_query("""
-        SELECT data, origem_id, destino_id, tipo, custo_usd, custo_brl
-        FROM fretes
-    """, engine)
-
-    locais = pd.read_sql_query("SELECT id, nome FROM locais", engine)
-    
-    df['data'] = pd.to_datetime(df['data'])
-    df['mes'] = df['data'].dt.month
-    df['ano'] = df['data'].dt.year
-    df['custo_total'] = df['custo_total'].fillna(0)
-    df['usd_brl'] = df['usd_brl'].fillna(method='ffill')
-    fretes['data'] = pd.to_datetime(fretes['data'])
-
-    return df, fretes, locais
-
-def detectar_outliers(df, coluna, metodo='iqr'):
-    """Detecta e remove outliers usando IQR ou Z-score"""
-    if metodo == 'iqr':
-        Q1 = df[coluna].quantile(0.25)
-        Q3 = df[coluna].quantile(0.75)
-        IQR = Q3 - Q1
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
-        return df[(df[coluna] >= lower_bound) & (df[coluna] <= upper_bound)]
-    else:  # z-score
-        z_scores = np.abs(stats.zscore(df[coluna]))
-        return df[z_scores < 3]
-
-def criar_features_avancadas(df):
-    """Cria features temporais e de lag mais sofisticadas"""
-    df_sorted = df.sort_values('data').copy()
-    
-    # Features temporais avançadas
-    df_sorted['trimestre'] = df_sorted['data'].dt.quarter
-    df_sorted['dia_semana'] = df_sorted['data'].dt.dayofweek
-    df_sorted['dia_mes'] = df_sorted['data'].dt.day
-    df_sorted['semana_ano'] = df_sorted['data'].dt.isocalendar().week
-    
-    # Sazonalidade cíclica
-    df_sorted['mes_sin'] = np.sin(2 * np.pi * df_sorted['mes'] / 12)
-    df_sorted['mes_cos'] = np.cos(2 * np.pi * df_sorted['mes'] / 12)
-    df_sorted['trimestre_sin'] = np.sin(2 * np.pi * df_sorted['trimestre'] / 4)
-    df_sorted['trimestre_cos'] = np.cos(2 * np.pi * df_sorted['trimestre'] / 4)
-    
-    # Features de lag melhoradas
-    for lag in [1, 2, 3, 7, 15, 30]:
-        if len(df_sorted) > lag * 2:
-            df_sorted[f'valor_lag_{lag}'] = df_sorted['valor_entregue'].shift(lag)
-            df_sorted[f'preco_lag_{lag}'] = df_sorted['preco_min'].shift(lag)
-    
-    # Médias móveis de diferentes janelas
-    for window in [3, 7, 15, 30]:
-        if len(df_sorted) > window * 2:
-            df_sorted[f'ma_{window}'] = df_sorted['valor_entregue'].rolling(window=window).mean()
-            df_sorted[f'std_{window}'] = df_sorted['valor_entregue'].rolling(window=window).std()
-    
-    # Features de volatilidade
-    df_sorted['volatilidade_7d'] = df_sorted['valor_entregue'].rolling(window=7).std()
-    df_sorted['volatilidade_30d'] = df_sorted['valor_entregue'].rolling(window=30).std()
-    
-    # Tendências
-    df_sorted['tendencia_7d'] = (df_sorted['valor_entregue'] / df_sorted['valor_entregue'].shift(7)) - 1
-    df_sorted['tendencia_30d'] = (df_sorted['valor_entregue'] / df_sorted['valor_entregue'].shift(30)) - 1
-    
-    # Features de câmbio
-    df_sorted['usd_volatilidade'] = df_sorted['usd_brl'].rolling(window=7).std()
-    df_sorted['usd_tendencia'] = (df_sorted['usd_brl'] / df_sorted['usd_brl'].shift(7)) - 1
-    
-    # Razões importantes
-    df_sorted['ratio_frete_preco'] = df_sorted['frete_final'] / df_sorted['preco_min']
-    df_sorted['ratio_custo_preco'] = df_sorted['custo_total'] / df_sorted['preco_min']
-    
-    return df_sorted
-
-def validacao_temporal(pipeline, X, y, n_splits=3):
-    """Validação temporal usando TimeSeriesSplit"""
-    tscv = TimeSeriesSplit(n_splits=n_splits)
-    scores = {'mae': [], 'rmse': [], 'mape': []}
-    
-    for train_idx, val_idx in tscv.split(X):
-        X_train, X_val = X.iloc[train_idx], X.iloc[val_idx]
-        y_train, y_val = y.iloc[train_idx], y.iloc[val_idx]
-        
-        pipeline.fit(X_train, y_train)
-        y_pred = pipeline.predict(X_val)
-        
-        scores['mae'].append(mean_absolute_error(y_val, y_pred))
-        scores['rmse'].append(np.sqrt(mean_squared_error(y_val, y_pred)))
-        scores['mape'].append(mean_absolute_percentage_error(y_val, y_pred))
-    
-    return {
-        'MAE': np.mean(scores['mae']),
-        'RMSE': np.mean(scores['rmse']),
-        'MAPE': np.mean(scores['mape']),
-        'MAE_std': np.std(scores['mae']),
-        'RMSE_std': np.std(scores['rmse']),
-        'MAPE_std': np.std(scores['mape'])
-    }
-
-def criar_ensemble_model():
-    """Cria um ensemble de modelos para melhor performance"""
-    models = {
-        'xgb': XGBRegressor(
-            n_estimators=300,
-            learning_rate=0.08,
-            max_depth=6,
-            subsample=0.9,
-            colsample_bytree=0.9,
-            random_state=42,
-            n_jobs=-1
-        ),
-        'rf': RandomForestRegressor(
-            n_estimators=200,
-            max_depth=10,
-            min_samples_split=5,
-            min_samples_leaf=2,
-            random_state=42,
-            n_jobs=-1
+def carregar_dados_cache():
+    return carregar_dados(engine)
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def obter_modelo_cache(produto, origem_id, destino_id, features, versao, _X, _y):
+    """Pipeline treinado em memória; a chave inclui a versão dos dados, então mudar
+    horizonte ou cenário nunca retreina. Fora da memória, busca no registro persistente."""
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+
+    def treinar(X, y):
+        # Hiperparâmetros ajustados uma vez por série e versão dos dados; depois só lidos da tabela
+        status_text.text("🎛️ Buscando hiperparâmetros ajustados...")
+        return treinar_com_ajuste(
+            engine, produto, origem_id, destino_id, X, y,
+            callback_progresso=lambda p, msg: (progress_bar.progress(p), status_text.text(msg))
         )
-    }
-    return models
-
-def calcular_intervalos_confianca(predictions, confidence_level=0.95):
-    """Calcula intervalos de confiança usando bootstrap"""
-    n_bootstrap = 100
-    bootstrap_preds = []
-    
-    for _ in range(n_bootstrap):
-        # Adiciona ruído baseado na variabilidade histórica
-        noise = np.random.normal(0, np.std(predictions) * 0.1, len(predictions))
-        bootstrap_preds.append(predictions + noise)
-    
-    bootstrap_preds = np.array(bootstrap_preds)
-    alpha = 1 - confidence_level
-    
-    lower = np.percentile(bootstrap_preds, (alpha/2) * 100, axis=0)
-    upper = np.percentile(bootstrap_preds, (1 - alpha/2) * 100, axis=0)
-    
-    return lower, upper
+
+    resultado = obter_modelo(engine, produto, origem_id, destino_id, _X, _y, treinar)
+    progress_bar.empty()
+    status_text.empty()
+    return resultado
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def simular_monte_carlo_cache(produto, origem_id, destino_id, versao, nome_modelo, meses_futuros, frete_rota,
+                              _modelo, _X, _df_clean):
+    """Caminhos de Monte Carlo de uma série, simulados uma vez por modelo, versão dos dados, horizonte e frete;
+    usados pelo cenário escolhido, pela comparação de cenários e pelo leque. Retorna (datas, caminhos, segundos)."""
+    inicio = time.perf_counter()
+    datas, caminhos = simular_monte_carlo(_modelo, _X, _df_clean, meses_futuros, frete_base=frete_rota)
+    return datas, caminhos, time.perf_counter() - inicio
 
 # Carregamento dos dados
-df, fretes, locais = carregar_dados()
+df, fretes, locais = carregar_dados_cache()
 
 st.subheader("🔧 Parâmetros da previsão")
 
 produto = st.selectbox("Produto", sorted(df['nome_produto'].dropna().unique()))
 df_prod = df[df['nome_produto'] == produto]
 
-if df_prod.empty or df_prod['local'].dropna().empty or len(df_prod) < 10:
+if df_prod.empty or df_prod['local'].dropna().empty or len(df_prod) < MINIMO_REGISTROS:
     st.warning(
         "📦 Ainda não é possível gerar previsões para este produto.\n\n"
         "É necessário pelo menos **10 registros históricos com origem válida** para ativar o modelo."
@@ -237,6 +118,24 @@ destinos = locais[locais['id'] != origem_id]
 destino_nome = st.selectbox("Destino (cliente)", sorted(destinos['nome']))
 destino_id = destinos[destinos['nome'] == destino_nome]['id'].iloc[0]
 
+# Comparação entre origens: consulta à matriz de custo entregue pré-calculada, sem treinar modelo
+with st.expander(f"🏁 Custo entregue hoje em {destino_nome}, por origem"):
+    custos_destino = ler_custos_entregues(engine, destino_id=destino_id)
+    custos_destino = custos_destino[custos_destino['produto'] == produto]
+    if custos_destino.empty:
+        st.info("Nenhuma origem com preço e frete recentes até este destino.")
+    else:
+        mais_barata = custos_destino.iloc[0]
+        st.caption(
+            f"Origem mais barata: **{mais_barata['origem']}** (R$ {mais_barata['custo_entregue_brl']:,.2f}). "
+            "Último preço de cada origem em BRL (câmbio da data do preço) + custo portuário + frete mais barato."
+        )
+        st.dataframe(
+            custos_destino[['origem', 'custo_entregue_brl', 'preco_brl', 'moeda_preco', 'data_preco',
+                            'custo_porto_brl', 'frete_brl', 'tipo_frete', 'data_frete']],
+            hide_index=True, use_container_width=True
+        )
+
 meses_futuros = st.slider("Meses futuros para prever:", min_value=1, max_value=12, value=6)
 
 cenario = st.selectbox("Cenário de tendência para previsão futura:", [
@@ -244,100 +143,59 @@ cenario = st.selectbox("Cenário de tendência para previsão futura:", [
 ])
 
 # Preparação dos dados melhorada
-df_merge = df_prod[df_prod['local'] == origem].copy()
-frete_match = fretes[(fretes['origem_id'] == origem_id) & (fretes['destino_id'] == destino_id)]
-df_merge = df_merge.merge(frete_match[['data', 'custo_brl', 'custo_usd']], on='data', how='left')
-
-df_merge['custo_brl'] = df_merge['custo_brl'].fillna(0)
-df_merge['custo_usd'] = df_merge['custo_usd'].fillna(0)
-df_merge['frete_final'] = df_merge['custo_brl'] + (df_merge['custo_usd'] * df_merge['usd_brl'])
-df_merge['valor_entregue'] = df_merge['preco_min'] + df_merge['frete_final']
-
-
-# Detecção e remoção de outliers
-df_merge_clean = detectar_outliers(df_merge, 'valor_entregue', 'iqr')
-outliers_removidos = len(df_merge) - len(df_merge_clean)
+df_merge = preparar_serie(df, fretes, produto, origem_id, destino_id)
+df_clean, features_to_use, outliers_removidos = preparar_dados_modelo(df_merge)
 
 if outliers_removidos > 0:
-    st.info(f"🧹 Removidos {outliers_removidos} outliers para melhor qualidade do modelo")
-
-# Criar features avançadas
-df_merge_clean = criar_features_avancadas(df_merge_clean)
-
-# Seleção inteligente de features
-base_features = [
-    'formulacao', 'origem_produto', 'tipo_produto', 'unidade', 'estado', 'pais',
-    'tipo_local', 'modalidade', 'moeda', 'variacao', 'usd_brl',
-    'custo_total', 'frete_final', 'mes', 'ano', 'trimestre', 'dia_semana',
-    'mes_sin', 'mes_cos', 'trimestre_sin', 'trimestre_cos',
-    'ratio_frete_preco', 'ratio_custo_preco'
-]
-
-# Features avançadas condicionais
-advanced_features = []
-for col in df_merge_clean.columns:
-    if any(x in col for x in ['lag_', 'ma_', 'std_', 'volatilidade', 'tendencia']):
-        if df_merge_clean[col].notna().sum() > len(df_merge_clean) * 0.5:  # 50% de dados válidos
-            advanced_features.append(col)
-
-all_features = base_features + advanced_features
-
-# Filtrar dados válidos
-df_clean = df_merge_clean.dropna(subset=base_features + ['valor_entregue']).copy()
-
-# Usar features avançadas apenas se tiver dados suficientes
-if len(df_clean) >= 50 and advanced_features:
-    df_with_advanced = df_merge_clean.dropna(subset=all_features + ['valor_entregue']).copy()
-    if len(df_with_advanced) >= 10:
-        df_clean = df_with_advanced
-        features_to_use = all_features
-    else:
-        features_to_use = base_features
-else:
-    features_to_use = base_features
+    st.info(f"🧹 {outliers_removidos} preço(s) marcados como outlier na ingestão ficaram fora do modelo")
+
+# A rota só tem dados onde há frete dentro da tolerância da data do preço
+if len(df_clean) < MINIMO_REGISTROS:
+    st.warning(
+        f"🚚 Ainda não é possível gerar previsões de **{origem}** para **{destino_nome}**.\n\n"
+        f"A rota tem {len(df_clean)} registro(s) com preço e frete próximos; são necessários pelo menos "
+        f"**{MINIMO_REGISTROS}** para ativar o modelo."
+    )
+    st.stop()
 
 X = df_clean[features_to_use]
 y = df_clean['valor_entregue']
 
-# Preparação do pipeline melhorado
-categorical_cols = X.select_dtypes(include='object').columns.tolist()
-numeric_cols = X.select_dtypes(include=['float64', 'int64']).columns.tolist()
+versao = versao_serie(X, y)
 
-preprocessor = ColumnTransformer([
-    ('cat', OneHotEncoder(handle_unknown='ignore', drop='first'), categorical_cols),
-    ('num', StandardScaler(), numeric_cols)  # Normalização para melhor performance
-])
+# Previsão pré-calculada pelo job em lote (previsao_lote.py), válida se os dados não mudaram desde então
+lote = ler_previsoes_lote(engine, produto, origem_id, destino_id)
+usar_lote = (
+    cenario == "Neutro (sem ajuste)"
+    and len(lote) >= meses_futuros
+    and (lote['versao_dados'] == versao).all()
+)
 
-# Criação do ensemble
-models = criar_ensemble_model()
-best_model = None
-best_score = float('inf')
-best_metrics = None
-
-# Teste de modelos com validação temporal
-progress_bar = st.progress(0)
-status_text = st.empty()
-
-for i, (name, model) in enumerate(models.items()):
-    status_text.text(f"🔄 Testando modelo {name.upper()}...")
-    
-    pipeline = Pipeline([
-        ('prep', preprocessor),
-        ('model', model)
-    ])
-    
-    # Validação temporal
-    metrics = validacao_temporal(pipeline, X, y, n_splits=3)
-    
-    if metrics['MAPE'] < best_score:
-        best_score = metrics['MAPE']
-        best_model = pipeline
-        best_metrics = metrics
-        best_name = name
-    
-    progress_bar.progress((i + 1) / len(models))
-
-status_text.text(f"✅ Melhor modelo: {best_name.upper()}")
+if usar_lote:
+    df_previsao = lote.head(meses_futuros)[['data', 'valor_previsto', 'limite_inferior', 'limite_superior']]
+    best_name = lote['modelo'].iloc[0]
+    best_metrics = lote['metricas'].iloc[0]
+    tendencia_percentual, volatilidade_historica = analisar_tendencia(df_clean)
+    st.caption(f"⚡ Previsão pré-calculada em lote em {lote['gerado_em'].iloc[0]:%d/%m/%Y %H:%M}: {best_name.upper()}")
+else:
+    # Modelo vem do registro (memória ou disco) quando essa série já foi treinada com os mesmos dados
+    best_name, best_model, best_metrics, do_registro = obter_modelo_cache(
+        produto, int(origem_id), int(destino_id), tuple(features_to_use), versao, X, y
+    )
+    st.caption(f"{'📦 Modelo carregado do registro' if do_registro else '🆕 Modelo treinado e registrado'}: {best_name.upper()}")
+
+    # Frete mais recente da rota vindo da matriz pré-calculada (em BRL)
+    frete_rota = frete_atual_rota(ler_matriz_fretes(engine), origem_id, destino_id)
+
+    # Uma simulação por modelo/versão/horizonte, reaproveitada em todos os usos abaixo e nas próximas interações
+    datas_mc, caminhos, segundos_simulacao = simular_monte_carlo_cache(
+        produto, int(origem_id), int(destino_id), versao, best_name, meses_futuros,
+        frete_rota, best_model, X, df_clean
+    )
+
+    df_previsao, tendencia_percentual, volatilidade_historica = prever_futuro(
+        best_model, X, df_clean, meses_futuros, cenario, frete_base=frete_rota, metricas=best_metrics, caminhos=caminhos
+    )
 
 # Exibir métricas com intervalos de confiança
 col1, col2, col3 = st.columns(3)
@@ -351,83 +209,6 @@ with col3:
     st.metric("MAPE", f"{best_metrics['MAPE']:.2%}", 
               delta=f"±{best_metrics['MAPE_std']:.2%}")
 
-# Treinamento final
-best_model.fit(X, y)
-
-# Previsão futura mais robusta
-last_row = X.iloc[-1].copy()
-last_mes = int(last_row['mes'])
-last_ano = int(last_row['ano'])
-
-# Análise de tendência mais sofisticada
-recent_data = df_clean.tail(12)  # últimos 12 meses
-if len(recent_data) >= 2:
-    primeiro_valor = recent_data['valor_entregue'].iloc[0]
-    ultimo_valor = recent_data['valor_entregue'].iloc[-1]
-
-    # Evita divisão por zero
-    if primeiro_valor != 0:
-        tendencia_percentual = (ultimo_valor / primeiro_valor) ** (1 / len(recent_data)) - 1
-    else:
-        tendencia_percentual = 0
-
-    volatilidade_historica = recent_data['valor_entregue'].pct_change().std()
-else:
-    tendencia_percentual = 0
-    volatilidade_historica = 0.05
-
-futuras = []
-for i in range(1, meses_futuros + 1):
-    next_mes = (last_mes + i - 1) % 12 + 1
-    next_ano = last_ano + (last_mes + i - 1) // 12
-
-    row = last_row.copy()
-    row['mes'] = next_mes
-    row['ano'] = next_ano
-    row['trimestre'] = (next_mes - 1) // 3 + 1
-    
-    # Atualizar features cíclicas
-    row['mes_sin'] = np.sin(2 * np.pi * next_mes / 12)
-    row['mes_cos'] = np.cos(2 * np.pi * next_mes / 12)
-    row['trimestre_sin'] = np.sin(2 * np.pi * row['trimestre'] / 4)
-    row['trimestre_cos'] = np.cos(2 * np.pi * row['trimestre'] / 4)
-
-    # Variações baseadas em volatilidade histórica
-    frete_factor = np.random.normal(1, volatilidade_historica * 0.5)
-    usd_factor = np.random.normal(1, volatilidade_historica * 0.3)
-    
-    row['frete_final'] *= frete_factor
-    row['usd_brl'] *= usd_factor
-    row['custo_total'] *= np.random.normal(1, 0.02)
-    row['variacao'] = tendencia_percentual
-
-    futuras.append(row)
-
-X_futuro = pd.DataFrame(futuras)
-previsoes_futuras = best_model.predict(X_futuro)
-
-# Ajuste de cenário mais sofisticado
-if cenario == "Alta (otimista)":
-    fator_base = 1 + max(0.02, abs(tendencia_percentual) * 1.5)  # mínimo 2% de alta
-    previsoes_ajustadas = [valor * (fator_base ** (i * 0.1)) for i, valor in enumerate(previsoes_futuras)]
-elif cenario == "Queda (pessimista)":
-    fator_base = 1 - max(0.02, abs(tendencia_percentual) * 1.2)  # mínimo 2% de queda
-    previsoes_ajustadas = [valor * (fator_base ** (i * 0.1)) for i, valor in enumerate(previsoes_futuras)]
-else:
-    previsoes_ajustadas = previsoes_futuras
-
-# Calcular intervalos de confiança
-lower_bound, upper_bound = calcular_intervalos_confianca(previsoes_ajustadas)
-
-# Resultados com intervalos de confiança
-datas_futuras = pd.date_range(start=df_clean['data'].max() + timedelta(days=1), periods=meses_futuros, freq='MS')
-df_previsao = pd.DataFrame({
-    'data': datas_futuras, 
-    'valor_previsto': previsoes_ajustadas,
-    'limite_inferior': lower_bound,
-    'limite_superior': upper_bound
-})
-
 # Gráfico melhorado com intervalos de confiança
 serie_real = df_clean[['data', 'valor_entregue']].rename(columns={'valor_entregue': 'valor'})
 
@@ -458,7 +239,7 @@ fig.add_trace(go.Scatter(
     fill='toself',
     fillcolor='rgba(255,0,0,0.2)',
     line=dict(color='rgba(255,255,255,0)'),
-    name='Intervalo de Confiança (95%)',
+    name='Intervalo conformal (95%)',
     showlegend=True
 ))
 
@@ -478,12 +259,64 @@ with st.expander("🔍 Visualizar dados históricos utilizados"):
 with st.expander("🔮 Ver previsão futura mês a mês"):
     st.dataframe(df_previsao)
 
+if not usar_lote:
+    with st.expander("🧭 Comparar cenários"):
+        # Neutro: trajetória recursiva; alta e queda: quantis da simulação de Monte Carlo
+        datas_cenarios, cenarios_previstos = prever_cenarios(
+            best_model, X, df_clean, meses_futuros, frete_base=frete_rota, caminhos=caminhos
+        )
+        st.line_chart(pd.DataFrame(cenarios_previstos, index=datas_cenarios))
+
+    with st.expander("🎲 Simulação de Monte Carlo (câmbio, frete e preço)"):
+        leque, probabilidades = resumir_monte_carlo(datas_mc, caminhos, df_clean['valor_entregue'].iloc[-1])
+        st.caption(f"{N_CAMINHOS} caminhos simulados em {segundos_simulacao:.2f}s")
+
+        fig_mc = go.Figure()
+        for inferior, superior, opacidade in [('p5', 'p95', 0.15), ('p25', 'p75', 0.3)]:
+            fig_mc.add_trace(go.Scatter(
+                x=list(leque['data']) + list(leque['data'][::-1]),
+                y=list(leque[superior]) + list(leque[inferior][::-1]),
+                fill='toself',
+                fillcolor=f'rgba(255,0,0,{opacidade})',
+                line=dict(color='rgba(255,255,255,0)'),
+                name=f'{inferior.upper()}–{superior.upper()}'
+            ))
+        fig_mc.add_trace(go.Scatter(x=leque['data'], y=leque['p50'], mode='lines', name='Mediana', line=dict(color='red')))
+        fig_mc.update_layout(xaxis_title="Data", yaxis_title="Valor (R$)", hovermode='x unified')
+        st.plotly_chart(fig_mc, use_container_width=True)
+
+        col_alta, col_estavel, col_queda = st.columns(3)
+        col_alta.metric(f"Alta > {LIMIAR_CENARIO:.0%}", f"{probabilidades['Alta']:.0%}")
+        col_estavel.metric("Estável", f"{probabilidades['Estável']:.0%}")
+        col_queda.metric(f"Queda > {LIMIAR_CENARIO:.0%}", f"{probabilidades['Queda']:.0%}")
+
 with st.expander("📊 Detalhes do modelo"):
     st.write(f"**Modelo selecionado:** {best_name.upper()}")
+    if 'candidatos' in best_metrics:
+        st.dataframe(pd.DataFrame(best_metrics['candidatos']).T[
+            ['MAE', 'RMSE', 'MAPE', 'tempo_fit_s', 'tempo_predict_s']
+        ], use_container_width=True)
+    if best_metrics.get('escore_conformal') is not None:
+        st.write(f"**Escore conformal (resíduos fora da amostra):** R$ {best_metrics['escore_conformal']:.2f} × √passo")
     st.write(f"**Features utilizadas:** {len(features_to_use)}")
     st.write(f"**Outliers removidos:** {outliers_removidos}")
     st.write(f"**Tendência detectada:** {tendencia_percentual:.2%} ao período")
     st.write(f"**Volatilidade histórica:** {volatilidade_historica:.2%}")
 
 # Métricas finais
-st.caption(f"Modelo {best_name.upper()} otimizado - MAPE: {best_metrics['MAPE']:.2%} ± {best_metrics['MAPE_std']:.2%} | Features: {len(features_to_use)} | Validação temporal com 3 folds")
\ No newline at end of file
+st.caption(f"Modelo {best_name.upper()} otimizado - MAPE: {best_metrics['MAPE']:.2%} ± {best_metrics['MAPE_std']:.2%} | Features: {len(features_to_use)} | Validação temporal com 3 folds")
+
+# Comparação entre rotas a partir das previsões em lote
+with st.expander("🗺️ Comparar todas as rotas deste produto (previsões em lote)"):
+    todas_rotas = ler_previsoes_lote(engine, produto)
+    todas_rotas = todas_rotas[todas_rotas['horizonte'] == meses_futuros]
+    if todas_rotas.empty:
+        st.info("Nenhuma previsão em lote para este produto e horizonte. Rode `python previsao_lote.py` para gerar.")
+    else:
+        todas_rotas['MAPE'] = todas_rotas['metricas'].apply(lambda m: m['MAPE'])
+        st.dataframe(
+            todas_rotas.sort_values('valor_previsto')[
+                ['origem', 'destino', 'data', 'valor_previsto', 'limite_inferior', 'limite_superior', 'modelo', 'MAPE', 'gerado_em']
+            ],
+            use_container_width=True
+        )
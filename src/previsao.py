@@ -0,0 +1,551 @@
+import pandas as pd
+import numpy as np
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.pipeline import Pipeline
+from sklearn.metrics import mean_absolute_percentage_error, mean_absolute_error, mean_squared_error
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Ridge
+from xgboost import XGBRegressor
+from scipy import stats
+from datetime import timedelta
+from threadpoolctl import threadpool_limits
+from validacao_paralela import validacao_cruzada_paralela, limitar_threads, nucleos_disponiveis
+from juncoes_asof import juntar_asof, TOLERANCIA_CAMBIO, TOLERANCIA_FRETE, TOLERANCIA_CUSTO_PORTO
+from catalogo_modelos import ModeloNaive, ModeloETS, selecionar_candidatos, modelo_univariado, LATENCIA_PADRAO_S
+
+# Motor de previsão do valor entregue (preço + frete), sem dependência do Streamlit,
+# para ser usado pela página de previsões e por rotinas fora da interface.
+
+MINIMO_REGISTROS = 10
+
+# Uma série = produto x origem (local do preço) x destino (cliente)
+CHAVES_SERIE = ['nome_produto', 'local_id', 'destino_id']
+LAGS = [1, 2, 3, 7, 15, 30]
+JANELAS = [3, 7, 15, 30]
+# Histórico necessário para calcular todas as features de uma linha nova
+# (janelas e tendências terminam na linha anterior, então precisam de uma posição a mais)
+HISTORICO_FEATURES = max(LAGS + JANELAS) + 1
+# Muda sempre que a definição das features muda, para invalidar o feature store salvo
+VERSAO_FEATURES = 3
+
+CENARIOS = ["Neutro (sem ajuste)", "Alta (otimista)", "Queda (pessimista)"]
+# Quantil da simulação de Monte Carlo que representa cada cenário (o neutro é a trajetória sem choques)
+QUANTIS_CENARIO = {
+    "Alta (otimista)": 0.9,
+    "Queda (pessimista)": 0.1,
+}
+N_CAMINHOS = 2000
+QUANTIS_LEQUE = [0.05, 0.25, 0.5, 0.75, 0.95]
+# Variação no fim do horizonte a partir da qual um caminho conta como alta ou queda
+LIMIAR_CENARIO = 0.05
+
+BASE_FEATURES = [
+    'formulacao', 'origem_produto', 'tipo_produto', 'unidade', 'estado', 'pais',
+    'tipo_local', 'modalidade', 'moeda', 'variacao', 'usd_brl',
+    'custo_total', 'frete_final', 'mes', 'ano', 'trimestre', 'dia_semana',
+    'mes_sin', 'mes_cos', 'trimestre_sin', 'trimestre_cos',
+    'ratio_frete_preco', 'ratio_custo_preco'
+]
+
+
+def carregar_dados(engine):
+    """Preços (com a marcação de outlier) com câmbio e custo portuário anexados por junção as-of,
+    além dos fretes e locais. Preços e custos vêm em BRL, normalizados na escrita (moedas.py)."""
+    df = pd.read_sql_query("""
+        SELECT pr.data, pr.preco_min_brl AS preco_min, pr.variacao, pr.modalidade, pr.moeda, COALESCE(pr.outlier, FALSE) AS outlier,
+               p.nome_produto, p.formulacao, p.origem AS origem_produto, p.tipo AS tipo_produto, p.unidade,
+               l.id as local_id, l.nome AS local, l.estado, l.pais, l.tipo AS tipo_local
+        FROM precos pr
+        JOIN produtos p ON pr.produto_id = p.id
+        JOIN locais l ON pr.local_id = l.id
+    """, engine)
+
+    fretes = pd.read_sql_query("""
+        SELECT data, origem_id, destino_id, tipo, custo_final_brl
+        FROM fretes
+        ORDER BY origem_id, destino_id, data
+    """, engine)
+
+    cambio = pd.read_sql_query("SELECT data, usd_brl FROM cambio ORDER BY data", engine)
+    custos_portos = pd.read_sql_query("SELECT porto_id, data, custo_total_brl AS custo_total FROM custos_portos ORDER BY porto_id, data", engine)
+
+    locais = pd.read_sql_query("SELECT id, nome FROM locais", engine)
+
+    # Preços sem data (ou com data ilegível) não entram em nenhuma série temporal
+    df['data'] = pd.to_datetime(df['data'], errors='coerce')
+    df = df.dropna(subset=['data']).reset_index(drop=True)
+    df['mes'] = df['data'].dt.month
+    df['ano'] = df['data'].dt.year
+    df = juntar_asof(df, cambio, ['usd_brl'], tolerancia=TOLERANCIA_CAMBIO)
+    df = juntar_asof(df, custos_portos, ['custo_total'], ['local_id'], ['porto_id'], TOLERANCIA_CUSTO_PORTO)
+    # Locais que não são portos não têm custo portuário
+    df['custo_total'] = df['custo_total'].fillna(0)
+    fretes['data'] = pd.to_datetime(fretes['data'], errors='coerce')
+
+    return df, fretes, locais
+
+def criar_features_lote(df, chaves=CHAVES_SERIE):
+    """Cria as features temporais, de lag, médias móveis, volatilidade e tendência de todas as séries de uma vez.
+
+    O frame é ordenado uma única vez por série e data; shifts e janelas são calculados na coluna inteira
+    e descartados onde cruzariam a fronteira entre séries (posição na série menor que o lag/janela).
+    Features derivadas do valor entregue usam só linhas anteriores, para que a previsão recursiva
+    consiga calculá-las a partir das próprias previsões.
+    """
+    df_sorted = df.sort_values(list(chaves) + ['data'], kind='mergesort').copy()
+    if chaves:
+        posicao = df_sorted.groupby(list(chaves), sort=False, dropna=False).cumcount()
+    else:
+        posicao = pd.Series(np.arange(len(df_sorted)), index=df_sorted.index)
+
+    def deslocar(coluna, lag):
+        return df_sorted[coluna].shift(lag).where(posicao >= lag)
+
+    def janela(coluna, tamanho, estatistica, incluir_atual=False):
+        serie = df_sorted[coluna] if incluir_atual else df_sorted[coluna].shift(1)
+        valores = getattr(serie.rolling(window=tamanho), estatistica)()
+        return valores.where(posicao >= (tamanho - 1 if incluir_atual else tamanho))
+
+    # Features temporais avançadas
+    df_sorted['trimestre'] = df_sorted['data'].dt.quarter
+    df_sorted['dia_semana'] = df_sorted['data'].dt.dayofweek
+    df_sorted['dia_mes'] = df_sorted['data'].dt.day
+    df_sorted['semana_ano'] = df_sorted['data'].dt.isocalendar().week
+
+    # Sazonalidade cíclica
+    df_sorted['mes_sin'] = np.sin(2 * np.pi * df_sorted['mes'] / 12)
+    df_sorted['mes_cos'] = np.cos(2 * np.pi * df_sorted['mes'] / 12)
+    df_sorted['trimestre_sin'] = np.sin(2 * np.pi * df_sorted['trimestre'] / 4)
+    df_sorted['trimestre_cos'] = np.cos(2 * np.pi * df_sorted['trimestre'] / 4)
+
+    # Features de lag (sempre criadas; a seleção de features descarta as que têm dados demais faltando)
+    for lag in LAGS:
+        df_sorted[f'valor_lag_{lag}'] = deslocar('valor_entregue', lag)
+        df_sorted[f'preco_lag_{lag}'] = deslocar('preco_min', lag)
+
+    # Médias móveis de diferentes janelas
+    for window in JANELAS:
+        df_sorted[f'ma_{window}'] = janela('valor_entregue', window, 'mean')
+        df_sorted[f'std_{window}'] = janela('valor_entregue', window, 'std')
+
+    # Features de volatilidade
+    df_sorted['volatilidade_7d'] = janela('valor_entregue', 7, 'std')
+    df_sorted['volatilidade_30d'] = janela('valor_entregue', 30, 'std')
+
+    # Tendências (até a linha anterior)
+    df_sorted['tendencia_7d'] = (deslocar('valor_entregue', 1) / deslocar('valor_entregue', 8)) - 1
+    df_sorted['tendencia_30d'] = (deslocar('valor_entregue', 1) / deslocar('valor_entregue', 31)) - 1
+
+    # Features de câmbio (exógeno: o valor do próprio dia é conhecido)
+    df_sorted['usd_volatilidade'] = janela('usd_brl', 7, 'std', incluir_atual=True)
+    df_sorted['usd_tendencia'] = (df_sorted['usd_brl'] / deslocar('usd_brl', 7)) - 1
+
+    # Razões importantes (sobre o preço anterior)
+    df_sorted['ratio_frete_preco'] = df_sorted['frete_final'] / deslocar('preco_min', 1)
+    df_sorted['ratio_custo_preco'] = df_sorted['custo_total'] / deslocar('preco_min', 1)
+
+    return df_sorted
+
+def criar_features_avancadas(df):
+    """Cria features temporais e de lag mais sofisticadas para uma única série"""
+    return criar_features_lote(df, chaves=[])
+
+def validacao_temporal(pipeline, X, y, n_splits=3):
+    """Validação temporal usando TimeSeriesSplit"""
+    tscv = TimeSeriesSplit(n_splits=n_splits)
+    scores = {'mae': [], 'rmse': [], 'mape': []}
+
+    for train_idx, val_idx in tscv.split(X):
+        X_train, X_val = X.iloc[train_idx], X.iloc[val_idx]
+        y_train, y_val = y.iloc[train_idx], y.iloc[val_idx]
+
+        pipeline.fit(X_train, y_train)
+        y_pred = pipeline.predict(X_val)
+
+        scores['mae'].append(mean_absolute_error(y_val, y_pred))
+        scores['rmse'].append(np.sqrt(mean_squared_error(y_val, y_pred)))
+        scores['mape'].append(mean_absolute_percentage_error(y_val, y_pred))
+
+    return {
+        'MAE': np.mean(scores['mae']),
+        'RMSE': np.mean(scores['rmse']),
+        'MAPE': np.mean(scores['mape']),
+        'MAE_std': np.std(scores['mae']),
+        'RMSE_std': np.std(scores['rmse']),
+        'MAPE_std': np.std(scores['mape'])
+    }
+
+def criar_ensemble_model(parametros=None):
+    """Cria um ensemble de modelos para melhor performance.
+
+    `parametros` (nome -> dict) sobrescreve os hiperparâmetros padrão, p.ex. com os do ajuste salvo.
+    """
+    parametros = parametros or {}
+    models = {
+        'xgb': XGBRegressor(**{
+            'n_estimators': 300,
+            'learning_rate': 0.08,
+            'max_depth': 6,
+            'subsample': 0.9,
+            'colsample_bytree': 0.9,
+            'random_state': 42,
+            'n_jobs': -1,
+            **parametros.get('xgb', {})
+        }),
+        'rf': RandomForestRegressor(**{
+            'n_estimators': 200,
+            'max_depth': 10,
+            'min_samples_split': 5,
+            'min_samples_leaf': 2,
+            'random_state': 42,
+            'n_jobs': -1,
+            **parametros.get('rf', {})
+        })
+    }
+    return models
+
+def criar_modelo(nome, parametros=None):
+    """Instancia um modelo do catálogo (naive, ets, ridge ou um dos modelos do ensemble)"""
+    if nome == 'naive':
+        return ModeloNaive()
+    if nome == 'ets':
+        return ModeloETS()
+    if nome == 'ridge':
+        return Ridge(alpha=1.0)
+    return criar_ensemble_model(parametros)[nome]
+
+def criar_pipeline(nome, X, parametros=None):
+    """Pipeline de um modelo do catálogo; os univariados dispensam o pré-processamento das features"""
+    modelo = criar_modelo(nome, parametros)
+    prep = 'passthrough' if getattr(modelo, 'univariado', False) else criar_preprocessador(X)
+    return Pipeline([
+        ('prep', prep),
+        ('model', modelo)
+    ])
+
+def intervalos_conformais(previsoes, metricas=None, confidence_level=0.95):
+    """Intervalos conformais a partir do escore dos resíduos fora da amostra da validação temporal.
+
+    O escore é o quantil dos erros de um passo, que validacao_paralela.avaliar_fold mede igual para todos
+    os candidatos; no passo h o intervalo é previsão ± escore * sqrt(h), crescendo como o erro acumulado
+    de um passeio aleatório. Métricas antigas, sem escore conformal,
+    caem na aproximação normal com o RMSE da validação.
+    """
+    previsoes = np.asarray(previsoes, dtype=float)
+    metricas = metricas or {}
+    escore = metricas.get('escore_conformal')
+    if escore is None or np.isnan(escore):
+        escore = stats.norm.ppf(1 - (1 - confidence_level) / 2) * metricas.get('RMSE', np.std(previsoes))
+
+    margem = escore * np.sqrt(np.arange(1, len(previsoes) + 1))
+    return previsoes - margem, previsoes + margem
+
+def preparar_series_lote(df, fretes, rotas, tolerancia_frete=TOLERANCIA_FRETE):
+    """Séries de valor entregue (preço na origem + frete até o destino) de todas as rotas de uma vez.
+
+    `rotas` é um DataFrame com origem_id e destino_id; cada preço da origem é repetido para cada destino
+    e recebe o frete mais recente da rota até a sua data (dentro de `tolerancia_frete`). Preços sem frete
+    nessa janela ficam sem valor entregue e são descartados na seleção de features.
+    """
+    df_merge = df.merge(rotas[['origem_id', 'destino_id']].drop_duplicates(), left_on='local_id', right_on='origem_id')
+    df_merge = juntar_asof(
+        df_merge, fretes, ['custo_final_brl'], ['origem_id', 'destino_id'], tolerancia=tolerancia_frete
+    )
+
+    df_merge['frete_final'] = df_merge.pop('custo_final_brl')
+    df_merge['valor_entregue'] = df_merge['preco_min'] + df_merge['frete_final']
+    return df_merge
+
+def preparar_serie(df, fretes, produto, origem_id, destino_id):
+    """Série de valor entregue (preço na origem + frete até o destino) de um produto e rota"""
+    rota = pd.DataFrame({'origem_id': [origem_id], 'destino_id': [destino_id]})
+    return preparar_series_lote(df[df['nome_produto'] == produto], fretes, rota)
+
+def remover_outliers_marcados(df):
+    """Descarta os preços marcados como outlier na ingestão (filtro de Hampel gravado em precos)"""
+    return df[~df['outlier'].astype(bool)]
+
+def selecionar_features(df_merge_clean):
+    """Escolhe o conjunto de features conforme a quantidade de dados válidos.
+
+    Retorna (df_clean, features_to_use).
+    """
+    # Features avançadas condicionais
+    advanced_features = []
+    for col in df_merge_clean.columns:
+        if any(x in col for x in ['lag_', 'ma_', 'std_', 'volatilidade', 'tendencia']):
+            if df_merge_clean[col].notna().sum() > len(df_merge_clean) * 0.5:  # 50% de dados válidos
+                advanced_features.append(col)
+
+    all_features = BASE_FEATURES + advanced_features
+
+    # Filtrar dados válidos
+    df_clean = df_merge_clean.dropna(subset=BASE_FEATURES + ['valor_entregue']).copy()
+
+    # Usar features avançadas apenas se tiver dados suficientes
+    features_to_use = BASE_FEATURES
+    if len(df_clean) >= 50 and advanced_features:
+        df_with_advanced = df_merge_clean.dropna(subset=all_features + ['valor_entregue']).copy()
+        if len(df_with_advanced) >= 10:
+            df_clean = df_with_advanced
+            features_to_use = all_features
+
+    return df_clean, features_to_use
+
+def preparar_dados_modelo(df_merge):
+    """Remove os outliers marcados, cria features e escolhe o conjunto de features conforme a quantidade de dados.
+
+    Retorna (df_clean, features_to_use, outliers_removidos).
+    """
+    df_merge_clean = remover_outliers_marcados(df_merge)
+    outliers_removidos = len(df_merge) - len(df_merge_clean)
+
+    df_clean, features_to_use = selecionar_features(criar_features_avancadas(df_merge_clean))
+    return df_clean, features_to_use, outliers_removidos
+
+def criar_preprocessador(X):
+    categorical_cols = X.select_dtypes(include='object').columns.tolist()
+    numeric_cols = X.select_dtypes(include=['float64', 'int64']).columns.tolist()
+
+    return ColumnTransformer([
+        ('cat', OneHotEncoder(handle_unknown='ignore', drop='first'), categorical_cols),
+        ('num', StandardScaler(), numeric_cols)  # Normalização para melhor performance
+    ])
+
+def treinar_melhor_modelo(X, y, callback_progresso=None, orcamento_nucleos=None, orcamento_latencia_s=LATENCIA_PADRAO_S,
+                          parametros=None):
+    """Compara os modelos candidatos com validação temporal e treina o melhor com todos os dados.
+
+    Os candidatos vêm do catálogo em camadas (naive, ETS, ridge, XGB/RF) conforme o tamanho da série e
+    `orcamento_latencia_s`, então séries curtas não pagam o treino dos modelos de árvores.
+    Os folds de todos os modelos rodam em paralelo dentro de `orcamento_nucleos` (padrão: todos os núcleos).
+    `parametros` (nome -> dict) vem do ajuste de hiperparâmetros, quando houver.
+    Retorna (nome_modelo, pipeline_treinado, metricas); metricas['candidatos'] traz MAE/RMSE/MAPE e
+    tempos de fit/predict de cada modelo testado.
+    """
+    orcamento_nucleos = orcamento_nucleos or nucleos_disponiveis()
+    pipelines = {
+        name: criar_pipeline(name, X, parametros)
+        for name in selecionar_candidatos(len(X), orcamento_latencia_s)
+    }
+
+    if callback_progresso:
+        callback_progresso(0.0, f"🔄 Testando modelos {', '.join(n.upper() for n in pipelines)}...")
+
+    candidatos = validacao_cruzada_paralela(pipelines, X, y, n_splits=3, orcamento_nucleos=orcamento_nucleos)
+    best_name = min(candidatos, key=lambda nome: candidatos[nome]['MAPE'])
+    best_metrics = {**candidatos[best_name], 'candidatos': candidatos}
+
+    if callback_progresso:
+        callback_progresso(1.0, f"✅ Melhor modelo: {best_name.upper()}")
+
+    # Treinamento final com todas as threads do orçamento
+    best_model = limitar_threads(pipelines[best_name], orcamento_nucleos)
+    with threadpool_limits(limits=orcamento_nucleos):
+        best_model.fit(X, y)
+    return best_name, best_model, best_metrics
+
+def analisar_tendencia(df_clean):
+    """Tendência média por período e volatilidade dos últimos 12 registros"""
+    recent_data = df_clean.tail(12)  # últimos 12 meses
+    if len(recent_data) >= 2:
+        primeiro_valor = recent_data['valor_entregue'].iloc[0]
+        ultimo_valor = recent_data['valor_entregue'].iloc[-1]
+
+        # Evita divisão por zero
+        if primeiro_valor != 0:
+            tendencia_percentual = (ultimo_valor / primeiro_valor) ** (1 / len(recent_data)) - 1
+        else:
+            tendencia_percentual = 0
+
+        volatilidade_historica = recent_data['valor_entregue'].pct_change().std()
+    else:
+        tendencia_percentual = 0
+        volatilidade_historica = 0.05
+
+    return tendencia_percentual, volatilidade_historica
+
+def _atras(historico, k):
+    """Coluna k posições antes do fim do histórico (k=1 é o último valor); NaN se não houver"""
+    if k > historico.shape[1]:
+        return np.full(historico.shape[0], np.nan)
+    return historico[:, -k]
+
+def simular_trajetorias(best_model, X, df_clean, datas_futuras, frete, usd, choques=None):
+    """Previsão recursiva de várias trajetórias ao mesmo tempo.
+
+    A cada passo monta uma linha por trajetória com lags, médias móveis, volatilidades e tendências
+    recalculados a partir do histórico estendido com as previsões anteriores, e faz um único predict.
+    `frete` e `usd` são matrizes (trajetórias x passos); `choques`, opcional, multiplica cada previsão
+    antes de ela entrar no histórico. Retorna a matriz (trajetórias x passos) de valores previstos.
+    """
+    n_trajetorias, n_passos = frete.shape
+    if modelo_univariado(best_model):
+        # Naive/ETS não dependem das features: todos os passos de uma vez, iguais em todas as trajetórias
+        previsoes = np.tile(best_model.steps[-1][1].prever_passos(n_passos), (n_trajetorias, 1))
+        return previsoes if choques is None else previsoes * np.cumprod(choques, axis=1)
+
+    colunas = set(X.columns)
+    ultima = X.iloc[[-1] * n_trajetorias].reset_index(drop=True)
+    custo_total = ultima['custo_total'].to_numpy(dtype=float)
+
+    historico = df_clean.tail(HISTORICO_FEATURES)
+    hist_valor = np.tile(historico['valor_entregue'].to_numpy(dtype=float), (n_trajetorias, 1))
+    hist_preco = np.tile(historico['preco_min'].to_numpy(dtype=float), (n_trajetorias, 1))
+    hist_usd = np.tile(historico['usd_brl'].to_numpy(dtype=float), (n_trajetorias, 1))
+
+    previsoes = np.empty((n_trajetorias, n_passos))
+    for passo, data in enumerate(datas_futuras):
+        linhas = ultima.copy()
+        novas = {
+            'mes': data.month,
+            'ano': data.year,
+            'trimestre': data.quarter,
+            'dia_semana': data.dayofweek,
+            'mes_sin': np.sin(2 * np.pi * data.month / 12),
+            'mes_cos': np.cos(2 * np.pi * data.month / 12),
+            'trimestre_sin': np.sin(2 * np.pi * data.quarter / 4),
+            'trimestre_cos': np.cos(2 * np.pi * data.quarter / 4),
+            'frete_final': frete[:, passo],
+            'usd_brl': usd[:, passo],
+            'variacao': (_atras(hist_preco, 1) / _atras(hist_preco, 2) - 1) * 100,
+            'ratio_frete_preco': frete[:, passo] / _atras(hist_preco, 1),
+            'ratio_custo_preco': custo_total / _atras(hist_preco, 1),
+            'tendencia_7d': _atras(hist_valor, 1) / _atras(hist_valor, 8) - 1,
+            'tendencia_30d': _atras(hist_valor, 1) / _atras(hist_valor, 31) - 1,
+            'usd_tendencia': usd[:, passo] / _atras(hist_usd, 7) - 1,
+            'usd_volatilidade': np.column_stack([hist_usd[:, -6:], usd[:, passo]]).std(axis=1, ddof=1),
+            'volatilidade_7d': hist_valor[:, -7:].std(axis=1, ddof=1),
+            'volatilidade_30d': hist_valor[:, -30:].std(axis=1, ddof=1),
+        }
+        for lag in LAGS:
+            novas[f'valor_lag_{lag}'] = _atras(hist_valor, lag)
+            novas[f'preco_lag_{lag}'] = _atras(hist_preco, lag)
+        for window in JANELAS:
+            novas[f'ma_{window}'] = hist_valor[:, -window:].mean(axis=1)
+            novas[f'std_{window}'] = hist_valor[:, -window:].std(axis=1, ddof=1)
+
+        for coluna, valores in novas.items():
+            if coluna in colunas:
+                linhas[coluna] = valores
+
+        valores_passo = best_model.predict(linhas)
+        if choques is not None:
+            valores_passo = valores_passo * choques[:, passo]
+        previsoes[:, passo] = valores_passo
+
+        hist_valor = np.column_stack([hist_valor, valores_passo])
+        hist_preco = np.column_stack([hist_preco, valores_passo - frete[:, passo]])
+        hist_usd = np.column_stack([hist_usd, usd[:, passo]])
+
+    return previsoes
+
+def datas_previsao(df_clean, meses_futuros):
+    return pd.date_range(start=df_clean['data'].max() + timedelta(days=1), periods=meses_futuros, freq='MS')
+
+def estimar_covariancia(df_clean):
+    """Covariância dos log-retornos mensais de câmbio, frete e valor entregue (nessa ordem)"""
+    mensal = df_clean.set_index('data')[['usd_brl', 'frete_final', 'valor_entregue']].resample('MS').mean()
+    retornos = np.log(mensal.where(mensal > 0)).diff().iloc[1:]
+    if len(retornos) < 3:
+        _, volatilidade = analisar_tendencia(df_clean)
+        volatilidade = volatilidade if np.isfinite(volatilidade) else 0.05
+        return np.diag([volatilidade ** 2] * 3)
+    # Meses sem frete (ou sem cotação) não têm retorno: contam como variação zero
+    return np.nan_to_num(np.cov(retornos.fillna(0).to_numpy().T))
+
+def simular_caminhos(usd_inicial, frete_inicial, covariancia, n_caminhos, n_passos, rng):
+    """Caminhos conjuntos de câmbio e frete (passeio aleatório log-normal) e choques do valor entregue.
+
+    Os choques são correlacionados pela covariância histórica (via Cholesky). Câmbio e frete acumulam os
+    choques; o do valor é aplicado a cada previsão e se propaga pelos lags da previsão recursiva.
+    """
+    fator = np.linalg.cholesky(covariancia + np.eye(3) * 1e-12)
+    choques = rng.standard_normal((n_caminhos, n_passos, 3)) @ fator.T
+    usd = usd_inicial * np.exp(np.cumsum(choques[..., 0], axis=1))
+    frete = frete_inicial * np.exp(np.cumsum(choques[..., 1], axis=1))
+    return usd, frete, np.exp(choques[..., 2])
+
+def simular_monte_carlo(best_model, X, df_clean, meses_futuros, n_caminhos=N_CAMINHOS, frete_base=None, seed=42):
+    """Simula `n_caminhos` trajetórias do valor entregue com câmbio, frete e preço aleatórios conjuntos.
+
+    Todos os caminhos passam pelo modelo juntos (um predict por mês); com a mesma seed o resultado se repete.
+    Retorna (datas, caminhos) com caminhos na forma (n_caminhos x meses).
+    """
+    rng = np.random.default_rng(seed)
+    if frete_base is None:
+        frete_base = X['frete_final'].iloc[-1]
+
+    datas_futuras = datas_previsao(df_clean, meses_futuros)
+    usd, frete, choques = simular_caminhos(
+        float(X['usd_brl'].iloc[-1]), float(frete_base), estimar_covariancia(df_clean),
+        n_caminhos, meses_futuros, rng
+    )
+    caminhos = simular_trajetorias(best_model, X, df_clean, datas_futuras, frete, usd, choques)
+    return datas_futuras, caminhos
+
+def resumir_monte_carlo(datas_futuras, caminhos, valor_atual):
+    """Leque de quantis por mês e probabilidade de alta, estabilidade ou queda no fim do horizonte"""
+    leque = pd.DataFrame({'data': datas_futuras})
+    for q, valores in zip(QUANTIS_LEQUE, np.quantile(caminhos, QUANTIS_LEQUE, axis=0)):
+        leque[f'p{int(q * 100)}'] = valores
+
+    variacao_final = caminhos[:, -1] / valor_atual - 1
+    probabilidades = {
+        'Alta': float(np.mean(variacao_final > LIMIAR_CENARIO)),
+        'Estável': float(np.mean(np.abs(variacao_final) <= LIMIAR_CENARIO)),
+        'Queda': float(np.mean(variacao_final < -LIMIAR_CENARIO)),
+    }
+    return leque, probabilidades
+
+def prever_cenarios(best_model, X, df_clean, meses_futuros, cenarios=CENARIOS, frete_base=None, seed=42, caminhos=None):
+    """Previsão de vários cenários: o neutro é a trajetória recursiva com frete e câmbio atuais;
+    alta e queda são quantis mensais da simulação de Monte Carlo. Retorna (datas, {cenario: valores}).
+
+    `caminhos`, quando informado, é uma simulação já feita (simular_monte_carlo) e não é refeita.
+    """
+    if frete_base is None:
+        frete_base = X['frete_final'].iloc[-1]
+
+    datas_futuras = datas_previsao(df_clean, meses_futuros)
+    previsoes = {}
+    if "Neutro (sem ajuste)" in cenarios:
+        frete = np.full((1, meses_futuros), float(frete_base))
+        usd = np.full((1, meses_futuros), float(X['usd_brl'].iloc[-1]))
+        previsoes["Neutro (sem ajuste)"] = simular_trajetorias(best_model, X, df_clean, datas_futuras, frete, usd)[0]
+
+    if any(c in QUANTIS_CENARIO for c in cenarios):
+        if caminhos is None:
+            _, caminhos = simular_monte_carlo(best_model, X, df_clean, meses_futuros, frete_base=frete_base, seed=seed)
+        for cenario in cenarios:
+            if cenario in QUANTIS_CENARIO:
+                previsoes[cenario] = np.quantile(caminhos, QUANTIS_CENARIO[cenario], axis=0)
+
+    return datas_futuras, {c: previsoes[c] for c in cenarios}
+
+def prever_futuro(best_model, X, df_clean, meses_futuros, cenario="Neutro (sem ajuste)", frete_base=None, metricas=None,
+                  caminhos=None):
+    """Previsão recursiva mês a mês do valor entregue com ajuste de cenário e intervalos conformais (de `metricas`).
+
+    `caminhos` reaproveita uma simulação de Monte Carlo já feita nos cenários de alta e queda.
+    Retorna (df_previsao, tendencia_percentual, volatilidade_historica).
+    """
+    tendencia_percentual, volatilidade_historica = analisar_tendencia(df_clean)
+    datas_futuras, previsoes = prever_cenarios(
+        best_model, X, df_clean, meses_futuros, [cenario], frete_base, caminhos=caminhos
+    )
+    previsoes_ajustadas = previsoes[cenario]
+
+    # Intervalos conformais a partir dos resíduos da validação temporal
+    lower_bound, upper_bound = intervalos_conformais(previsoes_ajustadas, metricas)
+
+    df_previsao = pd.DataFrame({
+        'data': datas_futuras,
+        'valor_previsto': previsoes_ajustadas,
+        'limite_inferior': lower_bound,
+        'limite_superior': upper_bound
+    })
+
+    return df_previsao, tendencia_percentual, volatilidade_historica
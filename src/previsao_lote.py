@@ -0,0 +1,199 @@
+import argparse
+import json
+from functools import partial
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from fretes import ler_matriz_fretes, frete_atual_rota
+from previsao import (
+    carregar_dados, preparar_series_lote, remover_outliers_marcados, selecionar_features,
+    prever_futuro, MINIMO_REGISTROS
+)
+from feature_store import atualizar_feature_store, serie_do_store
+from registro_modelos import obter_modelo, versao_serie
+from hiperparametros import treinar_com_ajuste
+from validacao_paralela import nucleos_disponiveis
+from migracoes import garantir_esquema
+
+# Previsão em lote de todas as combinações (produto, origem, destino), fora da interface.
+# Uso: python previsao_lote.py --meses 12 --processos 4
+
+MESES_LOTE = 12
+
+# Estado de cada processo do pool (preenchido em inicializar_worker)
+_engine_worker = None
+_matriz_worker = None
+_nucleos_worker = 1
+
+
+def garantir_tabela_previsoes(connection):
+    """Cria a tabela de previsões pré-calculadas, se ainda não existir"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS previsoes_lote (
+            produto TEXT,
+            origem_id INTEGER,
+            destino_id INTEGER,
+            data TEXT,
+            horizonte INTEGER,
+            valor_previsto REAL,
+            limite_inferior REAL,
+            limite_superior REAL,
+            modelo TEXT,
+            metricas TEXT,
+            versao_dados TEXT,
+            gerado_em TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (produto, origem_id, destino_id, horizonte)
+        )
+    """))
+    connection.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_previsoes_lote_destino
+        ON previsoes_lote (produto, destino_id, horizonte)
+    """))
+
+
+def enumerar_combinacoes(df, fretes):
+    """Combinações viáveis: produto x origem com histórico mínimo e destinos com frete registrado a partir dela"""
+    series = df.groupby(['nome_produto', 'local_id']).size().reset_index(name='n')
+    series = series[series['n'] >= MINIMO_REGISTROS]
+    rotas = fretes[['origem_id', 'destino_id']].drop_duplicates()
+
+    combinacoes = series.merge(rotas, left_on='local_id', right_on='origem_id')
+    combinacoes = combinacoes[combinacoes['origem_id'] != combinacoes['destino_id']]
+    return combinacoes[['nome_produto', 'origem_id', 'destino_id']]
+
+
+def inicializar_worker(database_url, matriz, nucleos_por_worker):
+    global _engine_worker, _matriz_worker, _nucleos_worker
+    _engine_worker = create_engine(database_url)
+    _matriz_worker = matriz
+    _nucleos_worker = nucleos_por_worker
+
+
+def prever_combinacao(produto, origem_id, destino_id, df_features, meses):
+    """Treina (ou reaproveita do registro) e prevê uma combinação; roda dentro de um processo do pool"""
+    inicio = time.perf_counter()
+    df_clean, features_to_use = selecionar_features(df_features)
+    if len(df_clean) < MINIMO_REGISTROS:
+        return None
+
+    X = df_clean[features_to_use]
+    y = df_clean['valor_entregue']
+    # Cada worker treina dentro da sua fatia de núcleos, sem abrir outro pool
+    treinar = partial(treinar_com_ajuste, _engine_worker, produto, origem_id, destino_id, orcamento_nucleos=_nucleos_worker)
+    nome_modelo, modelo, metricas, _ = obter_modelo(_engine_worker, produto, origem_id, destino_id, X, y, treinar)
+
+    frete_rota = frete_atual_rota(_matriz_worker, origem_id, destino_id)
+    df_previsao, _, _ = prever_futuro(modelo, X, df_clean, meses, frete_base=frete_rota, metricas=metricas)
+
+    df_previsao['produto'] = produto
+    df_previsao['origem_id'] = int(origem_id)
+    df_previsao['destino_id'] = int(destino_id)
+    df_previsao['horizonte'] = np.arange(1, len(df_previsao) + 1)
+    df_previsao['modelo'] = nome_modelo
+    df_previsao['metricas'] = json.dumps(metricas, default=float)
+    df_previsao['versao_dados'] = versao_serie(X, y)
+    df_previsao['data'] = df_previsao['data'].dt.strftime('%Y-%m-%d')
+    return df_previsao, time.perf_counter() - inicio
+
+
+def salvar_previsoes(engine, df_previsao):
+    """Substitui as previsões da combinação pelas novas"""
+    chave = df_previsao.iloc[0]
+    with engine.begin() as connection:
+        garantir_tabela_previsoes(connection)
+        connection.execute(text("""
+            DELETE FROM previsoes_lote
+            WHERE produto = :produto AND origem_id = :origem_id AND destino_id = :destino_id
+        """), {"produto": chave['produto'], "origem_id": int(chave['origem_id']), "destino_id": int(chave['destino_id'])})
+        df_previsao.to_sql("previsoes_lote", connection, if_exists="append", index=False)
+
+
+def executar_lote(engine, database_url, meses=MESES_LOTE, processos=None):
+    """Prevê todas as combinações viáveis em um pool de processos e grava em previsoes_lote"""
+    df, fretes, _ = carregar_dados(engine)
+    matriz = ler_matriz_fretes(engine)
+    combinacoes = enumerar_combinacoes(df, fretes)
+    print(f"🔢 {len(combinacoes)} combinação(ões) produto/origem/destino para prever")
+
+    # Séries e features de todas as combinações calculadas de uma vez (incremental sobre o feature store)
+    series = preparar_series_lote(df, fretes, combinacoes[['origem_id', 'destino_id']])
+    series = series.merge(combinacoes, on=['nome_produto', 'origem_id', 'destino_id'])
+    store = atualizar_feature_store(remover_outliers_marcados(series))
+
+    # Orçamento global de núcleos repartido entre os processos do pool
+    processos = processos or nucleos_disponiveis()
+    nucleos_por_worker = max(1, nucleos_disponiveis() // processos)
+
+    resumo = {"combinacoes": len(combinacoes), "sucesso": 0, "falhas": 0, "ignoradas": 0}
+    with ProcessPoolExecutor(max_workers=processos, initializer=inicializar_worker,
+                             initargs=(database_url, matriz, nucleos_por_worker)) as pool:
+        futuros = {}
+        for produto, origem_id, destino_id in combinacoes.itertuples(index=False, name=None):
+            df_features = serie_do_store(store, produto, origem_id, destino_id)
+            futuro = pool.submit(prever_combinacao, produto, origem_id, destino_id, df_features, meses)
+            futuros[futuro] = (produto, origem_id, destino_id)
+
+        for futuro in as_completed(futuros):
+            produto, origem_id, destino_id = futuros[futuro]
+            try:
+                resultado = futuro.result()
+                if resultado is None:
+                    resumo["ignoradas"] += 1
+                    continue
+                df_previsao, duracao = resultado
+                salvar_previsoes(engine, df_previsao)
+                resumo["sucesso"] += 1
+                print(f"✅ {produto} {origem_id}→{destino_id} ({duracao:.1f}s)")
+            except Exception as e:
+                resumo["falhas"] += 1
+                print(f"❌ Erro em {produto} {origem_id}→{destino_id}: {e}")
+
+    return resumo
+
+
+def ler_previsoes_lote(engine, produto, origem_id=None, destino_id=None):
+    """Lê previsões pré-calculadas de um produto (opcionalmente de uma rota específica)"""
+    filtros = ["pl.produto = :produto"]
+    params = {"produto": produto}
+    if origem_id is not None:
+        filtros.append("pl.origem_id = :origem_id")
+        params["origem_id"] = int(origem_id)
+    if destino_id is not None:
+        filtros.append("pl.destino_id = :destino_id")
+        params["destino_id"] = int(destino_id)
+
+    with engine.begin() as connection:
+        garantir_tabela_previsoes(connection)
+        df = pd.read_sql_query(text(f"""
+            SELECT pl.*, l1.nome AS origem, l2.nome AS destino
+            FROM previsoes_lote pl
+            JOIN locais l1 ON l1.id = pl.origem_id
+            JOIN locais l2 ON l2.id = pl.destino_id
+            WHERE {' AND '.join(filtros)}
+            ORDER BY pl.origem_id, pl.destino_id, pl.horizonte
+        """), connection, params=params)
+
+    df['data'] = pd.to_datetime(df['data'])
+    df['metricas'] = df['metricas'].apply(json.loads)
+    return df
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Previsão em lote de todas as rotas")
+    parser.add_argument("--meses", type=int, default=MESES_LOTE, help="Horizonte em meses")
+    parser.add_argument("--processos", type=int, default=None, help="Processos no pool (padrão: núcleos da máquina)")
+    args = parser.parse_args()
+
+    DATABASE_URL = os.getenv("DATABASE_URL")
+    engine = create_engine(DATABASE_URL)
+    garantir_esquema(engine)
+
+    inicio = time.perf_counter()
+    resumo = executar_lote(engine, DATABASE_URL, args.meses, args.processos)
+    resumo["duracao_s"] = round(time.perf_counter() - inicio, 2)
+    print(json.dumps(resumo, ensure_ascii=False))
@@ -1,13 +1,18 @@
 import os
 import json
-from api import ler_pdf, gerar_json_estruturado, combinar_json, inserir_dados_no_banco
+from api import ler_pdf, gerar_json_estruturado, combinar_json, inserir_dados_no_banco, engine
+from acoes import registrar_acao, contar_linhas_faixas
+from derivados import atualizar_derivados
+from validacao import validar_relatorio, salvar_qualidade
+from metricas import MetricasImportacao, contar_linhas
 
 def processar_relatorio(
     caminho_pdf: str,
     usar_json_salvo: bool = False,
     caminho_json_salvo: str = "saida_gemini3.json",
     callback_progresso=None,
-    num_partes: int = 15
+    num_partes: int = 15,
+    nome_arquivo: str = None
 ):
     def atualizar_progresso(p, mensagem=None):
         if callback_progresso:
@@ -22,34 +27,68 @@ def processar_relatorio(
         except Exception as e:
             print(f"[ERRO ao salvar progresso.json]: {e}")
 
-    # Caso esteja reaproveitando um JSON salvo
-    if usar_json_salvo and os.path.exists(caminho_json_salvo):
-        with open(caminho_json_salvo, "r", encoding="utf-8") as f:
-            dados_json = json.load(f)
-    else:
-        texto = ler_pdf(caminho_pdf)
-        tamanho = len(texto)
-        divisao = min(num_partes, tamanho)
-        decimo = tamanho // divisao
-        partes = [texto[i * decimo: (i + 1) * decimo] for i in range(divisao - 1)]
-        partes.append(texto[(divisao - 1) * decimo:])
-
-        dados_partes = []
-        for i, parte in enumerate(partes, 1):
-            msg = f"Processando parte {i}/{divisao} com Gemini..."
-            print(msg)
-            try:
-                dados = gerar_json_estruturado(parte)
-                dados_partes.append(dados)
-            except Exception as e:
-                print(f"Erro ao processar parte {i}: {e}")
-
-            progresso = int(i / divisao * 100)
-            atualizar_progresso(progresso, mensagem=msg)
-
-        dados_json = combinar_json(*dados_partes)
-
-    inserir_dados_no_banco(dados_json)
+    relatorio = nome_arquivo or os.path.basename(caminho_pdf)
+    # Duração, bytes, linhas e tokens de cada etapa, gravados no fim mesmo se a importação falhar
+    metricas = MetricasImportacao(relatorio)
+    try:
+        # Caso esteja reaproveitando um JSON salvo
+        if usar_json_salvo and os.path.exists(caminho_json_salvo):
+            with open(caminho_json_salvo, "r", encoding="utf-8") as f:
+                dados_json = json.load(f)
+        else:
+            with metricas.etapa("ler_pdf") as span:
+                texto = ler_pdf(caminho_pdf)
+                span.update(bytes_entrada=os.path.getsize(caminho_pdf), bytes_saida=len(texto.encode("utf-8")))
+
+            with metricas.etapa("dividir_texto") as span:
+                tamanho = len(texto)
+                divisao = min(num_partes, tamanho)
+                decimo = tamanho // divisao
+                partes = [texto[i * decimo: (i + 1) * decimo] for i in range(divisao - 1)]
+                partes.append(texto[(divisao - 1) * decimo:])
+                span.update(bytes_entrada=tamanho, linhas=len(partes))
+
+            dados_partes = []
+            for i, parte in enumerate(partes, 1):
+                msg = f"Processando parte {i}/{divisao} com Gemini..."
+                print(msg)
+                try:
+                    with metricas.etapa("gerar_json_estruturado", parte=i) as span:
+                        span["bytes_entrada"] = len(parte.encode("utf-8"))
+                        dados = gerar_json_estruturado(parte, span=span)
+                        span["linhas"] = contar_linhas(dados)
+                    dados_partes.append(dados)
+                except Exception as e:
+                    print(f"Erro ao processar parte {i}: {e}")
+
+                progresso = int(i / divisao * 100)
+                atualizar_progresso(progresso, mensagem=msg)
+
+            with metricas.etapa("combinar_json") as span:
+                dados_json = combinar_json(*dados_partes)
+                span["linhas"] = contar_linhas(dados_json)
+
+        # Linhas com tipos inválidos ou campos obrigatórios faltando não chegam ao banco
+        with metricas.etapa("validar_relatorio") as span:
+            span["linhas"] = contar_linhas(dados_json)
+            dados_json, qualidade = validar_relatorio(dados_json)
+        rejeitadas = sum(m["rejeitadas"] for m in qualidade)
+
+        # Inserção, qualidade e entrada no log na mesma transação: ou tudo fica registrado, ou nada
+        with metricas.etapa("inserir_dados_no_banco") as span, engine.begin() as connection:
+            span["bytes_entrada"] = len(json.dumps(dados_json, ensure_ascii=False, default=str).encode("utf-8"))
+            faixas = inserir_dados_no_banco(dados_json, connection)
+            span["linhas"] = contar_linhas_faixas(faixas)
+            salvar_qualidade(connection, relatorio, qualidade)
+            aviso = f" ({rejeitadas} linha(s) rejeitada(s) na validação)" if rejeitadas else ""
+            registrar_acao(connection, "importacao", f"📄 {relatorio} importado!{aviso}", faixas)
+
+        # Etapas derivadas: rodam aqui, ainda na thread do processamento, para a tela só ler os resultados
+        atualizar_derivados(engine, metricas)
+    finally:
+        metricas.salvar(engine)
+
     msg_final = "✅ Dados inseridos com sucesso no banco morro_verde.db!"
     print(msg_final)
     atualizar_progresso(100, mensagem=msg_final)
+    return faixas, qualidade, metricas.resumo()
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import joblib
+import pandas as pd
+from sqlalchemy import text
+
+# Pipelines treinados ficam em disco; o banco guarda a chave, as métricas e o caminho do arquivo
+DIRETORIO_MODELOS = os.path.join(os.path.dirname(__file__), "modelos")
+
+
+def garantir_tabela_modelos(connection):
+    """Cria a tabela do registro de modelos, se ainda não existir"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS modelos_registro (
+            chave TEXT PRIMARY KEY,
+            produto TEXT,
+            origem_id INTEGER,
+            destino_id INTEGER,
+            features TEXT,
+            versao_dados TEXT,
+            nome_modelo TEXT,
+            metricas TEXT,
+            caminho TEXT,
+            criado_em TIMESTAMP DEFAULT NOW()
+        )
+    """))
+    connection.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_modelos_registro_rota
+        ON modelos_registro (produto, origem_id, destino_id, criado_em DESC)
+    """))
+
+
+def versao_serie(X, y):
+    """Impressão digital dos dados de treino: muda sempre que alguma linha ou valor da série muda"""
+    hash_linhas = pd.util.hash_pandas_object(pd.concat([X, y], axis=1), index=False)
+    return hashlib.sha1(hash_linhas.values.tobytes()).hexdigest()[:16]
+
+
+def chave_modelo(produto, origem_id, destino_id, features, versao_dados):
+    """Chave do registro: (produto, origem, destino, conjunto de features, versão dos dados)"""
+    conteudo = json.dumps([produto, int(origem_id), int(destino_id), list(features), versao_dados])
+    return hashlib.sha1(conteudo.encode("utf-8")).hexdigest()
+
+
+def carregar_modelo(engine, chave):
+    """Busca um pipeline já treinado; retorna (nome_modelo, pipeline, metricas) ou None"""
+    with engine.begin() as connection:
+        garantir_tabela_modelos(connection)
+        registro = connection.execute(text("""
+            SELECT nome_modelo, metricas, caminho FROM modelos_registro WHERE chave = :chave
+        """), {"chave": chave}).fetchone()
+
+    if not registro or not os.path.exists(registro[2]):
+        return None
+
+    try:
+        pipeline = joblib.load(registro[2])
+    except Exception as e:
+        print(f"⚠️ Erro ao carregar modelo {chave}: {e}")
+        return None
+    return registro[0], pipeline, json.loads(registro[1])
+
+
+def salvar_modelo(engine, chave, produto, origem_id, destino_id, features, versao_dados, nome_modelo, pipeline, metricas):
+    """Persiste o pipeline treinado em disco e registra (ou substitui) a entrada no banco"""
+    os.makedirs(DIRETORIO_MODELOS, exist_ok=True)
+    caminho = os.path.join(DIRETORIO_MODELOS, f"{chave}.joblib")
+    joblib.dump(pipeline, caminho)
+
+    with engine.begin() as connection:
+        garantir_tabela_modelos(connection)
+        connection.execute(text("""
+            INSERT INTO modelos_registro (chave, produto, origem_id, destino_id, features, versao_dados, nome_modelo, metricas, caminho)
+            VALUES (:chave, :produto, :origem_id, :destino_id, :features, :versao_dados, :nome_modelo, :metricas, :caminho)
+            ON CONFLICT (chave) DO UPDATE
+            SET nome_modelo = EXCLUDED.nome_modelo, metricas = EXCLUDED.metricas,
+                caminho = EXCLUDED.caminho, criado_em = NOW()
+        """), {
+            "chave": chave,
+            "produto": produto,
+            "origem_id": int(origem_id),
+            "destino_id": int(destino_id),
+            "features": json.dumps(list(features)),
+            "versao_dados": versao_dados,
+            "nome_modelo": nome_modelo,
+            "metricas": json.dumps(metricas, default=float),
+            "caminho": caminho
+        })
+
+
+def obter_modelo(engine, produto, origem_id, destino_id, X, y, treinar):
+    """Carrega o modelo do registro ou, se a chave ainda não existe, treina com `treinar(X, y)` e registra.
+
+    Retorna (nome_modelo, pipeline, metricas, veio_do_registro).
+    """
+    versao = versao_serie(X, y)
+    chave = chave_modelo(produto, origem_id, destino_id, X.columns, versao)
+
+    registrado = carregar_modelo(engine, chave)
+    if registrado:
+        return (*registrado, True)
+
+    nome_modelo, pipeline, metricas = treinar(X, y)
+    salvar_modelo(engine, chave, produto, origem_id, destino_id, X.columns, versao, nome_modelo, pipeline, metricas)
+    return nome_modelo, pipeline, metricas, False
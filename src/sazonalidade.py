@@ -0,0 +1,158 @@
+import pandas as pd
+from sqlalchemy import text
+from statsmodels.tsa.seasonal import STL
+
+# local_id usado para a série do produto com todos os locais agregados
+TODOS_LOCAIS = 0
+MESES_MINIMOS = 24
+
+
+def garantir_tabelas_sazonalidade(connection):
+    """Cria as tabelas de cache da decomposição sazonal, se ainda não existirem"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS sazonalidade_series (
+            produto TEXT,
+            local_id INTEGER,
+            versao TEXT,
+            n_meses INTEGER,
+            calculado_em TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (produto, local_id)
+        )
+    """))
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS sazonalidade (
+            produto TEXT,
+            local_id INTEGER,
+            data TEXT,
+            observado REAL,
+            tendencia REAL,
+            sazonal REAL,
+            residuo REAL,
+            PRIMARY KEY (produto, local_id, data)
+        )
+    """))
+
+
+def versoes_series(connection):
+    """Versão de cada série (produto x local e produto agregado) a partir de contagem, maior id e soma dos preços.
+
+    A soma em BRL muda quando o câmbio de preços já gravados é preenchido ou corrigido (moedas.py),
+    sem que a contagem ou o maior id mudem.
+    """
+    return pd.read_sql_query(text("""
+        SELECT p.nome_produto AS produto, pr.local_id,
+               COUNT(*) || ':' || MAX(pr.id) || ':' || ROUND(SUM(pr.preco_min_brl)::numeric, 4) AS versao
+        FROM precos pr
+        JOIN produtos p ON p.id = pr.produto_id
+        WHERE pr.preco_min_brl IS NOT NULL
+        GROUP BY p.nome_produto, pr.local_id
+        UNION ALL
+        SELECT p.nome_produto AS produto, :todos AS local_id,
+               COUNT(*) || ':' || MAX(pr.id) || ':' || ROUND(SUM(pr.preco_min_brl)::numeric, 4) AS versao
+        FROM precos pr
+        JOIN produtos p ON p.id = pr.produto_id
+        WHERE pr.preco_min_brl IS NOT NULL
+        GROUP BY p.nome_produto
+    """), connection, params={"todos": TODOS_LOCAIS})
+
+
+def decompor_serie(serie_mensal):
+    """Decomposição STL robusta de uma série mensal (índice mensal regular)"""
+    resultado = STL(serie_mensal, period=12, robust=True).fit()
+    return pd.DataFrame({
+        'data': serie_mensal.index.strftime('%Y-%m-%d'),
+        'observado': serie_mensal.values,
+        'tendencia': resultado.trend.values,
+        'sazonal': resultado.seasonal.values,
+        'residuo': resultado.resid.values
+    })
+
+
+def serie_mensal(df_serie):
+    """Média mensal de preços (em BRL) com meses faltantes interpolados"""
+    serie = df_serie.set_index('data')['preco_min'].resample('MS').mean()
+    return serie.interpolate(limit_direction='both')
+
+
+def atualizar_sazonalidade(engine):
+    """Recalcula a decomposição STL apenas das séries cuja versão mudou desde o último cálculo.
+
+    Séries que sumiram (p.ex. por um desfazer ou uma restauração) saem do cache.
+    Pensado para rodar em segundo plano depois de cada ingestão; a tela só lê o cache.
+    """
+    with engine.begin() as connection:
+        garantir_tabelas_sazonalidade(connection)
+        versoes = versoes_series(connection)
+        cache = pd.read_sql_query(text("SELECT produto, local_id, versao FROM sazonalidade_series"), connection)
+
+        comparacao = versoes.merge(cache, on=['produto', 'local_id'], how='outer', suffixes=('', '_cache'))
+        alteradas = comparacao[comparacao['versao'] != comparacao['versao_cache']]
+        if alteradas.empty:
+            return 0
+
+        sumidas = alteradas[alteradas['versao'].isna()]
+        if not sumidas.empty:
+            chaves = [
+                {"produto": produto, "local_id": int(local_id)}
+                for produto, local_id in zip(sumidas['produto'], sumidas['local_id'])
+            ]
+            connection.execute(text("DELETE FROM sazonalidade WHERE produto = :produto AND local_id = :local_id"), chaves)
+            connection.execute(text(
+                "DELETE FROM sazonalidade_series WHERE produto = :produto AND local_id = :local_id"
+            ), chaves)
+        alteradas = alteradas.dropna(subset=['versao'])
+        if alteradas.empty:
+            print(f"✅ Sazonalidade: {len(sumidas)} série(s) removida(s)")
+            return len(sumidas)
+
+        df = pd.read_sql_query(text("""
+            SELECT p.nome_produto AS produto, pr.local_id, pr.data, pr.preco_min_brl AS preco_min
+            FROM precos pr
+            JOIN produtos p ON p.id = pr.produto_id
+            WHERE pr.preco_min_brl IS NOT NULL AND p.nome_produto = ANY(:produtos)
+        """), connection, params={"produtos": alteradas['produto'].unique().tolist()})
+        df['data'] = pd.to_datetime(df['data'], errors='coerce')
+        df = df.dropna(subset=['data'])
+
+        for _, serie_info in alteradas.iterrows():
+            df_serie = df[df['produto'] == serie_info['produto']]
+            if serie_info['local_id'] != TODOS_LOCAIS:
+                df_serie = df_serie[df_serie['local_id'] == serie_info['local_id']]
+
+            mensal = serie_mensal(df_serie) if not df_serie.empty else pd.Series(dtype=float)
+            chave = {"produto": serie_info['produto'], "local_id": int(serie_info['local_id'])}
+
+            connection.execute(text("DELETE FROM sazonalidade WHERE produto = :produto AND local_id = :local_id"), chave)
+            if len(mensal) >= MESES_MINIMOS:
+                componentes = decompor_serie(mensal)
+                componentes['produto'] = chave['produto']
+                componentes['local_id'] = chave['local_id']
+                componentes.to_sql("sazonalidade", connection, if_exists="append", index=False)
+
+            connection.execute(text("""
+                INSERT INTO sazonalidade_series (produto, local_id, versao, n_meses, calculado_em)
+                VALUES (:produto, :local_id, :versao, :n_meses, NOW())
+                ON CONFLICT (produto, local_id) DO UPDATE
+                SET versao = EXCLUDED.versao, n_meses = EXCLUDED.n_meses, calculado_em = EXCLUDED.calculado_em
+            """), {**chave, "versao": serie_info['versao'], "n_meses": len(mensal)})
+
+    print(f"✅ Sazonalidade recalculada para {len(alteradas)} série(s), {len(sumidas)} removida(s)")
+    return len(alteradas) + len(sumidas)
+
+
+def ler_sazonalidade(engine, produto, local_id=TODOS_LOCAIS):
+    """Lê do cache os componentes de uma série e o número de meses disponíveis"""
+    with engine.begin() as connection:
+        garantir_tabelas_sazonalidade(connection)
+        componentes = pd.read_sql_query(text("""
+            SELECT data, observado, tendencia, sazonal, residuo
+            FROM sazonalidade
+            WHERE produto = :produto AND local_id = :local_id
+            ORDER BY data
+        """), connection, params={"produto": produto, "local_id": local_id})
+        info = connection.execute(text("""
+            SELECT n_meses FROM sazonalidade_series WHERE produto = :produto AND local_id = :local_id
+        """), {"produto": produto, "local_id": local_id}).fetchone()
+
+    componentes['data'] = pd.to_datetime(componentes['data'])
+    return componentes, (info[0] if info else None)
@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from acoes import versao_dados
+from fretes import ler_matriz_fretes
+from custo_entregue import ler_custos_entregues, origens_mais_baratas
+from barter import ler_barter
+from previsao_lote import ler_previsoes_lote
+from migracoes import garantir_esquema
+
+# API HTTP somente leitura sobre os dados e as previsões em lote (biblioteca padrão, sem framework).
+# Respostas ficam em cache pela versão global dos dados e levam ETag; If-None-Match devolve 304.
+# Uso: python servidor_http.py --porta 8800
+
+PORTA_PADRAO = 8800
+MAX_RESPOSTAS_CACHE = 256
+# A versão dos dados é consultada no banco no máximo uma vez por intervalo
+INTERVALO_VERSAO_S = 1.0
+
+
+class CacheRespostas:
+    """LRU de respostas serializadas, chaveado por (versão dos dados, caminho com query normalizada)"""
+
+    def __init__(self, engine, max_respostas=MAX_RESPOSTAS_CACHE):
+        self.engine = engine
+        self.max_respostas = max_respostas
+        self.respostas = OrderedDict()
+        self.lock = threading.Lock()
+        self.versao = None
+        self.versao_lida_em = 0.0
+
+    def versao_atual(self):
+        with self.lock:
+            if time.monotonic() - self.versao_lida_em < INTERVALO_VERSAO_S:
+                return self.versao
+        with self.engine.begin() as connection:
+            versao = versao_dados(connection)
+        with self.lock:
+            if versao != self.versao:
+                self.respostas.clear()
+            self.versao, self.versao_lida_em = versao, time.monotonic()
+        return versao
+
+    def obter(self, chave, gerar):
+        """Resposta (etag, corpo) da chave; `gerar()` só roda quando ela não está no cache"""
+        versao = self.versao_atual()
+        with self.lock:
+            if (versao, chave) in self.respostas:
+                self.respostas.move_to_end((versao, chave))
+                return self.respostas[(versao, chave)]
+
+        corpo = gerar()
+        etag = '"' + hashlib.sha1(f"{versao}:{chave}".encode("utf-8")).hexdigest()[:20] + '"'
+        with self.lock:
+            self.respostas[(versao, chave)] = (etag, corpo)
+            while len(self.respostas) > self.max_respostas:
+                self.respostas.popitem(last=False)
+        return etag, corpo
+
+
+class ErroRequisicao(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def parametro(params, nome, tipo=str, obrigatorio=False):
+    valores = params.get(nome)
+    if not valores:
+        if obrigatorio:
+            raise ErroRequisicao(400, f"Parâmetro obrigatório: {nome}")
+        return None
+    try:
+        return tipo(valores[0])
+    except ValueError:
+        raise ErroRequisicao(400, f"Parâmetro inválido: {nome}")
+
+
+def filtros_sql(condicoes):
+    """Monta o WHERE a partir de (trecho SQL, nome, valor), ignorando os valores ausentes"""
+    ativos = [(trecho, nome, valor) for trecho, nome, valor in condicoes if valor is not None]
+    where = " AND ".join(trecho for trecho, _, _ in ativos) or "TRUE"
+    return where, {nome: valor for trecho, nome, valor in ativos if f":{nome}" in trecho}
+
+
+def consultar_precos(engine, params):
+    condicoes = [
+        ("p.nome_produto = :produto", "produto", parametro(params, "produto")),
+        ("l.nome = :local", "local", parametro(params, "local")),
+        ("pr.moeda = :moeda", "moeda", parametro(params, "moeda")),
+        ("pr.data >= :inicio", "inicio", parametro(params, "inicio")),
+        ("pr.data <= :fim", "fim", parametro(params, "fim")),
+    ]
+    # Outliers marcados na ingestão ficam de fora, a menos que ?outliers=1
+    if parametro(params, "outliers") != "1":
+        condicoes.append(("NOT COALESCE(pr.outlier, FALSE)", None, True))
+    where, valores = filtros_sql(condicoes)
+    with engine.begin() as connection:
+        return pd.read_sql_query(text(f"""
+            SELECT pr.id, p.nome_produto AS produto, l.nome AS local, pr.data, pr.preco_min, pr.preco_max,
+                   pr.moeda, pr.preco_min_usd, pr.preco_min_brl, pr.preco_max_usd, pr.preco_max_brl,
+                   pr.usd_brl_aplicado, pr.modalidade, pr.variacao, COALESCE(pr.outlier, FALSE) AS outlier
+            FROM precos pr
+            JOIN produtos p ON p.id = pr.produto_id
+            JOIN locais l ON l.id = pr.local_id
+            WHERE {where}
+            ORDER BY pr.data, pr.id
+        """), connection, params=valores)
+
+
+def consultar_fretes(engine, params):
+    where, valores = filtros_sql([
+        ("l1.nome = :origem", "origem", parametro(params, "origem")),
+        ("l2.nome = :destino", "destino", parametro(params, "destino")),
+        ("f.tipo = :tipo", "tipo", parametro(params, "tipo")),
+        ("f.data >= :inicio", "inicio", parametro(params, "inicio")),
+        ("f.data <= :fim", "fim", parametro(params, "fim")),
+    ])
+    return pd.read_sql_query(text(f"""
+        SELECT f.id, l1.nome AS origem, l2.nome AS destino, f.tipo, f.data, f.custo_usd, f.custo_brl,
+               f.custo_final_usd, f.custo_final_brl, f.usd_brl_aplicado
+        FROM fretes f
+        JOIN locais l1 ON l1.id = f.origem_id
+        JOIN locais l2 ON l2.id = f.destino_id
+        WHERE {where}
+        ORDER BY f.data, f.id
+    """), engine, params=valores)
+
+
+def consultar_matriz_fretes(engine, params):
+    return ler_matriz_fretes(engine)
+
+
+def consultar_custos_entregues(engine, params):
+    return ler_custos_entregues(engine, parametro(params, "produto_id", int), parametro(params, "destino_id", int))
+
+
+def consultar_origem_mais_barata(engine, params):
+    return origens_mais_baratas(
+        engine,
+        parametro(params, "destino_id", int, obrigatorio=True),
+        parametro(params, "produto_id", int),
+        parametro(params, "n", int) or 1,
+    )
+
+
+def consultar_barter(engine, params):
+    where, valores = filtros_sql([
+        ("b.cultura = :cultura", "cultura", parametro(params, "cultura")),
+        ("b.estado = :estado", "estado", parametro(params, "estado")),
+        ("p.nome_produto = :produto", "produto", parametro(params, "produto")),
+    ])
+    return pd.read_sql_query(text(f"""
+        SELECT b.id, b.cultura, p.nome_produto AS produto, b.estado, b.data, b.preco_cultura,
+               b.barter_ratio, b.barter_index
+        FROM barter_ratios b
+        LEFT JOIN produtos p ON p.id = b.produto_id
+        WHERE {where}
+        ORDER BY b.data, b.id
+    """), engine, params=valores)
+
+
+def consultar_analise_barter(engine, params):
+    return ler_barter(
+        engine, parametro(params, "cultura"), parametro(params, "estado"), parametro(params, "produto_id", int)
+    )
+
+
+def consultar_previsoes(engine, params):
+    previsoes = ler_previsoes_lote(
+        engine,
+        parametro(params, "produto", obrigatorio=True),
+        parametro(params, "origem_id", int),
+        parametro(params, "destino_id", int),
+    )
+    previsoes['metricas'] = previsoes['metricas'].apply(json.dumps)
+    return previsoes
+
+
+ROTAS = {
+    "/precos": consultar_precos,
+    "/fretes": consultar_fretes,
+    "/fretes/matriz": consultar_matriz_fretes,
+    "/custo-entregue": consultar_custos_entregues,
+    "/custo-entregue/mais-barata": consultar_origem_mais_barata,
+    "/barter": consultar_barter,
+    "/barter/analise": consultar_analise_barter,
+    "/previsoes": consultar_previsoes,
+}
+
+
+def criar_handler(engine, cache):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def responder(self, status, corpo=b"", etag=None):
+            self.send_response(status)
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+            if corpo:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            if corpo:
+                self.wfile.write(corpo)
+
+        def responder_erro(self, status, mensagem):
+            self.responder(status, json.dumps({"erro": mensagem}, ensure_ascii=False).encode("utf-8"))
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/saude":
+                return self.responder(200, json.dumps({"status": "ok", "versao_dados": cache.versao_atual()}).encode("utf-8"))
+
+            consulta = ROTAS.get(url.path.rstrip("/"))
+            if consulta is None:
+                return self.responder_erro(404, f"Rota desconhecida: {url.path}")
+
+            params = parse_qs(url.query)
+            # Query normalizada (ordenada) para que a mesma consulta sempre caia na mesma chave
+            chave = f"{url.path.rstrip('/')}?{urlencode(sorted((k, v) for k, vs in params.items() for v in vs))}"
+            try:
+                etag, corpo = cache.obter(chave, lambda: consulta(engine, params).to_json(
+                    orient="records", date_format="iso", force_ascii=False
+                ).encode("utf-8"))
+            except ErroRequisicao as e:
+                return self.responder_erro(e.status, str(e))
+            except Exception as e:
+                print(f"❌ Erro em {self.path}: {e}")
+                return self.responder_erro(500, "Erro interno ao consultar os dados")
+
+            if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                return self.responder(304, etag=etag)
+            self.responder(200, corpo, etag)
+
+        def log_message(self, formato, *args):
+            # Um log por requisição atrasaria o teste de carga; erros já são impressos acima
+            pass
+
+    return Handler
+
+
+def criar_servidor(engine, host="127.0.0.1", porta=PORTA_PADRAO):
+    return ThreadingHTTPServer((host, porta), criar_handler(engine, CacheRespostas(engine)))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="API HTTP de preços, fretes, barter e previsões")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    args = parser.parse_args()
+
+    engine = create_engine(os.getenv("DATABASE_URL"))
+    garantir_esquema(engine)
+    servidor = criar_servidor(engine, args.host, args.porta)
+    print(f"🌐 API ouvindo em http://{args.host}:{args.porta} (rotas: /saude, {', '.join(ROTAS)})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,338 @@
+import json
+import re
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# Validação do JSON extraído pelo Gemini antes de ir para o banco. O esquema de cada uma das sete seções
+# é compilado uma vez em verificações por coluna (pandas), aplicadas à seção inteira de uma vez:
+# converte tipos (números como texto, datas em outros formatos), normaliza textos e rejeita as linhas
+# que continuam inválidas, com o motivo. Cada relatório gera métricas de qualidade por seção.
+
+SECOES = ["produtos", "locais", "precos", "fretes", "barter_ratios", "cambio", "custos_portos"]
+
+DATA_MINIMA = pd.Timestamp("2000-01-01")
+# Datas além disso no futuro são tratadas como erro de extração
+HORIZONTE_DATA_FUTURA = pd.Timedelta(days=60)
+
+# Campo: (tipo, obrigatório, opções). Campos aninhados usam "objeto.campo".
+# Tipos: texto, numero, data, enum (opções: valores aceitos) e positivo/nao_negativo (números com limite)
+ESQUEMAS = {
+    "produtos": {
+        "nome_produto": ("texto", True, None),
+        "formulacao": ("texto", False, None),
+        "origem": ("texto", False, None),
+        "tipo": ("texto", False, None),
+        "unidade": ("texto", False, None),
+    },
+    "locais": {
+        "nome": ("texto", True, None),
+        "estado": ("texto", False, None),
+        "pais": ("texto", False, None),
+        "tipo": ("texto", False, None),
+    },
+    "precos": {
+        "produto.nome_produto": ("texto", True, None),
+        "local.nome": ("texto", True, None),
+        "data": ("data", True, None),
+        "tipo_preco": ("texto", False, None),
+        "modalidade": ("texto", False, None),
+        "fonte": ("texto", False, None),
+        "moeda": ("enum", True, ["USD", "BRL"]),
+        "preco_min": ("positivo", True, None),
+        "preco_max": ("positivo", False, None),
+        "variacao": ("numero", False, None),
+        "simbolo_var": ("texto", False, None),
+    },
+    "fretes": {
+        "tipo": ("texto", False, None),
+        "origem.nome": ("texto", True, None),
+        "destino.nome": ("texto", True, None),
+        "data": ("data", True, None),
+        "custo_usd": ("nao_negativo", False, None),
+        "custo_brl": ("nao_negativo", False, None),
+    },
+    "barter_ratios": {
+        "cultura": ("texto", True, None),
+        "produto.nome_produto": ("texto", True, None),
+        "estado": ("texto", False, None),
+        "data": ("data", True, None),
+        "preco_cultura": ("positivo", False, None),
+        "barter_ratio": ("positivo", True, None),
+        "barter_index": ("numero", False, None),
+    },
+    "cambio": {
+        "data": ("data", True, None),
+        "usd_brl": ("positivo", True, None),
+    },
+    "custos_portos": {
+        "porto": ("texto", True, None),
+        "data": ("data", True, None),
+        "armazenagem": ("nao_negativo", False, None),
+        "demurrage": ("nao_negativo", False, None),
+        "custo_total": ("nao_negativo", False, None),
+    },
+}
+
+# Datas brasileiras (dia/mês/ano) que o Gemini às vezes devolve no lugar de YYYY-MM-DD
+PADRAO_DATA_BR = re.compile(r"^(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})$")
+
+# Formatos de número como texto, na ordem de teste, com a conversão para o formato do Python.
+# Vírgula com exatamente 3 dígitos depois é milhar ("1,234" = 1234); ponto único é decimal ("450.5").
+FORMATOS_NUMERO = [
+    # 450 / 450.5
+    (re.compile(r"-?\d+(\.\d+)?"), lambda s: s),
+    # 1,150.00 / 1,234 / 1,234,567
+    (re.compile(r"-?\d{1,3}(,\d{3})+(\.\d+)?"), lambda s: s.str.replace(",", "", regex=False)),
+    # 1.150,00 / 1.234.567
+    (re.compile(r"-?\d{1,3}(\.\d{3})+(,\d+)?"),
+     lambda s: s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)),
+    # 450,5 / 12,50
+    (re.compile(r"-?\d+,\d+"), lambda s: s.str.replace(",", ".", regex=False)),
+]
+
+# Faixa plausível da cotação USD/BRL; fora dela é quase sempre outro número lido no lugar
+FAIXA_USD_BRL = (1.0, 20.0)
+
+
+def garantir_tabela_qualidade(connection):
+    """Cria a tabela de métricas de qualidade por relatório e seção, se ainda não existir"""
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS qualidade_relatorios (
+            id SERIAL PRIMARY KEY,
+            relatorio TEXT,
+            secao TEXT,
+            total INTEGER,
+            aceitas INTEGER,
+            rejeitadas INTEGER,
+            convertidas INTEGER,
+            motivos TEXT,
+            duracao_ms REAL,
+            criado_em TIMESTAMP DEFAULT NOW()
+        )
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_qualidade_relatorios_criado_em ON qualidade_relatorios (criado_em DESC)"))
+
+
+# ----------------------- conversões por tipo (vetorizadas) -----------------------
+
+def converter_texto(serie):
+    """Strings sem espaços nas pontas; vazios e não-strings escalares viram texto ou None"""
+    texto = serie.where(serie.isna(), serie.astype(str)).str.strip()
+    return texto.where(texto.str.len() > 0), pd.Series(False, index=serie.index)
+
+
+def converter_numero(serie):
+    """Números, inclusive como texto ("1.234,56", "1,150.00", "US$ 450", "450.5"); retorna (valores, convertidos).
+
+    O separador decimal é o último de vírgula/ponto; vírgula seguida de exatamente 3 dígitos é milhar.
+    Textos que não se encaixam em nenhum formato (p.ex. "1,2.3") ficam ambíguos e viram NaN.
+    """
+    eh_texto = serie.map(type) == str
+    numeros = pd.to_numeric(serie.where(~eh_texto), errors='coerce')
+    if eh_texto.any():
+        bruto = serie[eh_texto].str.replace(r"[^\d,.\-]", "", regex=True)
+        formatos = [bruto.str.fullmatch(padrao) for padrao, _ in FORMATOS_NUMERO]
+        limpo = pd.Series(np.select(
+            formatos, [conversao(bruto) for _, conversao in FORMATOS_NUMERO], default=""
+        ), index=bruto.index)
+        numeros[eh_texto] = pd.to_numeric(limpo, errors='coerce')
+    return numeros.astype(float), eh_texto & numeros.notna()
+
+
+def converter_data(serie):
+    """Datas ISO; as que estão como dia/mês/ano são convertidas. Retorna texto YYYY-MM-DD"""
+    texto = serie.where(serie.isna(), serie.astype(str)).str.strip()
+    datas = pd.to_datetime(texto, format="%Y-%m-%d", errors='coerce')
+    faltando = datas.isna() & texto.notna()
+    if faltando.any():
+        partes = texto[faltando].str.extract(PADRAO_DATA_BR)
+        iso = partes[2] + "-" + partes[1].str.zfill(2) + "-" + partes[0].str.zfill(2)
+        datas[faltando] = pd.to_datetime(iso, format="%Y-%m-%d", errors='coerce')
+    limite = pd.Timestamp.today().normalize() + HORIZONTE_DATA_FUTURA
+    datas = datas.where((datas >= DATA_MINIMA) & (datas <= limite))
+    return datas.dt.strftime("%Y-%m-%d"), faltando & datas.notna()
+
+
+def compilar_campo(tipo, opcoes):
+    """Função (serie) -> (valores convertidos, convertidos?, válidos?) do campo"""
+    if tipo == "texto":
+        def verificar(serie):
+            valores, convertidos = converter_texto(serie)
+            return valores, convertidos, valores.notna()
+    elif tipo == "enum":
+        aceitos = set(opcoes)
+        def verificar(serie):
+            valores, _ = converter_texto(serie)
+            valores = valores.str.upper()
+            return valores, pd.Series(False, index=serie.index), valores.isin(aceitos)
+    elif tipo == "data":
+        def verificar(serie):
+            valores, convertidos = converter_data(serie)
+            return valores, convertidos, valores.notna()
+    else:
+        def verificar(serie):
+            valores, convertidos = converter_numero(serie)
+            validos = valores.notna() & np.isfinite(valores)
+            if tipo == "positivo":
+                validos &= valores > 0
+            elif tipo == "nao_negativo":
+                validos &= valores >= 0
+            return valores.where(validos), convertidos, validos
+    return verificar
+
+
+def compilar_extracao(campo):
+    """Função (registros) -> Series com o valor bruto do campo ("objeto.campo" para campos aninhados)"""
+    if "." in campo:
+        objeto, chave = campo.split(".", 1)
+        return lambda registros: pd.Series(
+            [r[objeto].get(chave) if isinstance(r.get(objeto), dict) else None for r in registros], dtype=object
+        )
+    return lambda registros: pd.Series([r.get(campo) for r in registros], dtype=object)
+
+
+def compilar_esquema(esquema):
+    """campo -> (extração, verificação, obrigatório)"""
+    return {
+        campo: (compilar_extracao(campo), compilar_campo(tipo, opcoes), obrigatorio)
+        for campo, (tipo, obrigatorio, opcoes) in esquema.items()
+    }
+
+
+ESQUEMAS_COMPILADOS = {secao: compilar_esquema(esquema) for secao, esquema in ESQUEMAS.items()}
+
+
+# ----------------------- regras entre campos de uma seção -----------------------
+
+def regras_secao(secao, df):
+    """Ajustes e rejeições que dependem de mais de um campo; retorna Series de motivo (None = ok)"""
+    motivo = pd.Series(None, index=df.index, dtype=object)
+    if secao == "precos":
+        # Sem máximo, o preço é pontual; máximo menor que o mínimo costuma ser inversão de colunas
+        df["preco_max"] = df["preco_max"].fillna(df["preco_min"])
+        invertido = df["preco_max"] < df["preco_min"]
+        df.loc[invertido, ["preco_min", "preco_max"]] = df.loc[invertido, ["preco_max", "preco_min"]].to_numpy()
+    elif secao == "fretes":
+        motivo = motivo.mask(df["custo_usd"].isna() & df["custo_brl"].isna(), "fretes: sem custo em USD nem BRL")
+    elif secao == "cambio":
+        fora = ~df["usd_brl"].between(*FAIXA_USD_BRL)
+        motivo = motivo.mask(fora, "cambio: usd_brl fora da faixa plausível")
+    elif secao == "custos_portos":
+        df["custo_total"] = df["custo_total"].fillna(df["armazenagem"].fillna(0) + df["demurrage"].fillna(0))
+        sem_custo = df[["armazenagem", "demurrage", "custo_total"]].isna().all(axis=1) | (df["custo_total"] <= 0)
+        motivo = motivo.mask(sem_custo, "custos_portos: sem custo")
+    return motivo
+
+
+# ----------------------- validação de uma seção e do relatório -----------------------
+
+def validar_secao(secao, registros):
+    """Valida uma seção inteira; retorna (registros aceitos convertidos, métricas da seção)"""
+    inicio = time.perf_counter()
+    registros = registros if isinstance(registros, list) else []
+    objetos = [r for r in registros if isinstance(r, dict)]
+    motivos = Counter({f"{secao}: linha não é um objeto": len(registros) - len(objetos)})
+
+    aceitos = []
+    convertidas = 0
+    if objetos:
+        # Uma coluna por campo do esquema (campos aninhados como "objeto.campo")
+        df = pd.DataFrame(index=pd.RangeIndex(len(objetos)))
+        valido = pd.Series(True, index=df.index)
+        convertidos_linha = pd.Series(0, index=df.index)
+        for campo, (extrair, verificar, obrigatorio) in ESQUEMAS_COMPILADOS[secao].items():
+            valores, convertidos, validos = verificar(extrair(objetos))
+            convertidos_linha += (convertidos & validos).astype(int)
+            if obrigatorio:
+                invalido = ~validos
+                motivos.update({f"{secao}: {campo} ausente ou inválido": int((invalido & valido).sum())})
+                valido &= validos
+            df[campo] = valores.where(validos)
+
+        motivo_regras = regras_secao(secao, df)
+        rejeitadas_regras = motivo_regras.notna() & valido
+        motivos.update(motivo_regras[rejeitadas_regras].value_counts().to_dict())
+        valido &= ~motivo_regras.notna()
+        convertidas = int(convertidos_linha[valido].sum())
+
+        aceitos = reconstruir_registros(secao, objetos, df, valido)
+
+    metricas = {
+        "secao": secao,
+        "total": len(registros),
+        "aceitas": len(aceitos),
+        "rejeitadas": len(registros) - len(aceitos),
+        "convertidas": convertidas,
+        "motivos": {motivo: n for motivo, n in motivos.items() if n},
+        "duracao_ms": round((time.perf_counter() - inicio) * 1000, 2),
+    }
+    return aceitos, metricas
+
+
+def reconstruir_registros(secao, objetos, df, valido):
+    """Registros aceitos no formato original, com os campos do esquema substituídos pelos convertidos"""
+    campos = list(ESQUEMAS[secao])
+    caminhos = [campo.split(".", 1) if "." in campo else [campo] for campo in campos]
+    aninhados = {caminho[0] for caminho in caminhos if len(caminho) == 2}
+    selecao = df.loc[valido, campos]
+    valores = selecao.astype(object).where(selecao.notna(), None)
+
+    aceitos = []
+    for posicao, linha in zip(np.flatnonzero(valido.to_numpy()), valores.itertuples(index=False, name=None)):
+        registro = dict(objetos[posicao])
+        for objeto in aninhados:
+            registro[objeto] = dict(registro[objeto])
+        for caminho, valor in zip(caminhos, linha):
+            if len(caminho) == 2:
+                registro[caminho[0]][caminho[1]] = valor
+            else:
+                registro[caminho[0]] = valor
+        aceitos.append(registro)
+    return aceitos
+
+
+def validar_relatorio(dados):
+    """Valida as sete seções do JSON extraído; retorna (dados só com as linhas aceitas, métricas por seção)"""
+    dados = dados if isinstance(dados, dict) else {}
+    validados, qualidade = {}, []
+    for secao in SECOES:
+        validados[secao], metricas = validar_secao(secao, dados.get(secao, []))
+        qualidade.append(metricas)
+
+    total = sum(m["total"] for m in qualidade)
+    rejeitadas = sum(m["rejeitadas"] for m in qualidade)
+    print(f"🧪 Validação: {total - rejeitadas}/{total} linha(s) aceitas, {rejeitadas} rejeitada(s), "
+          f"{sum(m['convertidas'] for m in qualidade)} valor(es) convertido(s)")
+    for motivo, n in Counter({k: v for m in qualidade for k, v in m["motivos"].items()}).most_common(5):
+        print(f"   ⚠️ {n}x {motivo}")
+    return validados, qualidade
+
+
+def salvar_qualidade(connection, relatorio, qualidade):
+    """Grava as métricas de qualidade de um relatório (uma linha por seção)"""
+    garantir_tabela_qualidade(connection)
+    connection.execute(text("""
+        INSERT INTO qualidade_relatorios (relatorio, secao, total, aceitas, rejeitadas, convertidas, motivos, duracao_ms)
+        VALUES (:relatorio, :secao, :total, :aceitas, :rejeitadas, :convertidas, :motivos, :duracao_ms)
+    """), [{**m, "relatorio": relatorio, "motivos": json.dumps(m["motivos"], ensure_ascii=False)} for m in qualidade])
+
+
+def ler_qualidade_recente(engine, n_relatorios=5):
+    """Métricas de qualidade dos últimos relatórios importados, uma linha por relatório e seção"""
+    with engine.begin() as connection:
+        garantir_tabela_qualidade(connection)
+        df = pd.read_sql_query(text("""
+            SELECT relatorio, secao, total, aceitas, rejeitadas, convertidas, motivos, criado_em
+            FROM qualidade_relatorios
+            WHERE criado_em >= (
+                SELECT COALESCE(MIN(criado_em), NOW()) FROM (
+                    SELECT DISTINCT criado_em FROM qualidade_relatorios ORDER BY criado_em DESC LIMIT :n
+                ) ultimos
+            )
+            ORDER BY criado_em DESC, id
+        """), connection, params={"n": n_relatorios})
+    df['motivos'] = df['motivos'].apply(json.loads)
+    return df
@@ -0,0 +1,133 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.metrics import mean_absolute_percentage_error, mean_absolute_error, mean_squared_error
+from threadpoolctl import threadpool_limits
+from catalogo_modelos import modelo_univariado
+
+# Validação cruzada temporal de vários modelos com os folds distribuídos em processos,
+# respeitando um orçamento global de núcleos: processos x threads por modelo <= orçamento.
+
+# Máximo de threads que cada modelo usa dentro de um fold
+THREADS_POR_MODELO = {
+    'xgb': 2,
+    'rf': 2,
+}
+THREADS_PADRAO = 1
+# Nível de cobertura dos intervalos conformais calculados com os resíduos fora da amostra
+NIVEL_CONFORMAL = 0.95
+# Abaixo disso o custo de subir processos supera o ganho; os folds rodam em série
+LINHAS_MINIMAS_POOL = 500
+
+
+def nucleos_disponiveis():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def limitar_threads(pipeline, n_threads):
+    """Ajusta n_jobs do estimador final do pipeline (quando ele tem esse parâmetro)"""
+    if 'n_jobs' in pipeline.steps[-1][1].get_params():
+        pipeline.set_params(**{f'{pipeline.steps[-1][0]}__n_jobs': n_threads})
+    return pipeline
+
+
+def avaliar_fold(nome, pipeline, X, y, train_idx, val_idx, n_threads):
+    """Treina e avalia um modelo em um fold, com as threads limitadas; roda em um processo do pool.
+
+    Todos os candidatos são avaliados em previsões de um passo: os modelos com features recebem os lags
+    reais de cada linha da validação, e os univariados (naive, ETS) preveem cada ponto a partir dos
+    valores reais anteriores a ele, com o modelo ajustado só no treino.
+    """
+    pipeline = limitar_threads(clone(pipeline), n_threads)
+    X_train, X_val = X.iloc[train_idx], X.iloc[val_idx]
+    y_train, y_val = y.iloc[train_idx], y.iloc[val_idx]
+
+    with threadpool_limits(limits=n_threads):
+        inicio = time.perf_counter()
+        pipeline.fit(X_train, y_train)
+        tempo_fit = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        if modelo_univariado(pipeline):
+            y_pred = pipeline.steps[-1][1].prever_um_passo(y.iloc[:val_idx[-1] + 1], len(val_idx))
+        else:
+            y_pred = pipeline.predict(X_val)
+        tempo_predict = time.perf_counter() - inicio
+
+    return nome, {
+        'mae': mean_absolute_error(y_val, y_pred),
+        'rmse': np.sqrt(mean_squared_error(y_val, y_pred)),
+        'mape': mean_absolute_percentage_error(y_val, y_pred),
+        'tempo_fit': tempo_fit,
+        'tempo_predict': tempo_predict,
+        # Resíduos fora da amostra, todos de previsões de um passo (ver acima)
+        'residuos': np.asarray(y_val) - y_pred,
+    }
+
+
+def escore_conformal(residuos, nivel=NIVEL_CONFORMAL):
+    """Quantil conformal dos resíduos absolutos de um passo.
+
+    Os resíduos da validação não são normalizados pela posição no fold: avaliar_fold produz só previsões
+    de um passo, para todos os modelos. O crescimento com o horizonte fica em intervalos_conformais.
+    """
+    escores = np.abs(residuos)
+    n = len(escores)
+    if n == 0:
+        return np.nan
+    # Quantil com correção de amostra finita: ceil((n+1) * nivel) / n
+    q = min(1.0, np.ceil((n + 1) * nivel) / n)
+    return float(np.quantile(escores, q, method='higher'))
+
+
+def resumir_folds(folds):
+    """Métricas médias (e desvios) de um modelo, no mesmo formato de validacao_temporal, mais os tempos e o escore conformal"""
+    return {
+        'MAE': np.mean([f['mae'] for f in folds]),
+        'RMSE': np.mean([f['rmse'] for f in folds]),
+        'MAPE': np.mean([f['mape'] for f in folds]),
+        'MAE_std': np.std([f['mae'] for f in folds]),
+        'RMSE_std': np.std([f['rmse'] for f in folds]),
+        'MAPE_std': np.std([f['mape'] for f in folds]),
+        'tempo_fit_s': np.sum([f['tempo_fit'] for f in folds]),
+        'tempo_predict_s': np.sum([f['tempo_predict'] for f in folds]),
+        'escore_conformal': escore_conformal(np.concatenate([f['residuos'] for f in folds])),
+        'nivel_conformal': NIVEL_CONFORMAL,
+    }
+
+
+def validacao_cruzada_paralela(pipelines, X, y, n_splits=3, orcamento_nucleos=None, threads_por_modelo=None):
+    """Avalia todos os pipelines em todos os folds (TimeSeriesSplit) distribuindo as tarefas em processos.
+
+    `pipelines` é um dict nome -> pipeline. Cada tarefa usa no máximo threads_por_modelo[nome] threads
+    (limitadas também ao orçamento), e o número de processos é o orçamento dividido pelo maior limite,
+    para que o total de threads nunca passe do orçamento. Com orçamento de 1 núcleo (ou séries curtas)
+    tudo roda em série, sem pool. Retorna dict nome -> métricas.
+    """
+    orcamento_nucleos = max(1, orcamento_nucleos or nucleos_disponiveis())
+    threads_por_modelo = {**THREADS_POR_MODELO, **(threads_por_modelo or {})}
+    threads = {nome: max(1, min(threads_por_modelo.get(nome, THREADS_PADRAO), orcamento_nucleos)) for nome in pipelines}
+
+    tarefas = [
+        (nome, pipeline, X, y, train_idx, val_idx, threads[nome])
+        for nome, pipeline in pipelines.items()
+        for train_idx, val_idx in TimeSeriesSplit(n_splits=n_splits).split(X)
+    ]
+    processos = min(len(tarefas), orcamento_nucleos // max(threads.values()))
+
+    if processos <= 1 or len(X) < LINHAS_MINIMAS_POOL:
+        resultados = [avaliar_fold(*tarefa) for tarefa in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=processos) as pool:
+            resultados = list(pool.map(avaliar_fold, *zip(*tarefas)))
+
+    folds_por_modelo = {nome: [] for nome in pipelines}
+    for nome, fold in resultados:
+        folds_por_modelo[nome].append(fold)
+    return {nome: resumir_folds(folds) for nome, folds in folds_por_modelo.items()}
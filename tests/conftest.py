@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos de src/ se importam pelo nome (o app roda de dentro de src/)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
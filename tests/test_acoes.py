@@ -0,0 +1,20 @@
+from acoes import faixas_de_ids, listar_faixas, filtro_faixas, contar_linhas_faixas
+
+
+def test_faixas_de_ids_separa_ids_intercalados_por_outra_transacao():
+    # 13 e 14 foram inseridos por outra transação ao mesmo tempo
+    faixas = faixas_de_ids({"precos": [10, 11, 12, 15, 16], "fretes": [7], "cambio": []})
+    assert faixas == {"precos": [[10, 12], [15, 16]], "fretes": [[7, 7]]}
+    assert contar_linhas_faixas(faixas) == 6
+
+
+def test_listar_faixas_aceita_entradas_antigas_do_log():
+    assert listar_faixas({"precos": [3, 9], "fretes": [[1, 2], [5, 5]]}) == {
+        "precos": [[3, 9]], "fretes": [[1, 2], [5, 5]],
+    }
+
+
+def test_filtro_faixas():
+    filtro, params = filtro_faixas([[10, 12], [15, 16]])
+    assert filtro == "(id BETWEEN :primeiro_0 AND :ultimo_0 OR id BETWEEN :primeiro_1 AND :ultimo_1)"
+    assert params == {"primeiro_0": 10, "ultimo_0": 12, "primeiro_1": 15, "ultimo_1": 16}
@@ -0,0 +1,26 @@
+import pytest
+from entidades import IndiceNomes, normalizar_nome, LIMIAR_SIMILARIDADE, LIMIAR_CANDIDATAS
+
+
+def indice(*nomes):
+    resultado = IndiceNomes()
+    for entidade_id, nome in enumerate(nomes, 1):
+        resultado.adicionar(entidade_id, normalizar_nome(nome))
+    return resultado
+
+
+@pytest.mark.parametrize("existente, novo", [("Santos", "Santos SP"), ("Rio Grande", "Rio Grande do Sul")])
+def test_nomes_so_parecidos_vao_para_revisao(existente, novo):
+    nomes = indice(existente)
+    assert nomes.candidatos(normalizar_nome(novo), LIMIAR_SIMILARIDADE) == []
+    assert [i for i, _ in nomes.candidatos(normalizar_nome(novo), LIMIAR_CANDIDATAS)] == [1]
+
+
+def test_grafias_do_mesmo_nome_casam_automaticamente():
+    nomes = indice("Paranaguá", "Ureia granulada")
+    assert nomes.candidatos(normalizar_nome("Paranagua"), LIMIAR_SIMILARIDADE)[0][0] == 1
+    assert nomes.candidatos(normalizar_nome("Urea granular"), LIMIAR_SIMILARIDADE)[0][0] == 2
+
+
+def test_numeros_diferentes_nunca_casam():
+    assert indice("NPK 20-05-20").candidatos(normalizar_nome("NPK 20-00-20"), LIMIAR_CANDIDATAS) == []
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import feature_store
+from feature_store import atualizar_feature_store
+from previsao import criar_features_lote, CHAVES_SERIE, HISTORICO_FEATURES
+
+
+def series(n=30):
+    rng = np.random.default_rng(0)
+    linhas = []
+    for produto in ["Ureia", "MAP"]:
+        for destino_id in [1.0, np.nan]:
+            for data in pd.date_range("2024-01-01", periods=n):
+                linhas.append({
+                    "nome_produto": produto, "local_id": 1, "destino_id": destino_id, "data": data,
+                    "mes": data.month, "ano": data.year, "preco_min": rng.random() * 100,
+                    "valor_entregue": rng.random() * 100, "frete_final": 1.0, "usd_brl": 5.0, "custo_total": 0.0,
+                })
+    return pd.DataFrame(linhas)
+
+
+def ordenar(df):
+    return df.sort_values(CHAVES_SERIE + ["data"]).reset_index(drop=True)
+
+
+def test_store_recalcula_series_alteradas_e_remove_as_que_sumiram(tmp_path):
+    caminho = tmp_path / "feature_store.pkl"
+    df = series()
+    atualizar_feature_store(df, caminho)
+
+    # Preço retroativo no meio da série e uma série inteira excluída
+    df.loc[5, "valor_entregue"] = 1.0
+    df = df[~((df["nome_produto"] == "MAP") & df["destino_id"].isna())]
+    store = atualizar_feature_store(df, caminho)
+
+    esperado = ordenar(criar_features_lote(df))
+    pd.testing.assert_frame_equal(ordenar(store)[esperado.columns], esperado)
+
+
+def test_store_sem_mudancas_nao_recalcula(tmp_path, monkeypatch):
+    caminho = tmp_path / "feature_store.pkl"
+    df = series()
+    atualizar_feature_store(df, caminho)
+
+    def falhar(*args):
+        raise AssertionError("nenhuma série mudou")
+
+    monkeypatch.setattr(feature_store, "criar_features_lote", falhar)
+    assert len(atualizar_feature_store(df, caminho)) == len(df)
+
+
+def test_store_calcula_so_as_linhas_acrescidas_no_fim(tmp_path, monkeypatch):
+    caminho = tmp_path / "feature_store.pkl"
+    completo = series(60)
+    df = completo[completo["data"] < "2024-02-15"]
+    atualizar_feature_store(df, caminho)
+
+    linhas_calculadas = []
+
+    def contar(df_lote, chaves):
+        linhas_calculadas.append(len(df_lote))
+        return criar_features_lote(df_lote, chaves)
+
+    monkeypatch.setattr(feature_store, "criar_features_lote", contar)
+    # Linhas novas no fim das séries e uma edição retroativa em outra série
+    completo = completo.copy()
+    completo.loc[(completo["nome_produto"] == "MAP") & completo["destino_id"].isna(), "valor_entregue"] += 1.0
+    store = atualizar_feature_store(completo, caminho)
+
+    # Três séries acrescidas (15 linhas novas + contexto de cada) e uma recalculada por inteiro
+    assert sorted(linhas_calculadas) == [60, 3 * (15 + HISTORICO_FEATURES)]
+    esperado = ordenar(criar_features_lote(completo))
+    pd.testing.assert_frame_equal(ordenar(store)[esperado.columns], esperado)
@@ -0,0 +1,17 @@
+import numpy as np
+import pandas as pd
+from juncoes_asof import juntar_asof
+
+
+def test_juntar_asof_aceita_linhas_sem_data_e_preserva_ordem():
+    df = pd.DataFrame(
+        {"data": ["2024-01-05", None, "2024-01-02", "data inválida"], "local_id": [1, 1, 2, 1]},
+        index=[10, 20, 30, 40],
+    )
+    cambio = pd.DataFrame({"data": pd.to_datetime(["2024-01-01", "2024-01-04"]), "usd_brl": [5.0, 5.2]})
+
+    resultado = juntar_asof(df, cambio, ["usd_brl"])
+
+    assert list(resultado.index) == [10, 20, 30, 40]
+    assert list(resultado["local_id"]) == [1, 1, 2, 1]
+    np.testing.assert_array_equal(resultado["usd_brl"].to_numpy(), [5.2, np.nan, 5.0, np.nan])
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+from validacao import converter_numero, validar_secao
+
+
+def preco(preco_min, moeda="USD"):
+    return {
+        "produto": {"nome_produto": "Ureia"}, "local": {"nome": "Paranaguá"},
+        "data": "2024-03-01", "moeda": moeda, "preco_min": preco_min,
+    }
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("1,150.00", 1150.0),
+    ("1.150,00", 1150.0),
+    ("1,234", 1234.0),
+    ("450.5", 450.5),
+    ("450,5", 450.5),
+    ("US$ 1,234,567.89", 1234567.89),
+    ("1.234.567", 1234567.0),
+])
+def test_converter_numero_formatos(texto, esperado):
+    valores, convertidos = converter_numero(pd.Series([texto], dtype=object))
+    assert valores.iloc[0] == pytest.approx(esperado)
+    assert convertidos.iloc[0]
+
+
+@pytest.mark.parametrize("texto", ["1,2.3", "1.2,3.4", "1,23,4", "abc", ""])
+def test_converter_numero_ambiguo_vira_nan(texto):
+    valores, convertidos = converter_numero(pd.Series([texto], dtype=object))
+    assert pd.isna(valores.iloc[0])
+    assert not convertidos.iloc[0]
+
+
+def test_validar_secao_precos_formato_americano():
+    aceitos, metricas = validar_secao("precos", [preco("1,150.00"), preco("1.150,00", "BRL"), preco("1,234"), preco("450.5")])
+    assert [p["preco_min"] for p in aceitos] == [1150.0, 1150.0, 1234.0, 450.5]
+    assert metricas["rejeitadas"] == 0
+
+
+def test_validar_secao_rejeita_numero_ambiguo():
+    aceitos, metricas = validar_secao("precos", [preco("1,2.3"), preco(450)])
+    assert len(aceitos) == 1
+    assert metricas["motivos"] == {"precos: preco_min ausente ou inválido": 1}
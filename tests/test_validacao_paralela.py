@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import Pipeline
+from catalogo_modelos import ModeloNaive, ModeloETS
+from validacao_paralela import avaliar_fold
+
+
+def test_univariados_sao_avaliados_em_um_passo():
+    y = pd.Series(np.cumsum(np.random.default_rng(0).normal(size=60)) + 50)
+    X = pd.DataFrame({"x": np.zeros(len(y))})
+    train_idx, val_idx = np.arange(40), np.arange(40, 60)
+
+    _, fold = avaliar_fold("naive", Pipeline([("modelo", ModeloNaive())]), X, y, train_idx, val_idx, 1)
+    np.testing.assert_allclose(fold["residuos"], np.diff(y.to_numpy())[39:])
+
+    # O primeiro ponto da validação é exatamente a previsão de um passo do modelo ajustado no treino
+    ets = ModeloETS().fit(X.iloc[train_idx], y.iloc[train_idx])
+    _, fold = avaliar_fold("ets", Pipeline([("modelo", ModeloETS())]), X, y, train_idx, val_idx, 1)
+    np.testing.assert_allclose(fold["residuos"][0], y.iloc[40] - ets.prever_passos(1)[0])
+    assert len(fold["residuos"]) == len(val_idx)